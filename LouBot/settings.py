@@ -113,6 +113,62 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Number of AIML kernels per process, i.e. chat turns that can run concurrently
+AIML_KERNEL_POOL_SIZE = int(os.environ.get('AIML_KERNEL_POOL_SIZE', 4))
+
+# Entries in the AIML response cache shared by the pool (0 disables it)
+AIML_RESPONSE_CACHE_SIZE = int(os.environ.get('AIML_RESPONSE_CACHE_SIZE', 2048))
+
+# Seconds between checks for edited Data/*.aiml files to hot reload (0 disables the watcher)
+AIML_RELOAD_INTERVAL = int(os.environ.get('AIML_RELOAD_INTERVAL', 0))
+
+# Token expected in the X-Admin-Token header of the AIML admin endpoints
+# (reload_brain, aiml_profile, kernel_pool_status); unset only allows localhost
+AIML_ADMIN_TOKEN = os.environ.get('AIML_ADMIN_TOKEN', '')
+
+# Profile every kernel.respond() (matched category, <srai> depth, match vs evaluation time)
+AIML_PROFILE = os.environ.get('AIML_PROFILE', '') == '1'
+
+# Budget of one kernel.respond(): <srai> nesting, template elements evaluated and
+# wall-clock seconds (0 disables a limit). Over budget the chat answers with its fallback
+AIML_MAX_SRAI_DEPTH = int(os.environ.get('AIML_MAX_SRAI_DEPTH', 30))
+AIML_MAX_EVALUATIONS = int(os.environ.get('AIML_MAX_EVALUATIONS', 5000))
+AIML_RESPOND_TIMEOUT = float(os.environ.get('AIML_RESPOND_TIMEOUT', 2.0))
+
+# Cache of the Urdu <-> English translations of the chat: recent entries in
+# memory, backed by a local SQLite store with a row limit and a TTL in seconds
+TRANSLATION_CACHE_PATH = os.environ.get('TRANSLATION_CACHE_PATH', os.path.join(BASE_DIR, 'translation_cache.sqlite3'))
+TRANSLATION_CACHE_SIZE = int(os.environ.get('TRANSLATION_CACHE_SIZE', 1024))
+TRANSLATION_CACHE_MAX_ROWS = int(os.environ.get('TRANSLATION_CACHE_MAX_ROWS', 50000))
+TRANSLATION_CACHE_TTL = int(os.environ.get('TRANSLATION_CACHE_TTL', 30 * 86400))
+
+# Translation backend: 'google' (googletrans) or 'phrase_table' (offline, Memory/phrase_table.json).
+# Calls slower than TRANSLATION_DEADLINE seconds count as failures; after
+# TRANSLATION_BREAKER_FAILURES failures in a row the phrase table answers
+# for TRANSLATION_BREAKER_RESET seconds
+TRANSLATION_BACKEND = os.environ.get('TRANSLATION_BACKEND', 'google')
+TRANSLATION_DEADLINE = float(os.environ.get('TRANSLATION_DEADLINE', 3.0))
+TRANSLATION_BREAKER_FAILURES = int(os.environ.get('TRANSLATION_BREAKER_FAILURES', 3))
+TRANSLATION_BREAKER_RESET = float(os.environ.get('TRANSLATION_BREAKER_RESET', 30))
+
+# Entries in the LRU of VADER sentiment scores, keyed by text hash (0 disables it)
+SENTIMENT_CACHE_SIZE = int(os.environ.get('SENTIMENT_CACHE_SIZE', 4096))
+
+# Write-behind persistence of chat turns (Memory/history_writer.py): turns are queued
+# and written in batches by a background thread (HISTORY_WRITE_BEHIND=0 writes each
+# turn in the request). A request that waits more than HISTORY_ENQUEUE_TIMEOUT seconds
+# for room in a full queue is counted as backpressure and keeps waiting
+HISTORY_WRITE_BEHIND = os.environ.get('HISTORY_WRITE_BEHIND', '1') == '1'
+HISTORY_QUEUE_SIZE = int(os.environ.get('HISTORY_QUEUE_SIZE', 10000))
+HISTORY_BATCH_SIZE = int(os.environ.get('HISTORY_BATCH_SIZE', 200))
+HISTORY_FLUSH_LINGER = float(os.environ.get('HISTORY_FLUSH_LINGER', 0.05))
+HISTORY_ENQUEUE_TIMEOUT = float(os.environ.get('HISTORY_ENQUEUE_TIMEOUT', 0.1))
+
+# Logged-in Signups nodes kept per process (Memory/user_cache.py) for USER_CACHE_TTL
+# seconds; a change in another worker shows up here once the entry expires (0 disables it)
+USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', 30))
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 1024))
+
 # CHATBOT_CACHE_TIMEOUT = 60 * 10
 # CACHE_KEY_PREFIX = 'Neo4j'
 
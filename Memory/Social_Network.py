@@ -12,13 +12,15 @@ def search_ip(request,email):
         main_user = Signups.nodes.get(email=email)
         first_ip = main_user.ip
         first_mail_1 = main_user.email
-        search = Signups.nodes.exclude(email=email)
+        if not first_ip:
+            return response
+        # only the users sharing the ip, through the Signups.ip index (see Memory/schema.py)
+        search = Signups.nodes.filter(ip=first_ip).exclude(email=email)
         for user in search:
-            if user.ip == first_ip:
-                temp = user.username
-                if check_befor_asking(request,first_mail_1,temp):
-                    response = f'Do you know {temp}?'
-                    break
+            temp = user.username
+            if check_befor_asking(request,first_mail_1,temp):
+                response = f'Do you know {temp}?'
+                break
         return response
 
     except Signups.DoesNotExist:
@@ -35,14 +37,12 @@ def get_after_know(s):
         return ""
 
 def get_last_bot_response(session_history_data):
-    bot_responses = [chat_message for chat_message in session_history_data.memory_list if chat_message.split(" - ")[1].startswith("Bot:")]
-    last_two_bot_responses = bot_responses[-2:]
-    print(last_two_bot_responses)
-
-    second_last_response = last_two_bot_responses[1] if last_two_bot_responses else None
+    """Name asked about in the last recorded bot reply ("Do you know <name>?"), or "" if there is none."""
+    last_two_bot_responses = session_history_data.last_messages(2, message_type="Bot")
+    if not last_two_bot_responses:
+        return ""
 
-    te = second_last_response.split(" - ")[1]
-    refine = te.split(": ")[-1]
+    refine = last_two_bot_responses[-1].content
     refined = get_after_know(refine)
 
     return refined
@@ -62,7 +62,6 @@ def check_befor_asking(request,mail,name2):
 
     try:
         results, meta = db.cypher_query(cypher_query, params)
-        print('Length of Result',len(results))
     except Exception as e:
         print(e)
 
@@ -1,18 +1,506 @@
 import os
+import gc
+import json
+import time
+import pickle
+import hashlib
+import sys
 import aiml
+import xml.sax
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from aiml.AimlParser import create_parser
 from LouBot.settings import BASE_DIR
+from .pattern_index import IndexedPatternMgr
+from .respond_budget import RespondBudgetExceeded
 
 aiml_directory = os.path.join(BASE_DIR, 'Data')
+brain_directory = os.path.join(BASE_DIR, 'Brain')
+brain_snapshot = os.path.join(brain_directory, 'brain.pkl')
+brain_manifest = os.path.join(brain_directory, 'manifest.json')
+brain_categories = os.path.join(brain_directory, 'categories.pkl')
 kernel = aiml.Kernel()
 
-def init_kernel():
-    kernel = aiml.Kernel()
-    for file_name in os.listdir(aiml_directory):
-        if file_name.endswith('.aiml'):
-            file_path = os.path.join(aiml_directory, file_name)
-            kernel.learn(file_path)
-
-    kernel.setBotPredicate("name", "Anns Ijaz")
-    kernel.setBotPredicate("master", "Anns Ijaz")       # shows up in replies
-    kernel.setBotPredicate("botmaster", "Anns Ijaz")
-    return kernel
\ No newline at end of file
+# Bump when the pickled snapshot layout changes so old snapshots are rebuilt
+SNAPSHOT_FORMAT = 3
+
+# Processes used to parse Data/*.aiml when the brain is relearned (1 = serial)
+LOAD_WORKERS = int(os.environ.get('AIML_LOAD_WORKERS', min(8, os.cpu_count() or 1)))
+
+BOT_PREDICATES = {
+    "name": "Anns Ijaz",
+    "master": "Anns Ijaz",       # shows up in replies
+    "botmaster": "Anns Ijaz",
+}
+
+
+def aiml_files():
+    """Return the corpus files in the order they are learned."""
+    return [os.path.join(aiml_directory, file_name)
+            for file_name in sorted(os.listdir(aiml_directory))
+            if file_name.endswith('.aiml')]
+
+
+def file_digest(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def corpus_fingerprint():
+    """
+    Hash every Data/*.aiml file together with the bot predicates.
+    Returns (fingerprint, {file_name: digest}).
+    """
+    files = {os.path.basename(path): file_digest(path) for path in aiml_files()}
+    overall = hashlib.sha256(f"format:{SNAPSHOT_FORMAT}\n".encode())
+    for file_name, digest in files.items():
+        overall.update(f"{file_name}:{digest}\n".encode())
+    overall.update(json.dumps(BOT_PREDICATES, sort_keys=True).encode())
+    return overall.hexdigest(), files
+
+
+def read_manifest():
+    try:
+        with open(brain_manifest) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_snapshot(kernel, fingerprint, files, load_report=None):
+    """Write the learned brain and its manifest atomically."""
+    os.makedirs(brain_directory, exist_ok=True)
+    brain = kernel._brain
+    tmp_path = f"{brain_snapshot}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump((brain._templateCount, brain._botName, brain.build_index()), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, brain_snapshot)
+
+    manifest = {
+        'fingerprint': fingerprint,
+        'files': files,
+        'categories': kernel.numCategories(),
+        'built_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'load_report': load_report or [],
+    }
+    tmp_path = f"{brain_manifest}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, brain_manifest)
+
+
+@contextmanager
+def gc_paused():
+    """
+    Pause the cyclic GC while the brain's millions of small objects are
+    created, otherwise its collections dominate the load time.
+    """
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+
+def load_snapshot(kernel):
+    """Restore a pickled pattern index into kernel."""
+    with gc_paused():
+        with open(brain_snapshot, 'rb') as f:
+            template_count, bot_name, index = pickle.load(f)
+    kernel._brain = IndexedPatternMgr.from_index(index, template_count, bot_name)
+
+
+class DeferredResponse:
+    """
+    Result of LouKernel.respond_deferred(): the response text with a marker
+    wherever the template read a deferred slot predicate. bind() fills the
+    markers in (and in the kernel's <that> history), so a value computed
+    after the match needs no second kernel.respond().
+
+    bind() may run in a later checkout of the same session (see
+    KernelPool.session()): set kernel to the kernel checked out then.
+    """
+
+    def __init__(self, kernel, input_, text, markers, read_slots, sessionID):
+        self.kernel = kernel
+        self.input = input_
+        self.text = text
+        self.markers = markers
+        self.sessionID = sessionID
+        # slots whose marker was transformed away (e.g. used inside <srai>)
+        self.lost_slots = {slot for slot in read_slots if markers[slot] not in text}
+
+        history = kernel.getPredicate(kernel._outputHistory, sessionID)
+        self._history = [(i, entry) for i, entry in enumerate(history) if self._has_marker(entry)]
+        self._predicates = [(name, value) for name, value in kernel._sessions[sessionID].items()
+                            if isinstance(value, str) and self._has_marker(value)]
+
+    def _has_marker(self, text):
+        return any(marker in text for marker in self.markers.values())
+
+    def _fill(self, text, values):
+        for slot, marker in self.markers.items():
+            text = text.replace(marker, values.get(slot, ""))
+        return text
+
+    def bind(self, **values):
+        """Return the response with the slot values filled in."""
+        kernel, sessionID = self.kernel, self.sessionID
+        if any(values.get(slot) for slot in self.lost_slots):
+            # fall back to a second pass with the slots set as predicates
+            for slot, value in values.items():
+                kernel.setPredicate(slot, value, sessionID)
+            text = kernel.respond(self.input, sessionID)
+            for slot in values:
+                kernel.setPredicate(slot, "", sessionID)
+            return text
+
+        history = kernel.getPredicate(kernel._outputHistory, sessionID)
+        for i, entry in self._history:
+            if i < len(history):
+                history[i] = self._fill(entry, values)
+        for name, value in self._predicates:
+            kernel.setPredicate(name, self._fill(value, values), sessionID)
+        return self._fill(self.text, values)
+
+
+class LouKernel(aiml.Kernel):
+    """
+    aiml.Kernel with an optional ResponseCache in front of top-level
+    matches. On a cache miss the template evaluation is traced to learn
+    which predicates it read and whether its output may be cached.
+
+    respond_deferred() renders chosen predicates as markers that are bound
+    after the match, see DeferredResponse.
+
+    changed_predicates() reports the predicates the last respond() set
+    through <set>, for dispatching actions (see Memory/predicate_actions.py).
+
+    With a MatchProfiler attached (_profiler) respond() calls are profiled,
+    see Memory/match_profiler.py.
+
+    With a RespondBudget attached (_budget) respond() raises
+    RespondBudgetExceeded once an input runs past its <srai> depth,
+    template evaluation or time limit, see Memory/respond_budget.py.
+    """
+
+    # Elements whose output is not a pure function of the input, the
+    # <that>/topic context and the predicates read
+    UNCACHEABLE_ELEMENTS = frozenset([
+        'date', 'gossip', 'input', 'javascript', 'learn', 'random',
+        'set', 'system', 'that', 'thatstar', 'topicstar',
+    ])
+
+    def __init__(self):
+        super().__init__()
+        self._response_cache = None
+        self._trace = None
+        self._deferred = None
+        self._deferred_read = set()
+        self._changed = {}
+        self._profiler = None
+        self._match_probe = None
+        self._budget = None
+        self._deadline = None
+        self._evaluations = 0
+
+    def _normalized(self, text):
+        text = self._subbers['normal'].sub(text)
+        return ' '.join(self._brain._puncStripRE.sub(' ', text.upper()).split())
+
+    def _cache_keys(self, input_, sessionID):
+        outputHistory = self.getPredicate(self._outputHistory, sessionID)
+        corpus = getattr(self._brain, 'corpus', None)
+        # the corpus fingerprint keeps responses of a replaced brain from being served
+        context = (self._normalized(outputHistory[-1] if outputHistory else ""),
+                   self._normalized(self.getPredicate("topic", sessionID)),
+                   corpus[0] if corpus else None)
+        exact_input = ' '.join(self._subbers['normal'].sub(input_).split())
+        # Templates that never use <star/> are shared by every spelling of the input
+        return (('match', self._normalized(input_)) + context,
+                ('exact', exact_input) + context)
+
+    def _predicate_value(self, name, sessionID):
+        if self._deferred is not None and name in self._deferred:
+            return self._deferred[name]
+        return super().getPredicate(name, sessionID)
+
+    def getPredicate(self, name, sessionID=aiml.Kernel._globalSessionID):
+        value = self._predicate_value(name, sessionID)
+        if self._deferred is not None and name in self._deferred:
+            self._deferred_read.add(name)
+            if self._trace is not None:
+                self._trace['cacheable'] = False
+        if self._trace is not None and not name.startswith('_') and name != "topic":
+            self._trace['depends'].setdefault(name, value)
+        return value
+
+    def _check_deadline(self):
+        if self._deadline is not None and time.monotonic() > self._deadline:
+            raise RespondBudgetExceeded('timeout')
+
+    def _processElement(self, elem, sessionID):
+        budget = self._budget
+        if budget is not None:
+            self._evaluations += 1
+            if budget.max_evaluations and self._evaluations > budget.max_evaluations:
+                raise RespondBudgetExceeded('evaluations')
+            self._check_deadline()
+        if self._trace is not None:
+            if elem[0] in self.UNCACHEABLE_ELEMENTS:
+                self._trace['cacheable'] = False
+            elif elem[0] == 'star':
+                self._trace['uses_input'] = True
+        return super()._processElement(elem, sessionID)
+
+    def _processSet(self, elem, sessionID):
+        value = super()._processSet(elem, sessionID)
+        self._changed[elem[1]['name']] = value
+        return value
+
+    def respond(self, input_, sessionID=aiml.Kernel._globalSessionID):
+        self._changed = {}
+        budget = self._budget
+        if budget is None:
+            return self._respond_profiled(input_, sessionID)
+
+        self._deadline, self._evaluations = budget.deadline(), 0
+        try:
+            response = self._respond_profiled(input_, sessionID)
+        except RespondBudgetExceeded as e:
+            # the abandoned <srai> chain left its inputs on the stack
+            self.setPredicate(self._inputStack, [], sessionID)
+            budget.record(e.limit, input_)
+            raise
+        finally:
+            self._deadline = None
+        budget.record()
+        return response
+
+    def _respond_profiled(self, input_, sessionID):
+        profiler = self._profiler
+        if profiler is not None and profiler.enabled and self._match_probe is None:
+            return profiler.profile(self, super().respond, input_, sessionID)
+        return super().respond(input_, sessionID)
+
+    def changed_predicates(self):
+        """Return {name: value} of the predicates set by the last respond()."""
+        return dict(self._changed)
+
+    def _respond(self, input_, sessionID):
+        inputStack = self.getPredicate(self._inputStack, sessionID)
+        budget = self._budget
+        if budget is not None:
+            if budget.max_srai_depth and len(inputStack) >= budget.max_srai_depth:
+                raise RespondBudgetExceeded('srai_depth')
+            self._check_deadline()
+        if self._match_probe is not None:
+            # each _respond() matches before it evaluates nested <srai>s
+            self._match_probe.enter(len(inputStack))
+
+        cache = self._response_cache
+        if cache is None or not cache.enabled or inputStack:
+            # no cache, or a nested <srai>/<sr> call inside a traced response
+            return super()._respond(input_, sessionID)
+
+        keys = self._cache_keys(input_, sessionID)
+        response = cache.lookup(keys, lambda name: self._predicate_value(name, sessionID))
+        if response is not None:
+            return response
+
+        self._trace = {'depends': {}, 'cacheable': True, 'uses_input': False}
+        try:
+            response = super()._respond(input_, sessionID)
+            trace = self._trace
+        finally:
+            self._trace = None
+
+        if trace['cacheable'] and '{{' not in response:
+            cache.store(keys[1] if trace['uses_input'] else keys[0], trace['depends'], response)
+        else:
+            cache.reject()
+        return response
+
+    def respond_deferred(self, input_, slots=(), sessionID=aiml.Kernel._globalSessionID):
+        """
+        Respond to input_ with the predicates named in slots left unbound:
+
+            deferred = kernel.respond_deferred(message, slots=('namey',))
+            ...look the value up...
+            bot_response = deferred.bind(namey=value)
+        """
+        markers = {slot: "\ue000%d\ue001" % i for i, slot in enumerate(slots)}
+        self._deferred, self._deferred_read = markers, set()
+        try:
+            text = self.respond(input_, sessionID)
+            read_slots = self._deferred_read
+        finally:
+            self._deferred, self._deferred_read = None, set()
+        return DeferredResponse(self, input_, text, markers, read_slots, sessionID)
+
+
+def new_kernel():
+    kernel = LouKernel()
+    kernel._brain = IndexedPatternMgr()
+    return kernel
+
+
+def parse_aiml_file(file_path):
+    """
+    Parse one AIML file into its categories, in the order the file
+    defines them. Runs in the loader's worker processes.
+    Returns (file_name, [(key, template), ...], seconds, error).
+    """
+    start = time.time()
+    parser = create_parser()
+    handler = parser.getContentHandler()
+    handler.setEncoding("utf-8")
+    try:
+        parser.parse(file_path)
+    except xml.sax.SAXParseException as e:
+        return os.path.basename(file_path), [], time.time() - start, str(e)
+    return os.path.basename(file_path), list(handler.categories.items()), time.time() - start, None
+
+
+def parse_corpus(files, workers=None):
+    """Parse files across a process pool; results come back in the order of files."""
+    workers = LOAD_WORKERS if workers is None else workers
+    if workers > 1 and len(files) > 1:
+        try:
+            # workers only build objects, so they run without the cyclic GC (see gc_paused())
+            with ProcessPoolExecutor(max_workers=min(workers, len(files)), initializer=gc.disable) as pool:
+                return list(pool.map(parse_aiml_file, files))
+        except (OSError, RuntimeError) as e:
+            print(f"Parallel AIML parsing unavailable, parsing serially: {e}")
+    return [parse_aiml_file(file_path) for file_path in files]
+
+
+def save_category_table(table):
+    """Write the per-file category table used by incremental rebuilds."""
+    os.makedirs(brain_directory, exist_ok=True)
+    tmp_path = f"{brain_categories}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(table, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, brain_categories)
+
+
+def load_category_table():
+    try:
+        with gc_paused(), open(brain_categories, 'rb') as f:
+            return pickle.load(f)
+    except Exception:
+        return None
+
+
+def learn_corpus(kernel, files, workers=None, table=None):
+    """
+    Learn the corpus files ({file_name: digest}, in file order) into kernel.
+
+    table is the per-file category table of an earlier build
+    ({file_name: {'digest', 'categories', 'parse_seconds'}}). Files whose
+    digest still matches are taken from it, only the others are parsed,
+    in parallel. Categories are merged in file order, so a category
+    defined in several files keeps the template of the last one, as with
+    kernel.learn(). Returns (load_report, category_table).
+    """
+    table = dict(table or {})
+    stale = [file_name for file_name, digest in files.items()
+             if table.get(file_name, {}).get('digest') != digest]
+    report = []
+    with gc_paused():
+        paths = [os.path.join(aiml_directory, file_name) for file_name in stale]
+        for file_name, categories, seconds, error in parse_corpus(paths, workers):
+            if error:
+                sys.stderr.write(f"\nFATAL PARSE ERROR in file {file_name}:\n{error}\n")
+            table[file_name] = {
+                'digest': files[file_name],
+                'categories': categories,
+                'parse_seconds': round(seconds, 4),
+            }
+
+        for file_name in files:
+            entry = table[file_name]
+            start = time.time()
+            for key, template in entry['categories']:
+                kernel._brain.add(key, template)
+            report.append({
+                'file': file_name,
+                'categories': len(entry['categories']),
+                'parse_seconds': entry['parse_seconds'],
+                'merge_seconds': round(time.time() - start, 4),
+                'reparsed': file_name in stale,
+            })
+    return report, {file_name: table[file_name] for file_name in files}
+
+
+def set_bot_predicates(kernel):
+    for name, value in BOT_PREDICATES.items():
+        kernel.setBotPredicate(name, value)
+
+
+def build_brain(force=False, workers=None):
+    """
+    Return a kernel with the whole corpus learned, using the on-disk
+    snapshot when its fingerprint still matches Data/ and rebuilding it
+    otherwise. A rebuild only parses the files that changed since the
+    last one, unless force is set. Returns (kernel, rebuilt).
+    """
+    kernel = new_kernel()
+    fingerprint, files = corpus_fingerprint()
+    manifest = read_manifest()
+
+    if not force and manifest and manifest.get('fingerprint') == fingerprint:
+        try:
+            start = time.time()
+            load_snapshot(kernel)
+            set_bot_predicates(kernel)
+            kernel._brain.corpus = (fingerprint, files)
+            print("Loaded AIML brain snapshot (%d categories in %.2f seconds)" % (kernel.numCategories(), time.time() - start))
+            return kernel, False
+        except Exception as e:
+            print(f"AIML brain snapshot unusable, relearning: {e}")
+            kernel = new_kernel()
+
+    start = time.time()
+    load_report, table = learn_corpus(kernel, files, workers, None if force else load_category_table())
+    set_bot_predicates(kernel)
+    with gc_paused():
+        kernel._brain.build_index()
+    kernel._brain.corpus = (fingerprint, files)
+    print("Learned AIML corpus (%d categories, %d files parsed, in %.2f seconds)" % (
+        kernel.numCategories(), sum(row['reparsed'] for row in load_report), time.time() - start))
+    try:
+        save_snapshot(kernel, fingerprint, files, load_report)
+        save_category_table(table)
+    except OSError as e:
+        print(f"Could not write AIML brain snapshot: {e}")
+    return kernel, True
+
+
+def reload_brain(brain, workers=None):
+    """
+    Build a shadow brain for the current Data/ corpus while brain keeps
+    serving. Returns (new_brain, changed_files), new_brain is None when
+    brain is already up to date.
+    """
+    fingerprint, files = corpus_fingerprint()
+    served_fingerprint, served_files = brain.corpus or (None, {})
+    if fingerprint == served_fingerprint:
+        return None, []
+    changed = sorted(file_name for file_name in set(files) | set(served_files)
+                     if files.get(file_name) != served_files.get(file_name))
+    kernel, rebuilt = build_brain(workers=workers)
+    return kernel._brain, changed
+
+
+def init_kernel(response_cache=None, profiler=None, budget=None):
+    kernel, rebuilt = build_brain()
+    kernel._response_cache = response_cache
+    kernel._profiler = profiler
+    kernel._budget = budget
+    return kernel
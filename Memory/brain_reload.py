@@ -0,0 +1,104 @@
+"""
+AIML Brain Hot Reload
+=====================
+
+Picks up edits to Data/*.aiml without restarting the server.
+
+BrainReloader.reload() compares the corpus with the one the served brain
+was learned from. When files changed, a shadow brain is built next to the
+serving one (only the changed files are parsed again, the rest come from
+the category table in Brain/, see Memory/aiml.py) and swapped into the
+kernel pool in one step. Requests keep being answered from the old brain
+until the swap, and the response cache is cleared afterwards.
+
+Reloads run from a polling daemon thread (AIML_RELOAD_INTERVAL seconds,
+0 disables it) or on demand from the reload_brain endpoint, inside a
+process that is already serving on several threads. Forking a parser
+pool there could hand the children locks held by other threads, so the
+changed files are parsed in-process (workers=1).
+"""
+
+import os
+import threading
+import time
+
+from .aiml import aiml_files, reload_brain
+
+
+class BrainReloader:
+    """Rebuilds the brain of a KernelPool when the AIML corpus changes."""
+
+    def __init__(self, pool, response_cache=None, workers=1):
+        self.pool = pool
+        self.response_cache = response_cache
+        self.workers = workers
+        self._reload_lock = threading.Lock()
+        self._stat_signature = self._corpus_stat()
+        self._thread = None
+        self.reloads = 0
+        self.last_reload = None
+
+    def _corpus_stat(self):
+        signature = []
+        for file_path in aiml_files():
+            try:
+                st = os.stat(file_path)
+            except OSError:
+                continue
+            signature.append((file_path, st.st_mtime_ns, st.st_size))
+        return tuple(signature)
+
+    def reload(self):
+        """
+        Swap in a brain for the current corpus if it changed.
+        Returns a summary dict of what was done.
+        """
+        with self._reload_lock:
+            start = time.time()
+            self._stat_signature = self._corpus_stat()
+            brain, changed = reload_brain(self.pool.brain, workers=self.workers)
+            if brain is None:
+                return {'reloaded': False, 'changed_files': []}
+
+            self.pool.swap_brain(brain)
+            if self.response_cache is not None:
+                self.response_cache.clear()
+            self.reloads += 1
+            self.last_reload = {
+                'reloaded': True,
+                'changed_files': changed,
+                'categories': brain.numTemplates(),
+                'seconds': round(time.time() - start, 3),
+                'at': time.strftime('%Y-%m-%d %H:%M:%S'),
+            }
+            print(f"Reloaded AIML brain ({', '.join(changed)}) in {self.last_reload['seconds']:.2f} seconds")
+            return self.last_reload
+
+    def poll(self):
+        """Reload only if a corpus file's mtime or size changed since the last check."""
+        if self._corpus_stat() != self._stat_signature:
+            return self.reload()
+        return None
+
+    def _watch(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"AIML brain reload failed: {e}")
+
+    def start_watcher(self, interval):
+        """Start the polling daemon thread (once per process, threads do not survive fork())."""
+        if interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._thread = threading.Thread(target=self._watch, args=(interval,), name='aiml-reload', daemon=True)
+        self._thread.start()
+
+    def stats(self):
+        return {
+            'watching': self._thread is not None and self._thread.is_alive(),
+            'reloads': self.reloads,
+            'last_reload': self.last_reload,
+            'corpus_fingerprint': (self.pool.brain.corpus or (None,))[0],
+        }
@@ -0,0 +1,258 @@
+"""
+AIML Corpus Analyzer
+====================
+
+Static analysis of the Data/*.aiml corpus (`python manage.py analyze_corpus`):
+
+    - duplicate categories: the same pattern/that/topic defined in several
+      files with the same template
+    - shadowed categories: the same pattern/that/topic defined in several
+      files with different templates; the file learned last wins
+    - unreachable categories: categories no normalized input can match,
+      either because another category always matches first or because the
+      pattern holds lower-case or punctuated words (or the multi-word bot
+      name) that PatternMgr never sees in an input
+    - dangling <srai> targets: redirections that match nothing, or only the
+      catch-all "*" category
+
+Reachability is checked by matching each category's own pattern, with
+its wildcards filled by words that occur in no pattern, against a brain
+learned from the corpus. pruned() keeps only the definition of each
+category that the brain is learned from, and write_corpus() writes it
+back as AIML files that learn to the same brain.
+"""
+
+import os
+from xml.sax.saxutils import escape, quoteattr
+
+from .aiml import gc_paused
+from .pattern_index import IndexedPatternMgr
+
+# Out-of-vocabulary wildcard fillers, one word and several words
+FILLERS = ('QZXFILLER', 'QZXFILLER QZXFILLER QZXFILLER')
+
+WILDCARDS = ('_', '*')
+
+CATCH_ALL = ('*', '*', '*')
+
+
+def normalize_key(key):
+    """PatternMgr.add() splits each part on whitespace, so these keys share a node."""
+    return tuple(' '.join(part.split()) for part in key)
+
+
+def format_key(key):
+    pattern, that, topic = key
+    text = pattern
+    if that != '*':
+        text += f" <that> {that}"
+    if topic != '*':
+        text += f" <topic> {topic}"
+    return text
+
+
+def srai_targets(element):
+    """
+    Yield (target, dynamic) for every <srai> in a template element list.
+    Parts computed at runtime (<star/>, <get/>, ...) are filled with a
+    filler word and make the target dynamic.
+    """
+    for child in element[2:]:
+        if child[0] == 'text':
+            continue
+        if child[0] == 'srai':
+            words, dynamic = [], False
+            for part in child[2:]:
+                if part[0] == 'text':
+                    words.append(part[2])
+                else:
+                    words.append(f" {FILLERS[0]} ")
+                    dynamic = True
+            yield ' '.join(''.join(words).split()), dynamic
+        yield from srai_targets(child)
+
+
+class CorpusAnalyzer:
+    """
+    parsed is [(file_name, [(key, template), ...]), ...] in the order the
+    files are learned (see Memory.aiml.parse_corpus()).
+    """
+
+    def __init__(self, parsed, bot_name):
+        self.parsed = parsed
+        # normalized key -> [(file_name, template), ...] in learn order
+        self.definitions = {}
+        for file_name, categories in parsed:
+            for key, template in categories:
+                self.definitions.setdefault(normalize_key(key), []).append((file_name, template))
+
+        self.brain = IndexedPatternMgr()
+        self.brain.setBotName(bot_name)
+        with gc_paused():
+            for key, definitions in self.definitions.items():
+                self.brain.add(key, definitions[-1][1])
+            self.index = self.brain.build_index()
+            self.keys = self.index.category_keys()
+        self.nodes = {key: node for node, key in self.keys.items()}
+        self._unreachable = None
+
+    def __len__(self):
+        return len(self.definitions)
+
+    def redefinitions(self):
+        """
+        Return (duplicates, shadowed): [(key, [earlier files], winning file)]
+        for categories defined more than once with the same template and
+        with different templates.
+        """
+        duplicates, shadowed = [], []
+        for key, definitions in self.definitions.items():
+            if len(definitions) < 2:
+                continue
+            winner, template = definitions[-1]
+            earlier = [file_name for file_name, _ in definitions[:-1]]
+            if all(other == template for _, other in definitions[:-1]):
+                duplicates.append((key, earlier, winner))
+            else:
+                shadowed.append((key, earlier, winner))
+        return duplicates, shadowed
+
+    def _probe(self, key, filler):
+        pattern, that, topic = key
+        words = [filler if word in WILDCARDS else word for word in pattern.split()]
+        words = [self.brain._botName if word == 'BOT_NAME' else word for word in words]
+        # BOT_NAME only stands for the bot's name in the pattern itself
+        that = ' '.join(filler if word in WILDCARDS else word for word in that.split())
+        topic = ' '.join(filler if word in WILDCARDS else word for word in topic.split())
+        return self.brain.match_node(' '.join(words), that, topic)[1]
+
+    def _unreachable_reason(self, key, matched):
+        for word in ' '.join(key).split():
+            if word not in WILDCARDS and word != 'BOT_NAME' and self.brain._puncStripRE.sub(' ', word.upper()) != word:
+                return f"{word!r} never appears in a normalized input"
+        if 'BOT_NAME' in key[0].split() and len(self.brain._botName.split()) > 1:
+            return f"bot name {self.brain._botName!r} is not a single word"
+        if matched is None:
+            return "matches nothing"
+        return f"always matched by {format_key(self.keys[matched])!r}"
+
+    def unreachable(self):
+        """Return {key: reason} for the categories no input can match."""
+        if self._unreachable is None:
+            self._unreachable = {}
+            for key, node in self.nodes.items():
+                matched = None
+                for filler in FILLERS:
+                    matched = self._probe(key, filler)
+                    if matched == node:
+                        break
+                else:
+                    self._unreachable[key] = self._unreachable_reason(key, matched)
+        return self._unreachable
+
+    def dangling_srai(self):
+        """
+        Return [(target, dynamic, outcome, [referring keys])] for <srai>
+        targets that match nothing or fall through to the catch-all. A
+        target is matched under the topic of the category it comes from.
+        """
+        referrers = {}
+        for key, definitions in self.definitions.items():
+            topic = '' if key[2] == '*' else ' '.join(FILLERS[0] if word in WILDCARDS else word for word in key[2].split())
+            for target, dynamic in srai_targets(definitions[-1][1]):
+                if target and set(target.split()) != {FILLERS[0]}:
+                    referrers.setdefault((target, dynamic, topic), []).append(key)
+
+        dangling = []
+        for (target, dynamic, topic), keys in referrers.items():
+            template, node = self.brain.match_node(target, '', topic)
+            if node is None:
+                outcome = "matches nothing"
+            elif normalize_key(self.keys[node]) == CATCH_ALL:
+                outcome = "only matches the catch-all *"
+            else:
+                continue
+            dangling.append((target, dynamic, outcome, keys))
+        return dangling
+
+    def source(self, key):
+        """File the brain learns key from."""
+        return self.definitions[key][-1][0]
+
+    def pruned(self, drop_unreachable=False):
+        """
+        Return [(file_name, [(key, template), ...])] with every category
+        only in the file it is learned from, in the original order.
+        """
+        unreachable = self.unreachable() if drop_unreachable else {}
+        pruned = []
+        for file_name, categories in self.parsed:
+            kept = []
+            for key, template in categories:
+                key = normalize_key(key)
+                winner, winning_template = self.definitions[key][-1]
+                if winner == file_name and winning_template is template and key not in unreachable:
+                    kept.append((key, template))
+            pruned.append((file_name, kept))
+        return pruned
+
+
+def _pattern_xml(text, bot_tag):
+    return ' '.join('<bot name="name"/>' if word == 'BOT_NAME' and bot_tag else escape(word)
+                    for word in text.split())
+
+
+def element_xml(element, inherited='default'):
+    """Serialize a parsed template element list back to AIML."""
+    name, attrs, children = element[0], dict(element[1]), element[2:]
+    spaces = [child[1]['xml:space'] for child in children if child[0] == 'text']
+    space = attrs.get('xml:space', spaces[0] if spaces else inherited)
+    if space != inherited:
+        attrs['xml:space'] = space
+
+    opening = name + ''.join(f" {attr}={quoteattr(value)}" for attr, value in attrs.items())
+    if not children:
+        return f"<{opening}/>"
+    body = ''.join(escape(child[2]) if child[0] == 'text' else element_xml(child, space) for child in children)
+    return f"<{opening}>{body}</{name}>"
+
+
+def category_xml(key, template):
+    pattern, that, _ = key
+    parts = ['<category>', f"<pattern>{_pattern_xml(pattern, True)}</pattern>"]
+    if that != '*':
+        parts.append(f"<that>{_pattern_xml(that, False)}</that>")
+    parts.append(element_xml(template))
+    parts.append('</category>')
+    return ''.join(parts)
+
+
+def write_aiml(path, categories):
+    """Write [(key, template), ...] as one AIML file, grouping <topic> runs."""
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>', '<aiml version="1.0">']
+    topic = '*'
+    for key, template in categories:
+        if key[2] != topic:
+            if topic != '*':
+                lines.append('</topic>')
+            if key[2] != '*':
+                lines.append(f"<topic name={quoteattr(key[2])}>")
+            topic = key[2]
+        lines.append(category_xml(key, template))
+    if topic != '*':
+        lines.append('</topic>')
+    lines.append('</aiml>')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def write_corpus(directory, pruned):
+    """Write the pruned corpus to directory; files left empty are skipped. Returns the paths written."""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for file_name, categories in pruned:
+        if categories:
+            path = os.path.join(directory, file_name)
+            write_aiml(path, categories)
+            paths.append(path)
+    return paths
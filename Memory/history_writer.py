@@ -0,0 +1,314 @@
+"""
+Write-behind Chat History
+=========================
+
+Takes the persistence of a chat turn (the day's transcript, its running
+sentiment sums and the two Episode_Parts, see maintain_history() and
+extend_episode() in Memory/views.py) off the request path.
+
+The request only enqueues a small turn record. A daemon thread takes
+batches off the queue, scores them in one score_many() call and writes
+each batch with a single UNWIND statement, grouped by day's session so
+every session is locked and numbered once per batch.
+
+    - the queue is bounded (HISTORY_QUEUE_SIZE); a request that finds it
+      full for HISTORY_ENQUEUE_TIMEOUT seconds is counted as backpressure
+      and keeps waiting for room, so a slow database slows the chat down
+      instead of losing turns or writing them out of order
+    - a failed batch is retried, then dropped and reported
+    - the queue is flushed at interpreter exit (atexit), e.g. when a
+      gunicorn worker shuts down
+    - code that reads a user's history back (read-your-writes) calls
+      flush(uid) first, which waits for that user's queued turns only
+
+A session written before the running sums or the Chat_Message transcript
+(see Memory/models.py) is brought up to date once, through the models,
+before its first batch.
+"""
+
+import atexit
+import os
+import queue
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from neomodel import db
+from .models import Session_History
+from .repository import episode_name
+from .sentiment import NEGATIVE_THRESHOLD, POSITIVE_THRESHOLD, sentiment_label, sentiment_service
+
+# Attempts at writing one batch before it is dropped
+MAX_ATTEMPTS = 3
+
+WRITE_TURNS = """
+UNWIND $sessions AS row
+MERGE (h:History_Chat {uid: row.uid})
+  ON CREATE SET h.name = 'History', h.created_at = row.now
+MERGE (s:Session_History {uid: row.uid, name: row.name})
+  ON CREATE SET s.start_session = row.now, s.message_count = 0
+MERGE (h)-[:HAS]->(s)
+SET s.message_count = coalesce(s.message_count, 0)
+WITH row, h, s, s.message_count AS base
+SET s.message_count = base + size(row.messages),
+    s.sentiment_compound = coalesce(s.sentiment_compound, 0.0) + row.compound,
+    s.sentiment_positive = coalesce(s.sentiment_positive, 0.0) + row.positive,
+    s.sentiment_negative = coalesce(s.sentiment_negative, 0.0) + row.negative,
+    s.sentiment_neutral = coalesce(s.sentiment_neutral, 0.0) + row.neutral,
+    s.sentiment_count = coalesce(s.sentiment_count, 0) + size(row.messages)
+SET s.overall_sentiments = CASE
+    WHEN s.sentiment_compound / s.sentiment_count >= $positive THEN 'Positive sentiments'
+    WHEN s.sentiment_compound / s.sentiment_count <= $negative THEN 'Negative sentiments'
+    ELSE 'Neutral sentiments' END
+FOREACH (i IN range(0, size(row.messages) - 1) |
+    CREATE (s)-[:HAS_MESSAGE]->(:Chat_Message {uid: row.uid, seq: base + i, name: row.messages[i].name,
+                                               content: row.messages[i].content, created_at: row.messages[i].created_at}))
+FOREACH (part IN row.parts |
+    CREATE (s)-[:HAS_CHAT]->(:Episode_Part {uid: row.uid, name: part.name, response: part.response,
+                                           sentiments: part.sentiments, sentiment_compound: part.compound,
+                                           created_at: part.created_at}))
+WITH row, h
+OPTIONAL MATCH (u:Signups {uid: row.uid})
+FOREACH (_ IN CASE WHEN u IS NULL THEN [] ELSE [1] END | MERGE (u)-[:HAS]->(h))
+"""
+
+# Sessions that still hold a memory_list or messages without sentiment
+OUTDATED_SESSIONS = """
+UNWIND $keys AS key
+MATCH (s:Session_History {uid: key.uid, name: key.name})
+WHERE s.memory_list IS NOT NULL OR coalesce(s.sentiment_count, 0) < coalesce(s.message_count, 0)
+RETURN s.uid, s.name
+"""
+
+
+def turn_record(user_id, user, bot):
+    """The queued form of one chat turn."""
+    now = datetime.now()
+    return {
+        'uid': user_id,
+        'name': episode_name(now),
+        'user': user,
+        'bot': bot,
+        'at': now.strftime('%Y-%m-%d %H:%M:%S'),
+        'now': now.timestamp(),
+    }
+
+
+def bring_up_to_date(uid, name):
+    """Score a session's unscored messages and move its memory_list into the transcript."""
+    session = Session_History.nodes.get(uid=uid, name=name)
+    unscored = session.messages(offset=session.sentiment_count or 0, limit=None)
+    session.append_messages([], scores=sentiment_service.score_many([message.content for message in unscored]))
+
+
+def write_turns(records, current=None):
+    """Write turn records in one statement. current: (uid, name) sessions known to be up to date."""
+    sessions = {}
+    # a turn without a logged-in user has no history to extend
+    records = [record for record in records if record['uid']]
+    for record in records:
+        sessions.setdefault((record['uid'], record['name']), []).append(record)
+
+    if not sessions:
+        return
+
+    unknown = [{'uid': uid, 'name': name} for uid, name in sessions if current is None or (uid, name) not in current]
+    if unknown:
+        outdated, _ = db.cypher_query(OUTDATED_SESSIONS, {'keys': unknown})
+        for uid, name in outdated:
+            bring_up_to_date(uid, name)
+
+    # user and bot texts of the whole batch, scored in one pass
+    texts = [text for turns in sessions.values() for turn in turns for text in (turn['user'], turn['bot'])]
+    scores = iter(sentiment_service.score_many(texts))
+    rows = []
+    for (uid, name), turns in sessions.items():
+        row = {'uid': uid, 'name': name, 'now': turns[0]['now'], 'messages': [], 'parts': [],
+               'compound': 0.0, 'positive': 0.0, 'negative': 0.0, 'neutral': 0.0}
+        for turn in turns:
+            for message_type, text in (('User', turn['user']), ('Bot', turn['bot'])):
+                score = next(scores)
+                row['messages'].append({'name': message_type, 'content': text, 'created_at': turn['at']})
+                row['parts'].append({'name': message_type, 'response': text, 'compound': score['compound'],
+                                     'sentiments': sentiment_label(score['compound']), 'created_at': turn['at']})
+                row['compound'] += score['compound']
+                row['positive'] += score['pos']
+                row['negative'] += score['neg']
+                row['neutral'] += score['neu']
+        rows.append(row)
+    db.cypher_query(WRITE_TURNS, {'sessions': rows, 'positive': POSITIVE_THRESHOLD, 'negative': NEGATIVE_THRESHOLD})
+    if current is not None:
+        current.update(sessions)
+
+
+class HistoryWriter:
+    """Bounded write-behind queue of chat turns with a daemon flusher thread."""
+
+    def __init__(self, write=write_turns, max_queue=10000, batch_size=200, linger=0.05, enqueue_timeout=0.1):
+        self.write = write
+        self.batch_size = batch_size
+        self.linger = linger
+        self.enqueue_timeout = enqueue_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        # Held around every write: one writer at a time brings a session up to
+        # date, and the flusher and flush() or a closed writer never interleave
+        self._write_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._closed = False
+        # Sessions this process has already checked or written today
+        self._current = set()
+        # uid -> queued turns not written (or dropped) yet
+        self._pending = Counter()
+        # Latency of the last 512 batch writes
+        self._flush_ms = deque(maxlen=512)
+        self.enqueued = 0
+        self.written = 0
+        self.batches = 0
+        self.max_depth = 0
+        self.backpressure = 0
+        self.failures = 0
+        self.dropped = 0
+        self.last_error = None
+        atexit.register(self.close)
+
+    def submit(self, record):
+        """Queue a turn record, waiting for room while the queue is full."""
+        with self._lock:
+            self._pending[record['uid']] += 1
+        if self._closed:
+            self._write_batch([record])
+            return
+        self._ensure_thread()
+        try:
+            self._queue.put(record, timeout=self.enqueue_timeout)
+        except queue.Full:
+            with self._lock:
+                self.backpressure += 1
+            # Writing the turn here would number it before the session's
+            # turns still queued: wait for the flusher instead
+            self._queue.put(record)
+        with self._lock:
+            self.enqueued += 1
+            self.max_depth = max(self.max_depth, self._queue.qsize())
+
+    def _ensure_thread(self):
+        # Threads do not survive fork(): a pre-forked worker starts its own flusher
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='history-writer', daemon=True)
+                self._thread.start()
+
+    def _next_batch(self, timeout):
+        try:
+            batch = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.linger
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._closed:
+            batch = self._next_batch(timeout=0.5)
+            if batch:
+                self._write_batch(batch)
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write_batch(self, batch):
+        try:
+            self._write_with_retries(batch)
+        finally:
+            with self._lock:
+                for record in batch:
+                    self._pending[record['uid']] -= 1
+                    if self._pending[record['uid']] <= 0:
+                        del self._pending[record['uid']]
+
+    def _write_with_retries(self, batch):
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            start = time.perf_counter()
+            try:
+                with self._write_lock:
+                    self.write(batch, self._current)
+            except Exception as e:
+                with self._lock:
+                    self.failures += 1
+                    self.last_error = {'error': f"{type(e).__name__}: {e}", 'at': time.strftime('%Y-%m-%d %H:%M:%S')}
+                if attempt < MAX_ATTEMPTS:
+                    time.sleep(0.2 * attempt)
+                    continue
+                print(f"Chat history batch of {len(batch)} turns dropped after {MAX_ATTEMPTS} attempts: {e}")
+                with self._lock:
+                    self.dropped += len(batch)
+                return
+            with self._lock:
+                self._flush_ms.append(1000 * (time.perf_counter() - start))
+                self.written += len(batch)
+                self.batches += 1
+            with self._write_lock:
+                if len(self._current) > 100000:
+                    self._current.clear()
+            return
+
+    def pending(self, uid=None):
+        """Queued turns of uid (of every user if None) not written yet."""
+        with self._lock:
+            return self._queue.unfinished_tasks if uid is None else self._pending.get(uid, 0)
+
+    def flush(self, uid=None, timeout=10.0):
+        """Wait until the queued turns of uid (every queued turn if None) are written; False if timeout ran out first."""
+        deadline = time.monotonic() + timeout
+        while self.pending(uid):
+            if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+                # no flusher in this process: write the rest here
+                batch = self._next_batch(timeout=0)
+                self._write_batch(batch)
+                for _ in batch:
+                    self._queue.task_done()
+            elif time.monotonic() >= deadline:
+                return False
+            else:
+                time.sleep(0.01)
+        return True
+
+    def close(self, timeout=10.0):
+        """Flush the queue and stop the flusher; later turns are written synchronously."""
+        if self._closed:
+            return
+        flushed = self.flush(timeout=timeout)
+        self._closed = True
+        if not flushed:
+            print(f"Chat history: {self._queue.qsize()} turns not written at shutdown")
+
+    def stats(self):
+        with self._lock:
+            flush_ms = sorted(self._flush_ms)
+            return {
+                'queue_depth': self._queue.qsize(),
+                'pending_users': len(self._pending),
+                'max_queue': self._queue.maxsize,
+                'max_depth': self.max_depth,
+                'flusher_running': self._thread is not None and self._thread.is_alive() and self._pid == os.getpid(),
+                'enqueued': self.enqueued,
+                'written': self.written,
+                'batches': self.batches,
+                'mean_batch': round(self.written / self.batches, 1) if self.batches else 0.0,
+                'flush_ms_mean': round(sum(flush_ms) / len(flush_ms), 2) if flush_ms else 0.0,
+                'flush_ms_p95': round(flush_ms[int(0.95 * (len(flush_ms) - 1))], 2) if flush_ms else 0.0,
+                'flush_ms_max': round(flush_ms[-1], 2) if flush_ms else 0.0,
+                'backpressure': self.backpressure,
+                'failures': self.failures,
+                'dropped': self.dropped,
+                'last_error': self.last_error,
+            }
@@ -0,0 +1,174 @@
+"""
+AIML Kernel Pool
+================
+
+A fixed set of aiml.Kernel objects that share one learned brain, so a
+single process can answer several chat turns at once.
+
+Each chat turn checks a kernel out together with the predicate state of
+the user's session. While checked out, the session's predicates live in
+the kernel's global session, so callers keep using plain
+kernel.getPredicate()/setPredicate(). On check-in the predicates are
+stored back in the pool and the kernel is returned to the idle queue.
+
+Turns from the same session are serialized, turns from different
+sessions run in parallel up to the pool size. A turn that does I/O
+between matching and answering (translation, Cypher, drone commands)
+holds session() for the whole turn and checks a kernel out only around
+the kernel calls, so the pool size caps the AIML work in flight rather
+than the requests waiting on the network.
+
+swap_brain() replaces the shared brain while turns are being served:
+kernels pick the new brain up on their next checkout, turns already in
+progress finish on the old one.
+"""
+
+import queue
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Sessions whose predicates are kept in memory (least recently used are dropped)
+MAX_SESSIONS = 10000
+
+
+def spawn_kernel(template):
+    """Create a kernel that shares the brain, bot predicates, subbers, response cache, profiler and respond budget of template."""
+    kernel = type(template)()
+    kernel.verbose(template._verboseMode)
+    kernel._brain = template._brain
+    kernel._botPredicates = template._botPredicates
+    kernel._subbers = template._subbers
+    kernel._response_cache = getattr(template, '_response_cache', None)
+    kernel._profiler = getattr(template, '_profiler', None)
+    kernel._budget = getattr(template, '_budget', None)
+    return kernel
+
+
+class KernelPool:
+    """Hands out kernels with per-session predicate state for one chat turn."""
+
+    def __init__(self, kernel, size=4, max_sessions=MAX_SESSIONS):
+        self.size = max(1, int(size))
+        self.max_sessions = max_sessions
+        self.brain = kernel._brain
+        self._idle = queue.LifoQueue()
+        self._idle.put(kernel)
+        for _ in range(self.size - 1):
+            self._idle.put(spawn_kernel(kernel))
+
+        self._sessions = OrderedDict()
+        self._sessions_lock = threading.Lock()
+        # One lock per session with a turn in progress, dropped with its last holder
+        self._session_locks = weakref.WeakValueDictionary()
+        self._session_locks_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self._checkouts = 0
+        self._contended = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _session_lock(self, session_id):
+        with self._session_locks_lock:
+            lock = self._session_locks.get(session_id)
+            if lock is None:
+                lock = self._session_locks[session_id] = threading.RLock()
+            return lock
+
+    def _take_session(self, session_id):
+        with self._sessions_lock:
+            return self._sessions.pop(session_id, None)
+
+    def _store_session(self, session_id, predicates):
+        with self._sessions_lock:
+            self._sessions[session_id] = predicates
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def _acquire_kernel(self):
+        start = time.perf_counter()
+        contended = False
+        try:
+            kernel = self._idle.get_nowait()
+        except queue.Empty:
+            contended = True
+            kernel = self._idle.get()
+        waited = time.perf_counter() - start
+
+        with self._stats_lock:
+            self._checkouts += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+            if contended:
+                self._contended += 1
+        return kernel
+
+    @contextmanager
+    def session(self, session_id):
+        """
+        Serialize a whole turn of session_id without holding a kernel;
+        checkouts of the same session inside it do not wait:
+
+            with kernel_pool.session(session):
+                with kernel_pool.checkout(session) as kernel:
+                    deferred = kernel.respond_deferred(message)
+                ...  # I/O with the kernel back in the pool
+        """
+        session_lock = self._session_lock(session_id)
+        with session_lock:
+            yield
+
+    @contextmanager
+    def checkout(self, session_id):
+        """
+        Check out a kernel loaded with session_id's predicates:
+
+            with kernel_pool.checkout(session) as kernel:
+                bot_response = kernel.respond(message)
+        """
+        session_lock = self._session_lock(session_id)
+        session_lock.acquire()
+        try:
+            kernel = self._acquire_kernel()
+            if kernel._brain is not self.brain:
+                kernel._brain = self.brain
+            global_id = kernel._globalSessionID
+            predicates = self._take_session(session_id)
+            kernel._deleteSession(global_id)
+            if predicates is None:
+                kernel._addSession(global_id)
+            else:
+                kernel._sessions[global_id] = predicates
+            try:
+                yield kernel
+            finally:
+                self._store_session(session_id, kernel._sessions.pop(global_id))
+                kernel._addSession(global_id)
+                self._idle.put(kernel)
+        finally:
+            session_lock.release()
+
+    def swap_brain(self, brain):
+        """Serve every following checkout from brain."""
+        self.brain = brain
+
+    def forget_session(self, session_id):
+        """Drop the stored predicates of a session (e.g. on logout)."""
+        self._take_session(session_id)
+
+    def stats(self):
+        with self._stats_lock:
+            checkouts = self._checkouts
+            return {
+                'pool_size': self.size,
+                'idle_kernels': self._idle.qsize(),
+                'sessions': len(self._sessions),
+                'checkouts': checkouts,
+                'contended_checkouts': self._contended,
+                'contention_ratio': round(self._contended / checkouts, 4) if checkouts else 0.0,
+                'avg_wait_ms': round(1000 * self._wait_total / checkouts, 3) if checkouts else 0.0,
+                'max_wait_ms': round(1000 * self._wait_max, 3),
+            }
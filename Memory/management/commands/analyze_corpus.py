@@ -0,0 +1,88 @@
+import os
+import time
+from django.core.management.base import BaseCommand, CommandError
+from Memory.aiml import BOT_PREDICATES, aiml_files, parse_corpus
+from Memory.corpus_analyzer import FILLERS, CorpusAnalyzer, format_key, normalize_key, write_corpus
+
+
+class Command(BaseCommand):
+    requires_system_checks = []
+    help = ("Report duplicate, shadowed and unreachable AIML categories and dangling <srai> targets in Data/, "
+            "and optionally write a pruned corpus.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, help="Processes used to parse the corpus (default AIML_LOAD_WORKERS).")
+        parser.add_argument('--top', type=int, default=20, help="Examples listed per finding (0 for all).")
+        parser.add_argument('--output', help="Directory to write the pruned, deduplicated corpus to.")
+        parser.add_argument('--drop-unreachable', action='store_true',
+                            help="Also leave unreachable categories out of the pruned corpus.")
+
+    def handle(self, *args, **options):
+        start = time.time()
+        files = aiml_files()
+        parsed = []
+        for file_name, categories, seconds, error in parse_corpus(files, options['workers']):
+            if error:
+                # the kernel skips the whole file too
+                self.stderr.write(self.style.WARNING(f"{file_name} does not parse and is not learned: {error}"))
+            parsed.append((file_name, categories))
+        analyzer = CorpusAnalyzer(parsed, BOT_PREDICATES['name'])
+        defined = sum(len(categories) for _, categories in parsed)
+        self.stdout.write(f"{len(files)} files, {defined} category definitions, {len(analyzer)} distinct categories "
+                          f"(loaded in {time.time() - start:.2f}s)")
+
+        top = options['top'] or None
+        duplicates, shadowed = analyzer.redefinitions()
+        self.section(f"Duplicate categories: {len(duplicates)} (same template in several files)",
+                     [f"{format_key(key)}  {', '.join(earlier)} -> {winner}" for key, earlier, winner in duplicates], top)
+        self.section(f"Shadowed categories: {len(shadowed)} (different template, the last file wins)",
+                     [f"{format_key(key)}  {', '.join(earlier)} -> {winner}" for key, earlier, winner in shadowed], top)
+
+        start = time.time()
+        unreachable = analyzer.unreachable()
+        self.section(f"Unreachable categories: {len(unreachable)} (checked in {time.time() - start:.2f}s)",
+                     [f"{format_key(key)} ({analyzer.source(key)}): {reason}" for key, reason in unreachable.items()], top)
+
+        dangling = analyzer.dangling_srai()
+        self.section(f"Dangling <srai> targets: {len(dangling)}",
+                     [f"{target.replace(FILLERS[0], '<...>')!r}{' (dynamic)' if dynamic else ''} {outcome}, from {len(keys)} categories "
+                      f"e.g. {format_key(keys[0])} ({analyzer.source(keys[0])})"
+                      for target, dynamic, outcome, keys in dangling], top)
+
+        if options['output']:
+            self.write_pruned(analyzer, parsed, files, options)
+
+    def section(self, title, lines, top):
+        self.stdout.write(f"\n{title}")
+        for line in lines[:top]:
+            self.stdout.write(f"  {line}")
+        if top and len(lines) > top:
+            self.stdout.write(f"  ... {len(lines) - top} more")
+
+    def write_pruned(self, analyzer, parsed, files, options):
+        output = options['output']
+        if os.path.abspath(output) == os.path.abspath(os.path.dirname(files[0])):
+            raise CommandError("Write the pruned corpus to a new directory, not over Data/.")
+        pruned = analyzer.pruned(options['drop_unreachable'])
+        paths = write_corpus(output, pruned)
+
+        # The pruned files must parse back to exactly the kept categories
+        expected = {file_name: categories for file_name, categories in pruned if categories}
+        for file_name, categories, seconds, error in parse_corpus(paths, options['workers']):
+            if error:
+                raise CommandError(f"Pruned {file_name} does not parse: {error}")
+            if [(normalize_key(key), template) for key, template in categories] != expected[file_name]:
+                raise CommandError(f"Pruned {file_name} does not parse back to the kept categories.")
+
+        kept = sum(len(categories) for _, categories in pruned)
+        before = sum(os.path.getsize(path) for path in files)
+        after = sum(os.path.getsize(path) for path in paths)
+        self.stdout.write(self.style.SUCCESS(
+            f"\nWrote {len(paths)} files to {output}: {kept} category definitions "
+            f"(was {sum(len(categories) for _, categories in parsed)}), "
+            f"{after / 2**20:.1f} MiB (was {before / 2**20:.1f} MiB); every file parses back unchanged."
+        ))
+        if options['drop_unreachable']:
+            self.stdout.write(f"The brain learned from it has {kept} categories instead of {len(analyzer)}.")
+        else:
+            self.stdout.write("It learns to the same brain; add --drop-unreachable to also shrink the brain.")
@@ -0,0 +1,252 @@
+import json
+import os
+import random
+import resource
+import time
+import psutil
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from Memory.aiml import init_kernel
+from Memory.respond_budget import RespondBudget, RespondBudgetExceeded
+from Memory.response_cache import ResponseCache
+from Memory.translation import URDU_MESSAGE, PhraseTableBackend, TranslationService
+
+BENCHMARK_DIRECTORY = os.path.join(settings.BASE_DIR, 'Benchmarks')
+BUDGET_EXCEEDED = "<respond budget exceeded>"
+
+
+def load_corpus(path):
+    """Read the utterance corpus: one {"id", "category", "text"} object per line."""
+    corpus = []
+    with open(path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                utterance = json.loads(line)
+                utterance['id'], utterance['category'], utterance['text']
+            except (ValueError, KeyError) as e:
+                raise CommandError(f"{path}:{line_number}: not a corpus entry ({e})")
+            corpus.append(utterance)
+    return corpus
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[int(fraction * (len(samples) - 1))] if samples else 0.0
+
+
+def latency_summary(samples):
+    return {
+        'count': len(samples),
+        'mean_ms': round(1000 * sum(samples) / len(samples), 3) if samples else 0.0,
+        'p50_ms': round(1000 * percentile(samples, 0.5), 3),
+        'p95_ms': round(1000 * percentile(samples, 0.95), 3),
+        'p99_ms': round(1000 * percentile(samples, 0.99), 3),
+        'max_ms': round(1000 * max(samples, default=0.0), 3),
+    }
+
+
+def replay(kernel, translator, corpus, seed):
+    """
+    Answer every utterance once, the way chat_turn() does, with one fresh
+    session per category. Urdu utterances are translated to English and
+    the reply back to Urdu. <random> picks are seeded per utterance.
+    Returns [(seconds, response)] in corpus order.
+    """
+    sessions = {}
+    results = []
+    for utterance in corpus:
+        session = sessions.get(utterance['category'])
+        if session is None:
+            session = sessions[utterance['category']] = f"benchmark-{utterance['category']}"
+            kernel._deleteSession(session)
+            kernel.setPredicate('name', 'Benchmark', session)
+            kernel.setPredicate('gender', 'male', session)
+
+        random.seed(f"{seed}:{utterance['id']}")
+        text = utterance['text']
+        is_urdu = URDU_MESSAGE.match(text)
+        start = time.perf_counter()
+        try:
+            if is_urdu:
+                text = translator.translate(text, dest='en')
+            response = kernel.respond_deferred(text, slots=('namey',), sessionID=session).bind()
+            if is_urdu:
+                response = translator.translate(response, dest='ur')
+        except RespondBudgetExceeded:
+            response = BUDGET_EXCEEDED
+        results.append((time.perf_counter() - start, response))
+    for session in sessions.values():
+        kernel._deleteSession(session)
+    return results
+
+
+class Command(BaseCommand):
+    requires_system_checks = []
+    help = ("Replay a corpus of chat utterances through the AIML kernel offline and report load time, "
+            "respond latency, throughput and memory, diffing the responses against a stored baseline.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus', default=os.path.join(BENCHMARK_DIRECTORY, 'chat_corpus.jsonl'))
+        parser.add_argument('--baseline', default=os.path.join(BENCHMARK_DIRECTORY, 'chat_baseline.json'))
+        parser.add_argument('--update-baseline', action='store_true',
+                            help="Store this run's responses and metrics as the new baseline.")
+        parser.add_argument('--rounds', type=int, default=20,
+                            help="Replays of the corpus; the first runs with an empty response cache.")
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--no-cache', action='store_true', help="Run without the response cache.")
+        parser.add_argument('--max-slowdown', type=float,
+                            help="Fail when p95 latency is this many percent above the baseline's.")
+        parser.add_argument('--top', type=int, default=20, help="Changed responses listed (0 for all).")
+        parser.add_argument('--json', help="Also write the report to this file.")
+
+    def handle(self, *args, **options):
+        corpus = load_corpus(options['corpus'])
+        if len({utterance['id'] for utterance in corpus}) != len(corpus):
+            raise CommandError(f"{options['corpus']} has duplicate utterance ids.")
+
+        process = psutil.Process()
+        rss_before = process.memory_info().rss
+        start = time.perf_counter()
+        cache = ResponseCache(max_entries=0 if options['no_cache'] else settings.AIML_RESPONSE_CACHE_SIZE)
+        budget = RespondBudget(max_srai_depth=settings.AIML_MAX_SRAI_DEPTH,
+                               max_evaluations=settings.AIML_MAX_EVALUATIONS,
+                               timeout=settings.AIML_RESPOND_TIMEOUT)
+        kernel = init_kernel(cache, budget=budget)
+        load_seconds = time.perf_counter() - start
+        # offline stand-in for the translation backend
+        translator = TranslationService(PhraseTableBackend())
+        rss_loaded = process.memory_info().rss
+
+        rounds = []
+        start = time.perf_counter()
+        for _ in range(max(1, options['rounds'])):
+            rounds.append(replay(kernel, translator, corpus, options['seed']))
+        replay_seconds = time.perf_counter() - start
+
+        responses = {utterance['id']: response for utterance, (_, response) in zip(corpus, rounds[0])}
+        # The cache and the kernel must answer a repeated conversation the same way
+        unstable = sorted({utterance['id'] for results in rounds[1:]
+                           for utterance, (_, response) in zip(corpus, results)
+                           if response != responses[utterance['id']]})
+
+        by_category = {}
+        for results in rounds:
+            for utterance, (seconds, _) in zip(corpus, results):
+                by_category.setdefault(utterance['category'], []).append(seconds)
+        all_samples = [seconds for results in rounds for seconds, _ in results]
+        report = {
+            'corpus': os.path.relpath(options['corpus'], settings.BASE_DIR),
+            'utterances': len(corpus),
+            'rounds': len(rounds),
+            'response_cache': not options['no_cache'],
+            'load_seconds': round(load_seconds, 3),
+            'categories': kernel.numCategories(),
+            'latency': latency_summary(all_samples),
+            'cold_latency': latency_summary([seconds for seconds, _ in rounds[0]]),
+            'warm_latency': latency_summary([seconds for results in rounds[1:] for seconds, _ in results]),
+            'category_latency': {category: latency_summary(samples) for category, samples in sorted(by_category.items())},
+            'throughput_per_second': round(len(all_samples) / replay_seconds, 1) if replay_seconds else 0.0,
+            'rss_mib': {
+                'before_load': round(rss_before / 2**20, 1),
+                'after_load': round(rss_loaded / 2**20, 1),
+                'after_replay': round(process.memory_info().rss / 2**20, 1),
+                # ru_maxrss is in KiB on Linux
+                'peak': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            },
+            'respond_budget': budget.stats()['exceeded'],
+            'response_cache_stats': cache.stats(),
+            'unstable_responses': unstable,
+        }
+        self.print_report(report)
+
+        failures = []
+        if unstable:
+            failures.append(f"{len(unstable)} utterances answered differently on a repeated replay: {', '.join(unstable)}")
+        if options['update_baseline']:
+            self.save_baseline(options['baseline'], options['seed'], responses, report)
+        else:
+            failures += self.compare_baseline(options, responses, report)
+
+        if options['json']:
+            with open(options['json'], 'w') as f:
+                json.dump(report, f, indent=2)
+        if failures:
+            raise CommandError("Benchmark failed:\n  " + "\n  ".join(failures))
+
+    def print_report(self, report):
+        self.stdout.write(f"Loaded {report['categories']} categories in {report['load_seconds']:.2f}s; "
+                          f"replayed {report['utterances']} utterances x {report['rounds']} rounds "
+                          f"({'with' if report['response_cache'] else 'without'} response cache)")
+        self.stdout.write(f"\n{'':<14} {'count':>6} {'mean':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}  (ms)")
+        rows = [('all', report['latency']), ('cold', report['cold_latency']), ('warm', report['warm_latency'])]
+        rows += sorted(report['category_latency'].items())
+        for name, summary in rows:
+            self.stdout.write(f"{name:<14} {summary['count']:>6} {summary['mean_ms']:>8.3f} {summary['p50_ms']:>8.3f} "
+                              f"{summary['p95_ms']:>8.3f} {summary['p99_ms']:>8.3f} {summary['max_ms']:>8.3f}")
+        rss = report['rss_mib']
+        self.stdout.write(f"\nThroughput: {report['throughput_per_second']:.0f} responses/s (one thread)")
+        self.stdout.write(f"Memory: {rss['after_load']:.1f} MiB RSS after load ({rss['after_load'] - rss['before_load']:+.1f}), "
+                          f"{rss['after_replay']:.1f} MiB after replay, peak {rss['peak']:.1f} MiB")
+        exceeded = {limit: count for limit, count in report['respond_budget'].items() if count}
+        if exceeded:
+            self.stdout.write(self.style.WARNING(f"Respond budget exceeded: {exceeded}"))
+
+    def save_baseline(self, path, seed, responses, report):
+        baseline = {
+            'created_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'seed': seed,
+            'metrics': {name: report[name] for name in
+                        ('load_seconds', 'latency', 'cold_latency', 'warm_latency', 'throughput_per_second', 'rss_mib')},
+            'responses': responses,
+        }
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, indent=2, ensure_ascii=False)
+            f.write('\n')
+        self.stdout.write(self.style.SUCCESS(f"\nBaseline written to {path}"))
+
+    def compare_baseline(self, options, responses, report):
+        """Print the differences from the stored baseline and return the failures."""
+        try:
+            with open(options['baseline'], encoding='utf-8') as f:
+                baseline = json.load(f)
+        except OSError:
+            self.stdout.write(f"\nNo baseline at {options['baseline']}, create one with --update-baseline.")
+            return []
+        if baseline.get('seed') != options['seed']:
+            self.stdout.write(self.style.WARNING(f"\nBaseline was recorded with --seed {baseline.get('seed')}."))
+
+        expected = baseline.get('responses', {})
+        changed = [(utterance_id, expected[utterance_id], response)
+                   for utterance_id, response in responses.items()
+                   if utterance_id in expected and expected[utterance_id] != response]
+        added = sorted(set(responses) - set(expected))
+        removed = sorted(set(expected) - set(responses))
+
+        self.stdout.write(f"\nAgainst the baseline of {baseline.get('created_at')}:")
+        before = baseline.get('metrics', {})
+        for name in ('cold_latency', 'warm_latency', 'latency'):
+            if name in before:
+                old, new = before[name]['p95_ms'], report[name]['p95_ms']
+                change = f"{100 * (new - old) / old:+.1f}%" if old else "n/a"
+                self.stdout.write(f"  {name.replace('_', ' ')} p95 {old:.3f} -> {new:.3f} ms ({change})")
+        if 'throughput_per_second' in before:
+            self.stdout.write(f"  throughput {before['throughput_per_second']:.0f} -> {report['throughput_per_second']:.0f} responses/s")
+        if 'load_seconds' in before:
+            self.stdout.write(f"  load {before['load_seconds']:.2f} -> {report['load_seconds']:.2f} s")
+
+        top = options['top'] or None
+        self.stdout.write(f"  {len(changed)} responses changed, {len(added)} utterances new, {len(removed)} gone")
+        for utterance_id, old, new in changed[:top]:
+            self.stdout.write(f"    {utterance_id}:\n      - {old!r}\n      + {new!r}")
+
+        failures = []
+        if changed:
+            failures.append(f"{len(changed)} responses differ from the baseline (review, then --update-baseline)")
+        if options['max_slowdown'] is not None and 'latency' in before and before['latency']['p95_ms']:
+            slowdown = 100 * (report['latency']['p95_ms'] - before['latency']['p95_ms']) / before['latency']['p95_ms']
+            if slowdown > options['max_slowdown']:
+                failures.append(f"p95 latency {slowdown:+.1f}% over the baseline (limit {options['max_slowdown']}%)")
+        return failures
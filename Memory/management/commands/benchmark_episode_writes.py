@@ -0,0 +1,75 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from neomodel import db
+from Memory.management.commands.benchmark_chat import latency_summary
+from Memory.models import Episode_Part, Session_History
+from Memory.repository import create_episode_turn, episode_name
+from Memory.sentiment import sentiment_label, sentiment_service
+
+TURNS = [
+    ("hello", "Hi there! How are you today?"),
+    ("who is the father of ali", " is father of Ali."),
+    ("what can you see", "I can see you through the camera on your computer :-)"),
+    ("thank you", "you are quite welcome."),
+]
+
+
+def neomodel_episode_turn(uid, episode, user, bot):
+    """The previous extend_episode(): a get, two saves and two connects."""
+    session = Session_History.nodes.get(uid=uid, name=episode)
+    bot_compound, user_compound = (scores['compound'] for scores in sentiment_service.score_many([bot, user]))
+    bot_part = Episode_Part(uid=uid, name='Bot', response=bot, sentiments=sentiment_label(bot_compound),
+                            sentiment_compound=bot_compound).save()
+    user_part = Episode_Part(uid=uid, name='User', response=user, sentiments=sentiment_label(user_compound),
+                             sentiment_compound=user_compound).save()
+    bot_part.relation.connect(session)
+    user_part.relation.connect(session)
+
+
+class Command(BaseCommand):
+    requires_system_checks = []
+    help = ("Compare writing a chat turn's Episode_Parts through neomodel (five round trips) with "
+            "the single-statement repository write, against the configured Neo4j.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--turns', type=int, default=200, help="Turns written by each path.")
+        parser.add_argument('--uid', default='benchmark-episode-writes',
+                            help="uid of the throwaway episode, deleted afterwards.")
+
+    def handle(self, *args, **options):
+        uid, episode = options['uid'], episode_name()
+        try:
+            db.cypher_query("MATCH (s:Session_History {uid: $uid}) DETACH DELETE s", {'uid': uid})
+        except Exception as e:
+            raise CommandError(f"Neo4j is not reachable: {e}")
+        Session_History(uid=uid, name=episode).save()
+        # both paths score the same texts, warm the analyzer and cache first
+        sentiment_service.score_many([text for turn in TURNS for text in turn])
+
+        results = {}
+        try:
+            for name, write in (('neomodel', neomodel_episode_turn), ('repository', create_episode_turn)):
+                samples = []
+                for i in range(options['turns']):
+                    user, bot = TURNS[i % len(TURNS)]
+                    start = time.perf_counter()
+                    write(uid, episode, user, bot)
+                    samples.append(time.perf_counter() - start)
+                results[name] = latency_summary(samples)
+            parts, _ = db.cypher_query("MATCH (:Session_History {uid: $uid})-[:HAS_CHAT]->(p:Episode_Part) RETURN count(p)",
+                                       {'uid': uid})
+        finally:
+            db.cypher_query("MATCH (p:Episode_Part {uid: $uid}) DETACH DELETE p", {'uid': uid})
+            db.cypher_query("MATCH (s:Session_History {uid: $uid}) DETACH DELETE s", {'uid': uid})
+
+        expected = 4 * options['turns']
+        if parts[0][0] != expected:
+            raise CommandError(f"{parts[0][0]} Episode_Parts linked to the episode, expected {expected}.")
+        self.stdout.write(f"{options['turns']} turns per path (ms per turn)")
+        self.stdout.write(f"{'':<12} {'mean':>8} {'p50':>8} {'p95':>8} {'max':>8}")
+        for name, summary in results.items():
+            self.stdout.write(f"{name:<12} {summary['mean_ms']:>8.3f} {summary['p50_ms']:>8.3f} "
+                              f"{summary['p95_ms']:>8.3f} {summary['max_ms']:>8.3f}")
+        before, after = results['neomodel']['mean_ms'], results['repository']['mean_ms']
+        if after:
+            self.stdout.write(self.style.SUCCESS(f"Single statement is {before / after:.1f}x faster on average."))
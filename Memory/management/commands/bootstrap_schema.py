@@ -0,0 +1,92 @@
+from django.core.management.base import BaseCommand, CommandError
+from neomodel import db
+from Memory.schema import SCANS, SCHEMA, hot_queries, plan_operators, schema_statement
+
+CURRENT_CONSTRAINTS = """
+SHOW CONSTRAINTS YIELD type, labelsOrTypes, properties
+WHERE type IN ['UNIQUENESS', 'NODE_PROPERTY_UNIQUENESS', 'NODE_KEY']
+RETURN labelsOrTypes, properties
+"""
+
+CURRENT_INDEXES = """
+SHOW INDEXES YIELD type, entityType, labelsOrTypes, properties, state
+WHERE entityType = 'NODE' AND type IN ['RANGE', 'BTREE']
+RETURN labelsOrTypes, properties, state
+"""
+
+
+def current_schema():
+    """{(label, properties): kind} of the uniqueness constraints and range indexes in the database."""
+    schema = {}
+    indexes, _ = db.cypher_query(CURRENT_INDEXES)
+    for labels, properties, state in indexes:
+        schema[(labels[0], tuple(properties))] = 'index' if state == 'ONLINE' else state.lower()
+    constraints, _ = db.cypher_query(CURRENT_CONSTRAINTS)
+    for labels, properties in constraints:
+        schema[(labels[0], tuple(properties))] = 'unique'
+    return schema
+
+
+class Command(BaseCommand):
+    requires_system_checks = []
+    help = ("Create the Neo4j indexes and uniqueness constraints of Memory/schema.py where missing, then "
+            "check with EXPLAIN that every hot query seeks an index instead of scanning a label.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check-only', action='store_true', help="Report what is missing without creating it.")
+        parser.add_argument('--skip-explain', action='store_true', help="Do not EXPLAIN the hot queries.")
+        parser.add_argument('--timeout', type=int, default=300,
+                            help="Seconds to wait for new indexes to come online.")
+
+    def handle(self, *args, **options):
+        try:
+            existing = current_schema()
+        except Exception as e:
+            raise CommandError(f"Cannot read the schema from Neo4j: {e}")
+
+        problems = []
+        created = 0
+        for kind, label, properties in SCHEMA:
+            statement = schema_statement(kind, label, properties)
+            present = existing.get((label, properties))
+            if present == 'unique' or present == kind:
+                self.stdout.write(f"  ok       {statement}")
+                continue
+            if options['check_only']:
+                self.stdout.write(self.style.WARNING(f"  missing  {statement}"))
+                problems.append(f"missing {kind} on :{label}({', '.join(properties)})")
+                continue
+            try:
+                db.cypher_query(statement)
+                created += 1
+                self.stdout.write(self.style.SUCCESS(f"  created  {statement}"))
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f"  failed   {statement}\n           {e}"))
+                problems.append(f"{kind} on :{label}({', '.join(properties)}) not created")
+                if kind == 'unique' and present is None:
+                    # e.g. duplicate values: index the lookup until they are cleaned up
+                    db.cypher_query(schema_statement('index', label, properties))
+                    created += 1
+                    self.stdout.write(self.style.WARNING("           created a plain index instead"))
+
+        if created:
+            self.stdout.write(f"Waiting for {created} new indexes to come online...")
+            db.cypher_query("CALL db.awaitIndexes($timeout)", {'timeout': options['timeout']})
+
+        if not options['skip_explain']:
+            self.stdout.write("Hot queries:")
+            with db.driver.session(database=db._database_name) as session:
+                for name, query, params in hot_queries():
+                    operators = plan_operators(session.run(f"EXPLAIN {query}", params).consume().plan)
+                    scans = sorted(SCANS.intersection(operators))
+                    seeks = sorted({operator for operator in operators if 'Seek' in operator})
+                    if scans or not seeks:
+                        self.stdout.write(self.style.ERROR(f"  scan  {name}: {', '.join(scans) or 'no index seek'}"))
+                        problems.append(f"{name} scans ({', '.join(scans) or 'no index seek'})")
+                    else:
+                        self.stdout.write(f"  seek  {name}: {', '.join(seeks)}")
+
+        if problems:
+            raise CommandError(f"{len(problems)} problems:\n  " + "\n  ".join(problems))
+        self.stdout.write(self.style.SUCCESS(
+            "Schema in place." if options['skip_explain'] else "Schema in place; every hot query seeks an index."))
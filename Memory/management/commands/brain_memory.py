@@ -0,0 +1,45 @@
+import gc
+import psutil
+from django.core.management.base import BaseCommand
+from Memory.aiml import build_brain
+
+
+def measure():
+    gc.collect()
+    return psutil.Process().memory_info().rss, len(gc.get_objects())
+
+
+class Command(BaseCommand):
+    requires_system_checks = []
+    help = "Report the resident memory and object counts of the AIML brain before and after loading it."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-tree', action='store_true',
+                            help="Skip materializing aiml's nested-dict tree for comparison.")
+
+    def row(self, label, sample, base):
+        rss, objects = sample
+        self.stdout.write(
+            f"{label:<34} rss={rss / 2**20:8.1f} MiB (+{(rss - base[0]) / 2**20:7.1f})  "
+            f"gc objects={objects:>10,} (+{objects - base[1]:,})"
+        )
+
+    def handle(self, *args, **options):
+        before = measure()
+        self.row("before loading", before, before)
+
+        kernel, rebuilt = build_brain()
+        loaded = measure()
+        self.row("compact index" + (" (relearned)" if rebuilt else ""), loaded, before)
+
+        index = kernel._brain.build_index()
+        self.stdout.write(
+            f"  {len(index):,} nodes, {len(index.edge_word):,} word edges, {len(index.words):,} words, "
+            f"{len(index.template_offsets) - 1:,} distinct templates in {len(index.template_data) / 2**20:.1f} MiB "
+            f"for {kernel.numCategories():,} categories"
+        )
+
+        if not options['no_tree']:
+            tree = index.to_tree()
+            self.row("+ nested-dict tree (stock aiml)", measure(), loaded)
+            del tree
@@ -0,0 +1,45 @@
+import time
+from django.core.management.base import BaseCommand
+from Memory.aiml import build_brain, brain_snapshot, read_manifest
+
+
+class Command(BaseCommand):
+    requires_system_checks = []
+    help = "Build the precompiled AIML brain snapshot from Data/*.aiml (run ahead of deploys)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Rebuild even if the snapshot is up to date.")
+        parser.add_argument('--workers', type=int, help="Processes used to parse the corpus (default AIML_LOAD_WORKERS).")
+        parser.add_argument('--report', action='store_true', help="Print the per-file load times of the last rebuild.")
+        parser.add_argument('--top', type=int, default=20, help="Number of files shown by --report (0 for all).")
+
+    def handle(self, *args, **options):
+        start = time.time()
+        kernel, rebuilt = build_brain(force=options['force'], workers=options['workers'])
+        state = "Rebuilt" if rebuilt else "Up to date"
+        self.stdout.write(self.style.SUCCESS(
+            f"{state}: {brain_snapshot} ({kernel.numCategories()} categories, {time.time() - start:.2f}s)"
+        ))
+        if options['report']:
+            self.print_report(options['top'])
+
+    def print_report(self, top):
+        manifest = read_manifest() or {}
+        report = manifest.get('load_report')
+        if not report:
+            self.stdout.write("No load report in the manifest, rebuild with --force.")
+            return
+
+        report = sorted(report, key=lambda row: row['parse_seconds'] + row['merge_seconds'], reverse=True)
+        parse_total = sum(row['parse_seconds'] for row in report)
+        merge_total = sum(row['merge_seconds'] for row in report)
+        self.stdout.write(f"Load report from {manifest.get('built_at')} ({len(report)} files)")
+        self.stdout.write(f"{'file':<32} {'categories':>10} {'parse s':>9} {'merge s':>9} {'share':>7}")
+        for row in report[:top or None]:
+            total = row['parse_seconds'] + row['merge_seconds']
+            share = 100 * total / (parse_total + merge_total) if parse_total + merge_total else 0.0
+            self.stdout.write(
+                f"{row['file']:<32} {row['categories']:>10} {row['parse_seconds']:>9.3f} "
+                f"{row['merge_seconds']:>9.3f} {share:>6.1f}%"
+            )
+        self.stdout.write(f"{'total':<32} {sum(row['categories'] for row in report):>10} {parse_total:>9.3f} {merge_total:>9.3f}")
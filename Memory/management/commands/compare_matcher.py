@@ -0,0 +1,110 @@
+import contextlib
+import io
+import random
+import time
+import aiml
+from django.core.management.base import BaseCommand, CommandError
+from aiml.PatternMgr import PatternMgr
+from Memory.aiml import BOT_PREDICATES, aiml_files, init_kernel
+
+WILDCARD_FILL = {PatternMgr._UNDERSCORE: 'FOO', PatternMgr._STAR: 'BAR BAZ', PatternMgr._BOT_NAME: None}
+THATS = ['', 'DO YOU LIKE MOVIES', 'I am the latest result in artificial intelligence and I can chat about many topics']
+
+
+def pattern_inputs(root, bot_name):
+    """Turn every learned pattern into an input that should match it."""
+    inputs = []
+    stack = [(root, [])]
+    while stack:
+        node, words = stack.pop()
+        for key, child in node.items():
+            if key == PatternMgr._THAT:
+                inputs.append(' '.join(words))
+            elif key != PatternMgr._TEMPLATE:
+                word = WILDCARD_FILL.get(key, key) or bot_name
+                stack.append((child, words + [word]))
+    return inputs
+
+
+def stock_brain(files=None):
+    """
+    aiml's own PatternMgr with the corpus learned by a plain aiml.Kernel,
+    so nothing of the index under test goes into the reference.
+    """
+    kernel = aiml.Kernel()
+    kernel.verbose(False)
+    # the corpus' parse errors are reported when the brain is built
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        for file_path in files or aiml_files():
+            kernel.learn(file_path)
+    kernel.setBotPredicate('name', BOT_PREDICATES['name'])
+    return kernel._brain
+
+
+def compare(stock, indexed, corpus, timings=None):
+    """(input, that) pairs of corpus on which indexed matches differently from stock."""
+    mismatches = []
+    for text in corpus:
+        for that in THATS:
+            start = time.perf_counter()
+            expected = stock.match(text, that, '')
+            stock_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            actual = indexed.match(text, that, '')
+            if timings is not None:
+                timings['Indexed'].append(time.perf_counter() - start)
+                timings['PatternMgr'].append(stock_seconds)
+
+            # templates are decoded per match, so compare by value
+            if expected != actual:
+                mismatches.append((text, that))
+            elif expected is not None and stock.star('star', text, that, '', 1) != indexed.star('star', text, that, '', 1):
+                mismatches.append((text, that))
+    return mismatches
+
+
+def percentile(samples, fraction):
+    return samples[int(fraction * (len(samples) - 1))] * 1e6
+
+
+class Command(BaseCommand):
+    requires_system_checks = []
+    help = ("Check the indexed AIML matcher against aiml's PatternMgr, learned separately from Data/*.aiml, "
+            "on a regression corpus and compare latency.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus', help="File with one input per line (defaults to a sample of the learned patterns).")
+        parser.add_argument('--sample', type=int, default=20000, help="Number of learned patterns to sample.")
+        parser.add_argument('--sentences', type=int, default=5000, help="Number of random sentences built from pattern words, to exercise partial matches and fallbacks.")
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        indexed = init_kernel()._brain
+        stock = stock_brain()
+
+        if options['corpus']:
+            with open(options['corpus'], encoding='utf-8') as f:
+                corpus = [line.strip() for line in f if line.strip()]
+        else:
+            inputs = pattern_inputs(stock._root, stock._botName)
+            random.seed(options['seed'])
+            corpus = random.sample(inputs, min(options['sample'], len(inputs)))
+            vocabulary = [word for text in corpus for word in text.split()]
+            corpus += [' '.join(random.choice(vocabulary) for _ in range(random.randint(3, 15)))
+                       for _ in range(options['sentences'])]
+
+        timings = {'PatternMgr': [], 'Indexed': []}
+        mismatches = compare(stock, indexed, corpus, timings)
+
+        self.stdout.write(f"Queries: {len(corpus) * len(THATS)}  Mismatches: {len(mismatches)}")
+        for text, that in mismatches[:20]:
+            self.stdout.write(f"  MISMATCH input={text!r} that={that!r}")
+        for name, samples in timings.items():
+            samples.sort()
+            self.stdout.write(
+                f"{name:>10}: p50={percentile(samples, 0.5):.1f}us p95={percentile(samples, 0.95):.1f}us "
+                f"p99={percentile(samples, 0.99):.1f}us max={percentile(samples, 1):.1f}us"
+            )
+        if mismatches:
+            raise CommandError(f"Indexed matcher disagrees with PatternMgr on {len(mismatches)} queries")
+        self.stdout.write(self.style.SUCCESS("Indexed matcher agrees with PatternMgr"))
@@ -0,0 +1,72 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from neomodel import db
+from Memory.models import parse_memory_line
+
+# Keyset paging on the node id ({id} is db.get_id_method(): elementId on
+# Neo4j 5, id before) over the sessions still holding a memory_list
+READ_SESSIONS = """
+MATCH (s:Session_History)
+WHERE ($after IS NULL OR {id}(s) > $after) AND s.memory_list IS NOT NULL
+RETURN {id}(s), s.memory_list
+ORDER BY {id}(s)
+LIMIT $batch
+"""
+
+# A session whose memory_list changed since it was read (an old worker still
+# appending) is left for the next run
+MIGRATE_SESSIONS = """
+UNWIND $sessions AS row
+MATCH (s:Session_History) WHERE {id}(s) = row.id AND size(s.memory_list) = size(row.messages)
+SET s.message_count = coalesce(s.message_count, 0)
+WITH s, row, s.message_count AS base
+SET s.message_count = base + size(row.messages)
+REMOVE s.memory_list
+WITH s, row, base
+UNWIND range(0, size(row.messages) - 1) AS i
+CREATE (s)-[:HAS_MESSAGE]->(:Chat_Message {{uid: s.uid, seq: base + i, name: row.messages[i].name,
+                                            content: row.messages[i].content, created_at: row.messages[i].created_at}})
+RETURN count(DISTINCT s), count(*)
+"""
+
+
+class Command(BaseCommand):
+    requires_system_checks = []
+    help = "Move the memory_list transcripts of Session_History nodes into append-only Chat_Message nodes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=200, help="Sessions migrated per statement.")
+        parser.add_argument('--dry-run', action='store_true', help="Count what would be migrated without writing.")
+
+    def handle(self, *args, **options):
+        if options['batch'] < 1:
+            raise CommandError("--batch must be at least 1.")
+        start = time.time()
+        id_method = db.get_id_method()
+        read_sessions = READ_SESSIONS.format(id=id_method)
+        migrate_sessions = MIGRATE_SESSIONS.format(id=id_method)
+        after = None
+        sessions = messages = skipped = 0
+        while True:
+            rows, _ = db.cypher_query(read_sessions, {'after': after, 'batch': options['batch']})
+            if not rows:
+                break
+            after = rows[-1][0]
+            batch = [{'id': session_id, 'messages': [parse_memory_line(line) for line in memory_list]}
+                     for session_id, memory_list in rows if memory_list]
+            if options['dry_run']:
+                sessions += len(batch)
+                messages += sum(len(row['messages']) for row in batch)
+                continue
+            results, _ = db.cypher_query(migrate_sessions, {'sessions': batch})
+            migrated, created = results[0] if results else (0, 0)
+            sessions += migrated
+            messages += created
+            skipped += len(batch) - migrated
+            self.stdout.write(f"  {sessions} sessions, {messages} messages")
+
+        verb = "Would migrate" if options['dry_run'] else "Migrated"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {sessions} sessions, {messages} messages in {time.time() - start:.1f}s"))
+        if skipped:
+            self.stdout.write(self.style.WARNING(f"{skipped} sessions changed while migrating; run again to migrate them."))
@@ -0,0 +1,71 @@
+import os
+import psutil
+from django.core.management.base import BaseCommand, CommandError
+
+ROLLUP_FIELDS = ('Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty', 'Swap')
+
+
+def smaps_rollup(pid):
+    """Return the memory totals of /proc/<pid>/smaps_rollup in bytes."""
+    totals = dict.fromkeys(ROLLUP_FIELDS, 0)
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            name, _, value = line.partition(':')
+            if name in totals:
+                totals[name] = int(value.split()[0]) * 1024
+    return totals
+
+
+def mib(value):
+    return value / 2**20
+
+
+class Command(BaseCommand):
+    requires_system_checks = []
+    help = "Report shared vs private memory of a pre-fork master and its workers (Linux)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pid', type=int, help="PID of the gunicorn master.")
+        parser.add_argument('--pidfile', default=os.environ.get('GUNICORN_PIDFILE', '/tmp/loubot-gunicorn.pid'),
+                            help="Pidfile of the gunicorn master, used when --pid is not given.")
+
+    def handle(self, *args, **options):
+        pid = options['pid']
+        if pid is None:
+            try:
+                with open(options['pidfile']) as f:
+                    pid = int(f.read().strip())
+            except (OSError, ValueError) as e:
+                raise CommandError(f"No master PID given and {options['pidfile']} unreadable: {e}")
+
+        try:
+            master = psutil.Process(pid)
+            workers = master.children()
+        except psutil.Error as e:
+            raise CommandError(f"Cannot inspect process {pid}: {e}")
+
+        self.stdout.write(f"{'process':<16} {'rss':>9} {'pss':>9} {'shared':>9} {'private':>9} {'swap':>8}  (MiB)")
+        privates = []
+        for role, process in [('master', master)] + [('worker', worker) for worker in workers]:
+            try:
+                totals = smaps_rollup(process.pid)
+            except OSError as e:
+                self.stderr.write(f"{role} {process.pid}: {e}")
+                continue
+            shared = totals['Shared_Clean'] + totals['Shared_Dirty']
+            private = totals['Private_Clean'] + totals['Private_Dirty']
+            if role == 'worker':
+                privates.append(private)
+            self.stdout.write(
+                f"{role + ' ' + str(process.pid):<16} {mib(totals['Rss']):>9.1f} {mib(totals['Pss']):>9.1f} "
+                f"{mib(shared):>9.1f} {mib(private):>9.1f} {mib(totals['Swap']):>8.1f}"
+            )
+
+        if privates:
+            per_worker = sum(privates) / len(privates)
+            available = psutil.virtual_memory().available
+            self.stdout.write(
+                f"\n{len(privates)} workers, {mib(per_worker):.1f} MiB private each on average. "
+                f"{mib(available):.0f} MiB available fits about {int(available // per_worker)} more workers "
+                f"(private memory grows as workers fill their caches)."
+            )
@@ -0,0 +1,66 @@
+import random
+from django.core.management.base import BaseCommand
+from Memory.aiml import init_kernel
+from Memory.match_profiler import MatchProfiler
+from Memory.respond_budget import RespondBudget, RespondBudgetExceeded
+from Memory.management.commands.compare_matcher import pattern_inputs
+
+
+class Command(BaseCommand):
+    requires_system_checks = []
+    help = "Profile kernel.respond() over a corpus of inputs and print the slowest AIML categories and <srai> chains."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus', help="File with one input per line (defaults to a sample of the learned patterns).")
+        parser.add_argument('--sample', type=int, default=2000, help="Number of learned patterns to sample.")
+        parser.add_argument('--top', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--timeout', type=float, default=5.0,
+                            help="Abandon an input after this many seconds (runaway <srai> chains).")
+
+    def handle(self, *args, **options):
+        profiler = MatchProfiler(enabled=True)
+        # only the time limit, so runaway <srai> chains show up in the report
+        budget = RespondBudget(max_srai_depth=0, max_evaluations=0, timeout=options['timeout'])
+        kernel = init_kernel(profiler=profiler, budget=budget)
+
+        if options['corpus']:
+            with open(options['corpus'], encoding='utf-8') as f:
+                corpus = [line.strip() for line in f if line.strip()]
+        else:
+            inputs = pattern_inputs(kernel._brain.tree(), kernel._brain._botName)
+            random.seed(options['seed'])
+            corpus = random.sample(inputs, min(options['sample'], len(inputs)))
+
+        random.seed(options['seed'])  # same <random> picks on every run
+        timed_out = []
+        for text in corpus:
+            try:
+                kernel.respond(text)
+            except RespondBudgetExceeded:
+                timed_out.append(text)
+
+        report = profiler.report(options['top'])
+        if timed_out:
+            self.stdout.write(self.style.WARNING(f"{len(timed_out)} inputs abandoned after {options['timeout']}s:"))
+            for text in timed_out:
+                self.stdout.write(f"  {text!r}")
+        self.stdout.write(f"{report['calls']} calls over {report['categories']} categories\n")
+        self.stdout.write(f"{'total ms':>9} {'calls':>6} {'mean':>7} {'p95':>7} {'max':>8} {'match':>6} {'srai':>4}  pattern / that / topic (file)")
+        for row in report['top_categories']:
+            self.stdout.write(
+                f"{row['total_ms']:>9.1f} {row['calls']:>6} {row['mean_ms']:>7.2f} {row['p95_ms']:>7} {row['max_ms']:>8.2f} "
+                f"{100 * row['match_share']:>5.0f}% {row['max_srai_depth']:>4}  "
+                f"{row['pattern']} / {row['that']} / {row['topic']} ({row['file']})"
+            )
+
+        self.stdout.write("\nSlowest calls:")
+        for call in report['slowest_calls'][:options['top']]:
+            self.stdout.write(
+                f"{call['total_ms']:>9.2f} ms (match {call['match_ms']:.2f} ms, {call['matches']} matches, "
+                f"srai depth {call['srai_depth']}) input {call['input_hash']} ({call['input_length']} chars)"
+            )
+            for level, pattern in call['chain'][:12]:
+                self.stdout.write(f"{'':>12}{'  ' * min(level, 20)}-> {pattern}")
+            if call['matches'] > 12:
+                self.stdout.write(f"{'':>12}... {call['matches'] - 12} more")
@@ -0,0 +1,144 @@
+import json
+import os
+import time
+from itertools import islice
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from neomodel import db
+from Memory.sentiment import sentiment_label, sentiment_service
+
+CHECKPOINT = os.path.join(settings.BASE_DIR, 'rescore_episode_parts.checkpoint.json')
+
+# One query streamed a page at a time (the driver's fetch size), in node id
+# order so a checkpoint can resume after the last id written. {id} is
+# db.get_id_method(): elementId on Neo4j 5, id before. There is no index on
+# node ids, so the parts are scanned and sorted once per run, not per page.
+READ_PARTS = """
+MATCH (p:Episode_Part)
+WHERE ($after IS NULL OR {id}(p) > $after) {missing}
+RETURN {id}(p), p.response
+ORDER BY {id}(p)
+{limit}
+"""
+
+WRITE_BATCH = """
+UNWIND $rows AS row
+MATCH (p:Episode_Part) WHERE {id}(p) = row.id
+SET p.sentiment_compound = row.compound,
+    p.sentiments = CASE WHEN p.sentiments IS NULL OR p.sentiments = '' THEN row.label ELSE p.sentiments END
+"""
+
+
+def read_checkpoint(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except ValueError as e:
+        raise CommandError(f"{path} is not a checkpoint ({e}), remove it or pass --restart.")
+
+
+def write_checkpoint(path, checkpoint):
+    # Replace the file in one step so an interrupted run never leaves half a checkpoint
+    temporary = f"{path}.tmp"
+    with open(temporary, 'w') as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(temporary, path)
+
+
+class Command(BaseCommand):
+    requires_system_checks = []
+    help = ("Score the sentiment of Episode_Part nodes a page at a time and write numeric compound scores back "
+            "(and labels where missing), resuming from a checkpoint.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page', type=int, default=10000, help="Episode_Parts read and scored per page.")
+        parser.add_argument('--batch', type=int, default=2000, help="Rows per UNWIND write.")
+        parser.add_argument('--missing-only', action='store_true',
+                            help="Only score parts without a sentiment_compound yet.")
+        parser.add_argument('--limit', type=int, default=0, help="Stop after this many parts (0 for all).")
+        parser.add_argument('--checkpoint', default=CHECKPOINT)
+        parser.add_argument('--restart', action='store_true', help="Ignore the checkpoint and start from the first part.")
+
+    def handle(self, *args, **options):
+        if options['page'] < 1 or options['batch'] < 1:
+            raise CommandError("--page and --batch must be at least 1.")
+        if sentiment_service.analyzer is None:
+            raise CommandError("The VADER lexicon is unavailable; every part would score neutral.")
+
+        id_method = db.get_id_method()
+        checkpoint = None if options['restart'] else read_checkpoint(options['checkpoint'])
+        if checkpoint and checkpoint.get('missing_only') != options['missing_only']:
+            raise CommandError(f"{options['checkpoint']} was written with"
+                               f"{'' if checkpoint.get('missing_only') else 'out'} --missing-only; "
+                               f"pass the same option or --restart.")
+        if checkpoint and checkpoint.get('id', 'id') != id_method:
+            raise CommandError(f"{options['checkpoint']} pages on {checkpoint.get('id', 'id')}() and this database "
+                               f"on {id_method}(); pass --restart.")
+        if checkpoint:
+            self.stdout.write(f"Resuming after node {checkpoint['after']} ({checkpoint['parts']} parts done)")
+        else:
+            checkpoint = {'after': None, 'id': id_method, 'parts': 0, 'lexicon_skipped': 0, 'seconds': 0.0,
+                          'missing_only': options['missing_only'], 'started_at': time.strftime('%Y-%m-%d %H:%M:%S')}
+
+        query = READ_PARTS.format(id=id_method,
+                                  missing="AND p.sentiment_compound IS NULL" if options['missing_only'] else "",
+                                  limit="LIMIT $limit" if options['limit'] else "")
+        write_batch = WRITE_BATCH.format(id=id_method)
+        read_seconds = score_seconds = write_seconds = 0.0
+        parts = 0
+        start = time.perf_counter()
+        try:
+            with db.driver.session(database=db._database_name, fetch_size=options['page']) as session:
+                result = iter(session.run(query, {'after': checkpoint['after'], 'limit': options['limit']}))
+                while True:
+                    t = time.perf_counter()
+                    rows = list(islice(result, options['page']))
+                    read_seconds += time.perf_counter() - t
+                    if not rows:
+                        break
+
+                    t = time.perf_counter()
+                    texts = [response or '' for _, response in rows]
+                    hits = sentiment_service.lexicon_hits(texts)
+                    compounds = sentiment_service.compound_many(texts, hits)
+                    score_seconds += time.perf_counter() - t
+
+                    t = time.perf_counter()
+                    updates = [{'id': node_id, 'compound': float(compound), 'label': sentiment_label(compound)}
+                               for (node_id, _), compound in zip(rows, compounds)]
+                    for i in range(0, len(updates), options['batch']):
+                        db.cypher_query(write_batch, {'rows': updates[i:i + options['batch']]})
+                    write_seconds += time.perf_counter() - t
+
+                    parts += len(rows)
+                    checkpoint['after'] = rows[-1][0]
+                    checkpoint['parts'] += len(rows)
+                    checkpoint['lexicon_skipped'] += int(len(rows) - hits.sum())
+                    checkpoint['seconds'] = round(checkpoint['seconds'] + time.perf_counter() - start, 3)
+                    start = time.perf_counter()
+                    write_checkpoint(options['checkpoint'], checkpoint)
+                    self.stdout.write(f"  {checkpoint['parts']} parts, up to node {checkpoint['after']}")
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING(f"Interrupted; rerun to resume after node {checkpoint['after']}."))
+            return
+        finally:
+            self.report(parts, read_seconds, score_seconds, write_seconds)
+
+        if options['limit'] and parts >= options['limit']:
+            self.stdout.write(f"Stopped at --limit; rerun to resume after node {checkpoint['after']}.")
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"Done: {checkpoint['parts']} parts scored in {checkpoint['seconds']:.1f}s, "
+                f"{checkpoint['lexicon_skipped']} without a lexicon word; checkpoint {options['checkpoint']}"))
+
+    def report(self, parts, read_seconds, score_seconds, write_seconds):
+        total = read_seconds + score_seconds + write_seconds
+        if not parts or not total:
+            return
+        cache = sentiment_service.stats()['cache'] or {}
+        self.stdout.write(
+            f"This run: {parts} parts in {total:.1f}s ({parts / total:.0f} parts/s); "
+            f"read {read_seconds:.1f}s, score {score_seconds:.1f}s ({parts / score_seconds if score_seconds else 0:.0f}/s), "
+            f"write {write_seconds:.1f}s; sentiment cache hit ratio {cache.get('hit_ratio', 0.0)}")
@@ -0,0 +1,207 @@
+"""
+AIML Match Profiler
+===================
+
+Opt-in profiling of LouKernel.respond() (AIML_PROFILE=1). For every
+respond call it records the matched category, the categories reached
+through <srai>, the <srai> recursion depth and the time spent matching
+patterns versus evaluating templates.
+
+Calls are aggregated per top-level category into latency histograms,
+and the slowest calls are kept with their <srai> chain (and a digest
+and the length of their input, never the user's text). Categories are
+tracked by their node in the pattern index and only turned into
+pattern/that/topic and source file when a report is requested, so the
+per-call overhead stays small. Stats restart when the brain is
+replaced by a hot reload.
+"""
+
+import hashlib
+import heapq
+import threading
+import time
+
+# Upper bounds (ms) of the latency histogram buckets
+HISTOGRAM_BOUNDS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 1000)
+
+# Slowest calls kept with their <srai> chain
+SLOW_CALLS = 25
+
+# Matches of a chain shown in a report (runaway chains have thousands)
+CHAIN_LIMIT = 50
+
+
+class MatchProbe:
+    """Stands in for a kernel's brain during one profiled respond()."""
+
+    def __init__(self, brain):
+        self._brain = brain
+        self.matches = []
+        self.match_seconds = 0.0
+        self.level = 0
+        self.depth = 0
+
+    def __getattr__(self, name):
+        return getattr(self._brain, name)
+
+    def enter(self, level):
+        """Called by LouKernel._respond() with its <srai> nesting level."""
+        self.level = level
+        self.depth = max(self.depth, level)
+
+    def match(self, pattern, that, topic):
+        start = time.perf_counter()
+        template, node = self._brain.match_node(pattern, that, topic)
+        self.match_seconds += time.perf_counter() - start
+        self.matches.append((self.level, node))
+        return template
+
+
+class CategoryStats:
+    __slots__ = ('count', 'total', 'match', 'max', 'max_depth', 'histogram')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.match = 0.0
+        self.max = 0.0
+        self.max_depth = 0
+        self.histogram = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+
+    def add(self, total, match, depth):
+        self.count += 1
+        self.total += total
+        self.match += match
+        self.max = max(self.max, total)
+        self.max_depth = max(self.max_depth, depth)
+        total_ms = total * 1000
+        for i, bound in enumerate(HISTOGRAM_BOUNDS_MS):
+            if total_ms <= bound:
+                self.histogram[i] += 1
+                break
+        else:
+            self.histogram[-1] += 1
+
+    def percentile(self, fraction):
+        """Upper bucket bound (ms) below which fraction of the calls fall."""
+        wanted = fraction * self.count
+        seen = 0
+        for i, count in enumerate(self.histogram):
+            seen += count
+            if seen >= wanted and count:
+                return HISTOGRAM_BOUNDS_MS[i] if i < len(HISTOGRAM_BOUNDS_MS) else round(self.max * 1000, 3)
+        return 0.0
+
+
+class MatchProfiler:
+    """Thread-safe aggregation of profiled respond() calls."""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._reset(None)
+
+    def _reset(self, brain):
+        self._brain = brain
+        self._categories = {}
+        self._slow = []
+        self._keys = None
+        self._files = None
+        self.calls = 0
+        self.started_at = time.strftime('%Y-%m-%d %H:%M:%S')
+
+    def reset(self):
+        with self._lock:
+            self._reset(self._brain)
+
+    def profile(self, kernel, respond, input_, sessionID):
+        """Run respond(input_, sessionID) with kernel's brain behind a MatchProbe."""
+        brain = kernel._brain
+        probe = MatchProbe(brain)
+        kernel._brain = probe
+        kernel._match_probe = probe
+        start = time.perf_counter()
+        try:
+            return respond(input_, sessionID)
+        finally:
+            total = time.perf_counter() - start
+            kernel._brain = brain
+            kernel._match_probe = None
+            self.record(brain, input_, probe, total)
+
+    def record(self, brain, input_, probe, total):
+        node = probe.matches[0][1] if probe.matches else None
+        # a digest and the length of the input, never a user's message itself
+        digest = hashlib.blake2b((input_ or '').encode('utf-8'), digest_size=8).hexdigest()
+        length = len(input_ or '')
+        with self._lock:
+            if brain is not self._brain:
+                self._reset(brain)
+            stats = self._categories.get(node)
+            if stats is None:
+                stats = self._categories[node] = CategoryStats()
+            stats.add(total, probe.match_seconds, probe.depth)
+            self.calls += 1
+            call = (total, self.calls, digest, length, tuple(probe.matches), probe.match_seconds, probe.depth)
+            if len(self._slow) < SLOW_CALLS:
+                heapq.heappush(self._slow, call)
+            elif total > self._slow[0][0]:
+                heapq.heapreplace(self._slow, call)
+
+    def _describe(self, node):
+        if node is None:
+            return {'pattern': None, 'that': None, 'topic': None, 'file': None}
+        if self._keys is None:
+            from .aiml import load_category_table
+            self._keys = self._brain.build_index().category_keys()
+            self._files = {}
+            for file_name, entry in (load_category_table() or {}).items():
+                for key, template in entry['categories']:
+                    self._files[key] = file_name
+        key = self._keys.get(node, (None, None, None))
+        return {'pattern': key[0], 'that': key[1], 'topic': key[2], 'file': self._files.get(key)}
+
+    def report(self, top=20):
+        """
+        Top categories by total time and the slowest calls. Calls that
+        matched nothing or were answered from the response cache are
+        reported with an empty pattern.
+        """
+        with self._lock:
+            categories = sorted(self._categories.items(), key=lambda item: item[1].total, reverse=True)[:top]
+            offenders = []
+            for node, stats in categories:
+                offenders.append(dict(
+                    self._describe(node),
+                    calls=stats.count,
+                    total_ms=round(stats.total * 1000, 3),
+                    mean_ms=round(stats.total * 1000 / stats.count, 3),
+                    p50_ms=stats.percentile(0.5),
+                    p95_ms=stats.percentile(0.95),
+                    max_ms=round(stats.max * 1000, 3),
+                    match_share=round(stats.match / stats.total, 3) if stats.total else 0.0,
+                    max_srai_depth=stats.max_depth,
+                    histogram=dict(zip([f"<={bound}ms" for bound in HISTOGRAM_BOUNDS_MS] + ['slower'], stats.histogram)),
+                ))
+
+            slow_calls = []
+            for total, _, digest, length, matches, match, depth in sorted(self._slow, reverse=True):
+                slow_calls.append({
+                    'input_hash': digest,
+                    'input_length': length,
+                    'total_ms': round(total * 1000, 3),
+                    'match_ms': round(match * 1000, 3),
+                    'srai_depth': depth,
+                    'matches': len(matches),
+                    # [srai level, matched pattern] in match order
+                    'chain': [[level, self._describe(node)['pattern']] for level, node in matches[:CHAIN_LIMIT]],
+                })
+
+            return {
+                'enabled': self.enabled,
+                'since': self.started_at,
+                'calls': self.calls,
+                'categories': len(self._categories),
+                'top_categories': offenders,
+                'slowest_calls': slow_calls,
+            }
@@ -1,8 +1,9 @@
-from neomodel import StructuredNode, StringProperty,BooleanProperty,IntegerProperty,UniqueIdProperty, RelationshipTo, RelationshipFrom,DateProperty,DateTimeProperty,ArrayProperty, StructuredRel
+from neomodel import db, StructuredNode, StringProperty,BooleanProperty,IntegerProperty,FloatProperty,UniqueIdProperty, RelationshipTo, RelationshipFrom,DateProperty,DateTimeProperty,ArrayProperty, StructuredRel
 from django.conf import settings
 from datetime import datetime
 from django.db import models
 from uuid import uuid4
+from .sentiment import NEGATIVE_THRESHOLD, POSITIVE_THRESHOLD
 import base64
 
 class WebAuthnCredential(StructuredNode):
@@ -48,6 +49,13 @@ class Signups(StructuredNode):
     class Meta:
         labels = ["Signups","Person"]
 
+    def post_save(self):
+        # neomodel hook: every change to a user (login ip, password, profile
+        # picture, WebAuthn) drops this process's cached copy, see Memory/user_cache.py
+        from .user_cache import user_cache
+        if self.uid:
+            user_cache.invalidate(self.uid)
+
 
 class History_Chat(StructuredNode):
     uid = StringProperty()
@@ -63,6 +71,7 @@ class Episode_Part(StructuredNode):
     name = StringProperty()
     response = StringProperty()
     sentiments = StringProperty(default=None,blank=True)
+    sentiment_compound = FloatProperty(default=None)
     created_at = StringProperty(default=lambda: datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
 
     relation = RelationshipFrom('Session_History', 'HAS_CHAT')
@@ -73,15 +82,135 @@ class Session_History(StructuredNode):
     start_session = DateTimeProperty(default_now=True)
     overall_sentiments = StringProperty(default='neutral')
     memory_list = ArrayProperty(StringProperty())
+    # Running VADER sums over the first sentiment_count messages of the transcript
+    sentiment_compound = FloatProperty(default=0.0)
+    sentiment_positive = FloatProperty(default=0.0)
+    sentiment_negative = FloatProperty(default=0.0)
+    sentiment_neutral = FloatProperty(default=0.0)
+    sentiment_count = IntegerProperty(default=0)
 
-    def save_message(self, message_type, message_content):
-        if self.memory_list is None:
-            self.memory_list = []
+    @staticmethod
+    def sentiment_delta(scores):
+        """What the VADER scores of new messages add to the running sums."""
+        return {'compound': sum(score['compound'] for score in scores), 'positive': sum(score['pos'] for score in scores),
+                'negative': sum(score['neg'] for score in scores), 'neutral': sum(score['neu'] for score in scores),
+                'count': len(scores)}
+
+    def mean_compound(self):
+        return self.sentiment_compound / self.sentiment_count if self.sentiment_count else 0.0
 
+    # Chat_Messages appended to the transcript; memory_list only holds a
+    # transcript from before Chat_Message, until it is migrated
+    message_count = IntegerProperty(default=0)
+
+    transcript = RelationshipTo('Chat_Message', 'HAS_MESSAGE')
+
+    def save_message(self, message_type, message_content):
+        self.append_messages([(message_type, message_content)])
+
+    def append_messages(self, messages, scores=(), **properties):
+        """
+        Append (message_type, content) messages to the transcript in one
+        statement that never reads or rewrites the earlier messages, add the
+        VADER scores of newly scored messages to the running sums and set
+        properties on the session in the same write. A legacy memory_list is
+        moved into the transcript first.
+
+        The sums are incremented in Cypher, so concurrent turns on a session
+        do not overwrite each other's scores.
+        """
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        formatted_message = f"{timestamp} - {message_type}: {message_content}"
-        self.memory_list.append(formatted_message)
-        self.save()
+        rows = [{'name': name, 'content': content, 'created_at': timestamp} for name, content in messages]
+        if self.memory_list:
+            rows = [parse_memory_line(line) for line in self.memory_list] + rows
+            properties['memory_list'] = None
+        results, _ = self.cypher(APPEND_MESSAGES.format(id=db.get_id_method()), {
+            'messages': rows, 'properties': properties, 'sentiment': self.sentiment_delta(list(scores)),
+            'positive': POSITIVE_THRESHOLD, 'negative': NEGATIVE_THRESHOLD})
+        for name, value in properties.items():
+            setattr(self, name, value)
+        if results:
+            (self.message_count, self.sentiment_compound, self.sentiment_positive, self.sentiment_negative,
+             self.sentiment_neutral, self.sentiment_count, self.overall_sentiments) = results[0]
+
+    def transcript_length(self):
+        return (self.message_count or 0) + len(self.memory_list or [])
+
+    def messages(self, offset=0, limit=50):
+        """Transcript messages from seq offset on, oldest first, at most limit of them (None for all)."""
+        stored = []
+        if offset < (self.message_count or 0):
+            results, _ = self.cypher(READ_MESSAGES.format(id=db.get_id_method()),
+                                     {'offset': offset, 'limit': limit if limit is not None else self.message_count})
+            stored = [Chat_Message.inflate(row[0]) for row in results]
+        legacy = [Chat_Message(seq=(self.message_count or 0) + i, **parse_memory_line(line))
+                  for i, line in enumerate(self.memory_list or [])]
+        messages = stored + [message for message in legacy if message.seq >= offset]
+        return messages[:limit] if limit is not None else messages
+
+    def last_messages(self, limit, message_type=None):
+        """The last limit messages (of message_type, if given), oldest first."""
+        legacy = [Chat_Message(seq=(self.message_count or 0) + i, **parse_memory_line(line))
+                  for i, line in enumerate(self.memory_list or [])]
+        latest = [message for message in legacy if message_type in (None, message.name)][-limit:]
+        if len(latest) < limit and self.message_count:
+            results, _ = self.cypher(LAST_MESSAGES.format(id=db.get_id_method()),
+                                     {'name': message_type, 'limit': limit - len(latest)})
+            latest = [Chat_Message.inflate(row[0]) for row in reversed(results)] + latest
+        return latest
+
+
+class Chat_Message(StructuredNode):
+    uid = StringProperty()
+    seq = IntegerProperty()
+    name = StringProperty()
+    content = StringProperty()
+    created_at = StringProperty(default=lambda: datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+
+    session = RelationshipFrom('Session_History', 'HAS_MESSAGE')
+
+
+def parse_memory_line(line):
+    """Split a legacy memory_list entry, "<timestamp> - <User|Bot>: <content>"."""
+    created_at, _, message = line.partition(' - ')
+    name, _, content = message.partition(': ')
+    return {'name': name, 'content': content, 'created_at': created_at}
+
+
+# Writing message_count first takes the session's write lock, so concurrent
+# appends read the count one after the other and get distinct seqs, and
+# add to the sentiment sums one after the other
+APPEND_MESSAGES = """
+MATCH (s:Session_History) WHERE {id}(s) = $self
+SET s.message_count = coalesce(s.message_count, 0)
+WITH s, s.message_count AS base
+SET s.message_count = base + size($messages), s += $properties,
+    s.sentiment_compound = coalesce(s.sentiment_compound, 0.0) + $sentiment.compound,
+    s.sentiment_positive = coalesce(s.sentiment_positive, 0.0) + $sentiment.positive,
+    s.sentiment_negative = coalesce(s.sentiment_negative, 0.0) + $sentiment.negative,
+    s.sentiment_neutral = coalesce(s.sentiment_neutral, 0.0) + $sentiment.neutral,
+    s.sentiment_count = coalesce(s.sentiment_count, 0) + $sentiment.count
+SET s.overall_sentiments = CASE
+    WHEN s.sentiment_count = 0 THEN s.overall_sentiments
+    WHEN s.sentiment_compound / s.sentiment_count >= $positive THEN 'Positive sentiments'
+    WHEN s.sentiment_compound / s.sentiment_count <= $negative THEN 'Negative sentiments'
+    ELSE 'Neutral sentiments' END
+FOREACH (i IN range(0, size($messages) - 1) |
+    CREATE (s)-[:HAS_MESSAGE]->(:Chat_Message {{uid: s.uid, seq: base + i, name: $messages[i].name,
+                                                content: $messages[i].content, created_at: $messages[i].created_at}}))
+RETURN s.message_count, s.sentiment_compound, s.sentiment_positive, s.sentiment_negative,
+       s.sentiment_neutral, s.sentiment_count, s.overall_sentiments
+"""
+
+READ_MESSAGES = """
+MATCH (s:Session_History)-[:HAS_MESSAGE]->(m:Chat_Message) WHERE {id}(s) = $self AND m.seq >= $offset
+RETURN m ORDER BY m.seq LIMIT $limit
+"""
+
+LAST_MESSAGES = """
+MATCH (s:Session_History)-[:HAS_MESSAGE]->(m:Chat_Message) WHERE {id}(s) = $self AND ($name IS NULL OR m.name = $name)
+RETURN m ORDER BY m.seq DESC LIMIT $limit
+"""
 
 class Person(StructuredNode):
     uid = StringProperty(blank=True)
@@ -1,34 +1,17 @@
 """
 Natural Language Processing utilities for LouBot
 """
-from nltk.sentiment.vader import SentimentIntensityAnalyzer
-import nltk
+from .sentiment import sentiment_service
 
-# Initialize VADER sentiment analyzer
-try:
-    analyzer = SentimentIntensityAnalyzer()
-except LookupError:
-    # Download VADER lexicon if not available
-    try:
-        nltk.download('vader_lexicon', quiet=True)
-        analyzer = SentimentIntensityAnalyzer()
-    except:
-        analyzer = None
+# The process-wide VADER analyzer (None without the lexicon)
+analyzer = sentiment_service.analyzer
 
 def analyze_sentiment(text):
     """
     Analyze sentiment of text using VADER sentiment analyzer
     Returns: dict with compound, pos, neu, neg scores
     """
-    if analyzer is None:
-        return {'compound': 0.0, 'pos': 0.0, 'neu': 1.0, 'neg': 0.0}
-    
-    try:
-        scores = analyzer.polarity_scores(text)
-        return scores
-    except Exception as e:
-        print(f"Sentiment analysis error: {e}")
-        return {'compound': 0.0, 'pos': 0.0, 'neu': 1.0, 'neg': 0.0}
+    return sentiment_service.score(text)
 
 def get_sentiment_label(compound_score):
     """
@@ -0,0 +1,379 @@
+"""
+Indexed AIML Pattern Matcher
+============================
+
+Drop-in replacement for aiml's PatternMgr matching.
+
+The learned pattern graph is flattened into a word-interned trie: every
+pattern word gets an integer id, every node gets an integer id, and each
+node keeps a sorted table of exact-word edges plus the ids of its "_",
+"*", bot-name, <that> and <topic> children. Input words are interned once
+per match, so words that occur in no pattern never hit an edge lookup.
+
+Matching follows PatternMgr._match() exactly (same priority order of
+"_", exact word, bot name and "*", same backtracking, same match path),
+so PatternMgr.star() and everything in Kernel keep working. On top of
+that the matcher:
+    - remembers states that already failed for the current input, which
+      removes the repeated wildcard re-expansion behind slow matches
+    - sends a wildcard whose child cannot consume words (the usual
+      trailing "*" and the default <that>/<topic> "*") straight to the
+      end of the input instead of trying every split
+
+The index is the primary representation. The nested-dict tree used by
+PatternMgr.add()/save() is rebuilt from it on demand (tree()), and the
+index is rebuilt lazily after the tree changes.
+"""
+
+import marshal
+import sys
+import threading
+from array import array
+from bisect import bisect_left
+
+from aiml.PatternMgr import PatternMgr
+
+_NO_NODE = -1
+_PATTERN, _THAT_PHASE, _TOPIC_PHASE = 0, 1, 2
+
+
+class PatternIndex:
+    """
+    Flattened, word-interned copy of a PatternMgr node tree.
+
+    Storage is kept compact so every worker can afford a full brain:
+        - per-node columns (special children, template ids) are int arrays
+        - exact-word edges form one array-backed table: the edges of node n
+          are edge_word/edge_child[edge_start[n]:edge_start[n + 1]],
+          sorted by word id and searched with bisect
+        - templates are marshal blobs in a single bytes buffer, identical
+          templates stored once, and are decoded when they are matched
+    """
+
+    def __init__(self, root):
+        self.words = []
+        self.vocabulary = {}
+        self.underscore = array('i')
+        self.star = array('i')
+        self.bot_name = array('i')
+        self.that = array('i')
+        self.topic = array('i')
+        self.template_id = array('i')
+        self.root = self._build(root)
+        self.consumes = bytearray(
+            self.edge_start[node] != self.edge_start[node + 1] or self.underscore[node] != _NO_NODE
+            or self.star[node] != _NO_NODE or self.bot_name[node] != _NO_NODE
+            for node in range(len(self.template_id))
+        )
+
+    def __len__(self):
+        return len(self.template_id)
+
+    def _new_node(self):
+        for column in (self.underscore, self.star, self.bot_name, self.that, self.topic, self.template_id):
+            column.append(_NO_NODE)
+        return len(self.template_id) - 1
+
+    def _special_children(self):
+        return {
+            PatternMgr._UNDERSCORE: self.underscore,
+            PatternMgr._STAR: self.star,
+            PatternMgr._BOT_NAME: self.bot_name,
+            PatternMgr._THAT: self.that,
+            PatternMgr._TOPIC: self.topic,
+        }
+
+    def _word_id(self, word):
+        word_id = self.vocabulary.get(word)
+        if word_id is None:
+            word = sys.intern(word)
+            word_id = self.vocabulary[word] = len(self.words)
+            self.words.append(word)
+        return word_id
+
+    def _build(self, root):
+        special = self._special_children()
+        node_edges = []
+        blobs = bytearray()
+        offsets = array('q', [0])
+        blob_ids = {}
+        root_id = self._new_node()
+        node_edges.append(None)
+        stack = [(root, root_id)]
+        while stack:
+            node, node_id = stack.pop()
+            edges = []
+            for key, child in node.items():
+                if key == PatternMgr._TEMPLATE:
+                    blob = marshal.dumps(child)
+                    template_id = blob_ids.get(blob)
+                    if template_id is None:
+                        template_id = blob_ids[blob] = len(offsets) - 1
+                        blobs += blob
+                        offsets.append(len(blobs))
+                    self.template_id[node_id] = template_id
+                    continue
+                child_id = self._new_node()
+                node_edges.append(None)
+                if key in special:
+                    special[key][node_id] = child_id
+                else:
+                    edges.append((self._word_id(key), child_id))
+                stack.append((child, child_id))
+            if edges:
+                edges.sort()
+                node_edges[node_id] = edges
+
+        self.edge_start = array('i', [0])
+        self.edge_word = array('i')
+        self.edge_child = array('i')
+        for edges in node_edges:
+            if edges:
+                for word_id, child_id in edges:
+                    self.edge_word.append(word_id)
+                    self.edge_child.append(child_id)
+            self.edge_start.append(len(self.edge_word))
+        self.template_offsets = offsets
+        self.template_data = bytes(blobs)
+        return root_id
+
+    def template(self, node):
+        """Decode the template stored at node, or None."""
+        template_id = self.template_id[node]
+        if template_id == _NO_NODE:
+            return None
+        offsets = self.template_offsets
+        return marshal.loads(self.template_data[offsets[template_id]:offsets[template_id + 1]])
+
+    def to_tree(self):
+        """Rebuild the PatternMgr nested-dict tree."""
+        special = self._special_children()
+        trees = [{} for _ in range(len(self.template_id))]
+        for node_id, tree in enumerate(trees):
+            for i in range(self.edge_start[node_id], self.edge_start[node_id + 1]):
+                tree[self.words[self.edge_word[i]]] = trees[self.edge_child[i]]
+            for key, children in special.items():
+                if children[node_id] != _NO_NODE:
+                    tree[key] = trees[children[node_id]]
+            if self.template_id[node_id] != _NO_NODE:
+                tree[PatternMgr._TEMPLATE] = self.template(node_id)
+        return trees[self.root]
+
+    def intern(self, words):
+        lookup = self.vocabulary.get
+        return [lookup(word, _NO_NODE) for word in words]
+
+    def match(self, words, that_words, topic_words, bot_name):
+        """Return (path, template) in the same form as PatternMgr._match()."""
+        path, node = self.find(words, that_words, topic_words, bot_name)
+        return path, None if node is None else self.template(node)
+
+    def category_keys(self):
+        """Return {template node: (pattern, that, topic)} as the categories were learned."""
+        names = {
+            PatternMgr._UNDERSCORE: '_', PatternMgr._STAR: '*', PatternMgr._BOT_NAME: 'BOT_NAME',
+        }
+        special = self._special_children()
+        keys = {}
+        stack = [(self.root, ((), (), ()), _PATTERN)]
+        while stack:
+            node, segments, phase = stack.pop()
+            if self.template_id[node] != _NO_NODE:
+                keys[node] = tuple(' '.join(segment) for segment in segments)
+            for i in range(self.edge_start[node], self.edge_start[node + 1]):
+                word = self.words[self.edge_word[i]]
+                stack.append((self.edge_child[i], segments[:phase] + (segments[phase] + (word,),) + segments[phase + 1:], phase))
+            for key, children in special.items():
+                child = children[node]
+                if child == _NO_NODE:
+                    continue
+                if key == PatternMgr._THAT:
+                    stack.append((child, segments, _THAT_PHASE))
+                elif key == PatternMgr._TOPIC:
+                    stack.append((child, segments, _TOPIC_PHASE))
+                else:
+                    stack.append((child, segments[:phase] + (segments[phase] + (names[key],),) + segments[phase + 1:], phase))
+        return keys
+
+    def find(self, words, that_words, topic_words, bot_name):
+        """Return (path, template node) of the best match, or (None, None)."""
+        phrases = (words, that_words, topic_words)
+        ids = (self.intern(words), self.intern(that_words), self.intern(topic_words))
+        lengths = (len(words), len(that_words), len(topic_words))
+        stride = max(lengths) + 1
+
+        edge_start, edge_word, edge_child = self.edge_start, self.edge_word, self.edge_child
+        underscore, star, consumes = self.underscore, self.star, self.consumes
+        bot_name_child, that, topic, template_id = self.bot_name, self.that, self.topic, self.template_id
+        failed = set()
+        matched = [None]
+
+        def walk(node, pos, phase):
+            # Returns the match path in reverse order, or None.
+            state = node * stride + pos
+            if state in failed:
+                return None
+            length = lengths[phase]
+
+            if pos == length:
+                path = None
+                if phase == _PATTERN and lengths[_THAT_PHASE]:
+                    if that[node] != _NO_NODE:
+                        path = walk(that[node], 0, _THAT_PHASE)
+                        if path is not None:
+                            path.append(PatternMgr._THAT)
+                elif phase != _TOPIC_PHASE and lengths[_TOPIC_PHASE]:
+                    if topic[node] != _NO_NODE:
+                        path = walk(topic[node], 0, _TOPIC_PHASE)
+                        if path is not None:
+                            path.append(PatternMgr._TOPIC)
+                if path is None and template_id[node] != _NO_NODE:
+                    matched[0] = node
+                    path = []
+                if path is None:
+                    failed.add(state)
+                return path
+
+            child = underscore[node]
+            if child != _NO_NODE:
+                for end in range(pos + 1 if consumes[child] else length, length + 1):
+                    path = walk(child, end, phase)
+                    if path is not None:
+                        path.append(PatternMgr._UNDERSCORE)
+                        return path
+
+            lo, hi = edge_start[node], edge_start[node + 1]
+            if lo != hi:
+                word_id = ids[phase][pos]
+                i = bisect_left(edge_word, word_id, lo, hi)
+                if i != hi and edge_word[i] == word_id:
+                    path = walk(edge_child[i], pos + 1, phase)
+                    if path is not None:
+                        path.append(phrases[phase][pos])
+                        return path
+
+            child = bot_name_child[node]
+            if child != _NO_NODE and phrases[phase][pos] == bot_name:
+                path = walk(child, pos + 1, phase)
+                if path is not None:
+                    path.append(phrases[phase][pos])
+                    return path
+
+            child = star[node]
+            if child != _NO_NODE:
+                for end in range(pos + 1 if consumes[child] else length, length + 1):
+                    path = walk(child, end, phase)
+                    if path is not None:
+                        path.append(PatternMgr._STAR)
+                        return path
+
+            failed.add(state)
+            return None
+
+        path = walk(self.root, 0, _PATTERN)
+        if path is None:
+            return None, None
+        path.reverse()
+        return path, matched[0]
+
+
+class IndexedPatternMgr(PatternMgr):
+    """PatternMgr whose matching runs on a PatternIndex."""
+
+    def __init__(self):
+        self._tree = None
+        self._index = None
+        self._index_lock = threading.Lock()
+        # (fingerprint, {file_name: digest}) of the corpus, set by Memory.aiml.build_brain()
+        self.corpus = None
+        super().__init__()
+
+    @classmethod
+    def from_brain(cls, brain):
+        indexed = cls()
+        indexed._templateCount = brain._templateCount
+        indexed._botName = brain._botName
+        indexed._root = brain._root
+        indexed.build_index()
+        return indexed
+
+    @classmethod
+    def from_index(cls, index, template_count, bot_name):
+        indexed = cls()
+        indexed._templateCount = template_count
+        indexed._botName = bot_name
+        indexed._tree = None
+        indexed._index = index
+        return indexed
+
+    def tree(self):
+        """Return aiml's nested-dict tree, rebuilding it from the index if needed."""
+        if self._tree is None:
+            self._tree = self._index.to_tree() if self._index is not None else {}
+        return self._tree
+
+    @property
+    def _root(self):
+        # PatternMgr.match()/star() hand _root to _match(), which ignores it,
+        # so reading it must not rebuild the tree. Callers that need the
+        # tree use tree().
+        return self._tree if self._tree is not None else {}
+
+    @_root.setter
+    def _root(self, tree):
+        self._tree = tree
+        self._index = None
+
+    def build_index(self):
+        """Index the current tree and release it; the index becomes the brain."""
+        with self._index_lock:
+            if self._index is None:
+                self._index = PatternIndex(self.tree())
+                self._tree = None
+            return self._index
+
+    def add(self, data, template):
+        # PatternMgr.add() walks _root, so the tree has to exist first
+        self.tree()
+        super().add(data, template)
+        self._index = None
+
+    def save(self, filename):
+        self.tree()
+        super().save(filename)
+
+    def dump(self):
+        self.tree()
+        super().dump()
+
+    def match_node(self, pattern, that, topic):
+        """
+        PatternMgr.match() that also returns the matched template node of
+        the index (for category_keys()): (template, node), or (None, None).
+        """
+        if len(pattern) == 0:
+            return None, None
+        input_ = self._puncStripRE.sub(" ", pattern.upper())
+        if that.strip() == "":
+            that = "ULTRABOGUSDUMMYTHAT"  # 'that' must never be empty
+        thatInput = self._whitespaceRE.sub(" ", self._puncStripRE.sub(" ", that.upper()))
+        if topic.strip() == "":
+            topic = "ULTRABOGUSDUMMYTOPIC"  # 'topic' must never be empty
+        topicInput = self._puncStripRE.sub(" ", topic.upper())
+
+        index = self._index
+        if index is None:
+            index = self.build_index()
+        path, node = index.find(input_.split(), thatInput.split(), topicInput.split(), self._botName)
+        if node is None:
+            return None, None
+        return index.template(node), node
+
+    def match(self, pattern, that, topic):
+        return self.match_node(pattern, that, topic)[0]
+
+    def _match(self, words, thatWords, topicWords, root):
+        index = self._index
+        if index is None:
+            index = self.build_index()
+        return index.match(words, thatWords, topicWords, self._botName)
@@ -0,0 +1,98 @@
+"""
+AIML Predicate Actions
+======================
+
+Registry of the actions a chat turn runs when the AIML response sets
+certain predicates (relationship lookups, social network updates,
+drone commands).
+
+Handlers are registered with @predicate_action and dispatched from the
+predicates the kernel reports as set by the response
+(LouKernel.changed_predicates()), so a turn whose templates set no
+action predicate does no predicate work at all. Only the first
+triggered handler in registration order runs, like the elif chain it
+replaces.
+
+The handler runs after the turn's kernel went back to the pool (see
+Memory/kernel_pool.py), so handlers do not see the kernel: the
+predicates named in clear= are reset before it is returned, and
+turn.finish() binds the response in a checkout of its own.
+"""
+
+
+class ChatTurn:
+    """
+    State of one chat message shared with the action handlers.
+
+    bot_response is bound from the deferred kernel response on first use,
+    so handlers that fill in deferred slots can call finish() instead.
+    """
+
+    def __init__(self, request, message, session, current_user, changed, finish):
+        self.request = request
+        self.message = message
+        self.session = session
+        self.current_user = current_user
+        self.changed = changed
+        self._finish = finish
+        self._bot_response = None
+
+    def finish(self, **slots):
+        self._bot_response = self._finish(**slots)
+        return self._bot_response
+
+    @property
+    def bot_response(self):
+        if self._bot_response is None:
+            self.finish()
+        return self._bot_response
+
+    @bot_response.setter
+    def bot_response(self, value):
+        self._bot_response = value
+
+
+# predicate name -> [(priority, handler)]
+_handlers_by_predicate = {}
+_registered = []
+
+
+def predicate_action(*names, match='all', clear=False):
+    """
+    Register handler(turn) for when the response sets the predicates in
+    names (all of them, or any of them with match='any') to a non-empty
+    value. With clear=True those predicates are reset to "" when the
+    handler is triggered. The handler returns an HttpResponse to end the
+    turn, or None to carry on with the default reply.
+    """
+    if match not in ('all', 'any'):
+        raise ValueError("match must be 'all' or 'any'")
+
+    def register(handler):
+        entry = (len(_registered), names, match, handler, clear)
+        _registered.append(entry)
+        for name in names:
+            _handlers_by_predicate.setdefault(name, []).append(entry)
+        return handler
+    return register
+
+
+def _triggered(names, match, changed):
+    values = [changed.get(name) for name in names]
+    return all(values) if match == 'all' else any(values)
+
+
+def triggered_action(changed):
+    """(handler, predicates to clear) of the first handler triggered by changed, or None."""
+    if not changed:
+        return None
+    candidates = {}
+    for name, value in changed.items():
+        if value:
+            for entry in _handlers_by_predicate.get(name, ()):
+                candidates[entry[0]] = entry
+    for priority in sorted(candidates):
+        _, names, match, handler, clear = candidates[priority]
+        if _triggered(names, match, changed):
+            return handler, names if clear else ()
+    return None
@@ -0,0 +1,73 @@
+"""
+Pre-fork Loading
+================
+
+Lets a pre-forking server (gunicorn with preload_app, see gunicorn.conf.py)
+load the large read-only state once in the master:
+
+    - the AIML brain and kernel pool (Memory/views.py, via the URLconf)
+    - the YOLO detection config and dependency check
+    - the VADER sentiment lexicon (Memory/sentiment.py)
+
+freeze() moves everything the master allocated into the GC's permanent
+generation right before each fork. The cyclic GC then never touches
+those objects in a worker, so their pages stay shared copy-on-write
+instead of being copied the first time a worker collects.
+
+Use `python manage.py prefork_memory` to see how much of each worker is
+shared with the master and how much is private.
+"""
+
+import gc
+import time
+
+_master = False
+
+
+def in_master():
+    """True in a pre-fork master process, where no background threads may run."""
+    return _master
+
+
+def warm():
+    """Load the shared state in the master process."""
+    global _master
+    _master = True
+    start = time.time()
+
+    # Memory.views builds the kernel pool at import; importing it through the
+    # URLconf (like the first request would) avoids the views <-> urls cycle.
+    from django.urls import get_resolver
+    get_resolver().url_patterns
+
+    from .sentiment import sentiment_service
+    if sentiment_service.analyzer is None:
+        print("VADER lexicon unavailable, sentiment scores will be neutral")
+
+    # The detector model itself is still loaded per worker: torch's thread
+    # pools do not survive fork().
+    try:
+        from Sensory_Memory.detection_config import get_yolo_config, check_yolo_dependencies
+        config = get_yolo_config()
+        available, message = check_yolo_dependencies()
+        print(f"YOLO config loaded (enabled={config['enabled']}): {message}")
+    except Exception as e:
+        print(f"YOLO config not loaded: {e}")
+
+    # Drop load-time garbage now so it is not frozen into every worker
+    gc.collect()
+    print("Pre-fork master warmed in %.2f seconds" % (time.time() - start))
+
+
+def freeze():
+    """Call right before fork(): keep the master's objects out of the workers' GC."""
+    gc.freeze()
+
+
+def after_fork():
+    """Call in each worker right after fork()."""
+    global _master
+    _master = False
+    from django.conf import settings
+    from . import views
+    views.brain_reloader.start_watcher(settings.AIML_RELOAD_INTERVAL)
@@ -0,0 +1,52 @@
+"""
+Chat Repository
+===============
+
+Single-statement Cypher writes for the chat's hot paths, in place of
+neomodel's one round trip per get(), save() and connect().
+
+create_episode_turn() stores one chat turn of extend_episode() (see
+Memory/views.py): both Episode_Parts, with their sentiment, linked to
+the day's Session_History in one atomic statement, where the neomodel
+path took five round trips. Compare the two with
+`python manage.py benchmark_episode_writes`.
+"""
+
+from datetime import datetime
+from neomodel import db
+from .sentiment import sentiment_label, sentiment_service
+
+EPISODE_TURN = """
+MATCH (s:Session_History {uid: $uid, name: $episode})
+WITH s LIMIT 1
+CREATE (s)-[:HAS_CHAT]->(:Episode_Part {uid: $uid, name: 'Bot', response: $bot, sentiments: $bot_label,
+                                        sentiment_compound: $bot_compound, created_at: $created_at})
+CREATE (s)-[:HAS_CHAT]->(:Episode_Part {uid: $uid, name: 'User', response: $user, sentiments: $user_label,
+                                        sentiment_compound: $user_compound, created_at: $created_at})
+RETURN count(s)
+"""
+
+
+def episode_name(day=None):
+    """Name of the Session_History of day (today by default)."""
+    return f"Episode - {(day or datetime.now()).strftime('%Y-%m-%d')}"
+
+
+def create_episode_turn(uid, episode, user, bot, created_at=None):
+    """
+    Add the Bot and User Episode_Parts of a turn to the episode named
+    episode, scoring their sentiment. False if there is no such episode.
+    """
+    bot_compound, user_compound = (scores['compound'] for scores in sentiment_service.score_many([bot, user]))
+    results, _ = db.cypher_query(EPISODE_TURN, {
+        'uid': uid,
+        'episode': episode,
+        'user': user,
+        'bot': bot,
+        'user_label': sentiment_label(user_compound),
+        'bot_label': sentiment_label(bot_compound),
+        'user_compound': user_compound,
+        'bot_compound': bot_compound,
+        'created_at': created_at or datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+    })
+    return bool(results and results[0][0])
@@ -0,0 +1,72 @@
+"""
+AIML Respond Budget
+===================
+
+Per-call limits on LouKernel.respond() (see Memory/aiml.py), so one
+input that sets off a long or runaway <srai> chain cannot hold a worker
+and a pooled kernel for seconds:
+
+    - max_srai_depth: nesting of <srai>/<sr> redirections
+    - max_evaluations: template elements evaluated, over all <srai>s
+    - timeout: wall-clock seconds for the whole respond()
+
+A limit of 0 disables it. When a limit is hit respond() raises
+RespondBudgetExceeded, with the kernel's input stack already reset, and
+the chat view answers with its fallback reply. The budget is shared by
+the kernels of the pool and counts the overruns per limit; the last
+overrun is kept as the limit and a hash of the input, not the input.
+"""
+
+import hashlib
+import threading
+import time
+
+
+class RespondBudgetExceeded(Exception):
+    """Raised out of LouKernel.respond() when an input runs over its budget."""
+
+    def __init__(self, limit):
+        super().__init__(f"AIML respond budget exceeded: {limit}")
+        self.limit = limit
+
+
+class RespondBudget:
+    """Thread-safe respond() limits and overrun counters."""
+
+    LIMITS = ('srai_depth', 'evaluations', 'timeout')
+
+    def __init__(self, max_srai_depth=30, max_evaluations=5000, timeout=2.0):
+        self.max_srai_depth = max_srai_depth
+        self.max_evaluations = max_evaluations
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self.responds = 0
+        self.exceeded = dict.fromkeys(self.LIMITS, 0)
+        self.last_exceeded = None
+
+    def deadline(self):
+        """Monotonic time a respond() starting now has to finish by, or None."""
+        return time.monotonic() + self.timeout if self.timeout > 0 else None
+
+    def record(self, limit=None, input_=None):
+        with self._lock:
+            self.responds += 1
+            if limit is not None:
+                self.exceeded[limit] += 1
+                # a digest and the length of the input, never a user's message itself
+                digest = hashlib.blake2b((input_ or '').encode('utf-8'), digest_size=8).hexdigest()
+                self.last_exceeded = {'limit': limit, 'input_hash': digest, 'input_length': len(input_ or ''),
+                                      'at': time.strftime('%Y-%m-%d %H:%M:%S')}
+
+    def stats(self):
+        with self._lock:
+            overruns = sum(self.exceeded.values())
+            return {
+                'max_srai_depth': self.max_srai_depth,
+                'max_evaluations': self.max_evaluations,
+                'timeout': self.timeout,
+                'responds': self.responds,
+                'exceeded': dict(self.exceeded),
+                'exceeded_ratio': round(overruns / self.responds, 6) if self.responds else 0.0,
+                'last_exceeded': self.last_exceeded,
+            }
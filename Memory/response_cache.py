@@ -0,0 +1,94 @@
+"""
+AIML Response Cache
+===================
+
+LRU cache in front of the kernel's pattern matching and template
+evaluation (see LouKernel._respond in Memory/aiml.py).
+
+An entry is keyed by the normalized input and the <that>/topic context.
+Each key holds a few variants. Each variant records the predicates its
+template read, with their values, and is only served while those
+predicates still hold the same values. Templates that set predicates,
+use randomness, the clock or history, or produce dynamic {{...}}
+placeholders are never stored.
+"""
+
+import threading
+from collections import OrderedDict
+
+# Different predicate values cached per input/context key
+MAX_VARIANTS_PER_KEY = 4
+
+
+class ResponseCache:
+    """Thread-safe LRU of kernel responses with predicate dependencies."""
+
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.uncacheable = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def lookup(self, keys, get_predicate):
+        """
+        Return the cached response for the first key that has a variant
+        whose dependencies still hold, or None.
+        """
+        with self._lock:
+            for key in keys:
+                variants = self._entries.get(key)
+                if not variants:
+                    continue
+                for depends, response in variants:
+                    if all(get_predicate(name) == value for name, value in depends):
+                        self._entries.move_to_end(key)
+                        self.hits += 1
+                        return response
+            self.misses += 1
+            return None
+
+    def store(self, key, depends, response):
+        depends = tuple(sorted(depends.items()))
+        with self._lock:
+            variants = self._entries.get(key)
+            if variants is None:
+                variants = self._entries[key] = []
+            else:
+                self._entries.move_to_end(key)
+                variants[:] = [v for v in variants if v[0] != depends]
+            variants.append((depends, response))
+            if len(variants) > MAX_VARIANTS_PER_KEY:
+                del variants[0]
+                self.evictions += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def reject(self):
+        with self._lock:
+            self.uncacheable += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'uncacheable': self.uncacheable,
+            }
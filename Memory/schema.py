@@ -0,0 +1,136 @@
+"""
+Neo4j Schema
+============
+
+The indexes and uniqueness constraints behind the chat's hot lookups,
+and the lookups themselves. Without them every `Signups.nodes.filter(uid=...)`,
+`Session_History.nodes.get(uid=..., name=...)` or `MATCH (p:Person {...})`
+scans every node of its label.
+
+`python manage.py bootstrap_schema` creates whatever is missing (every
+statement is IF NOT EXISTS, so it can be rerun at each deploy) and then
+checks with EXPLAIN that each query in hot_queries() plans an index seek
+rather than a label scan. Add a lookup to hot_queries() together with
+the index it needs.
+"""
+
+from neomodel.match import QueryBuilder
+from .history_writer import OUTDATED_SESSIONS, WRITE_TURNS
+from .models import (Attribute, History_Chat, Person, SensoryMemory, Sensor, Session_History, Signups,
+                     SocialNetwork, TextSensor)
+from .repository import EPISODE_TURN
+
+# (kind, label, properties): 'unique' is a uniqueness constraint, which
+# brings its own index, 'index' a plain range index
+SCHEMA = [
+    ('unique', 'Signups', ('email',)),
+    ('unique', 'Signups', ('uid',)),
+    ('index', 'Signups', ('ip',)),
+    ('unique', 'History_Chat', ('uid',)),
+    ('unique', 'Session_History', ('uid', 'name')),
+    # Signups are Person nodes too
+    ('index', 'Person', ('uid', 'full_name')),
+    ('index', 'Person', ('full_name',)),
+    ('index', 'Attribute', ('attribute',)),
+    # The model declares uid unique, but it holds the session of the user
+    # whose contact this is, shared by all their contacts
+    ('index', 'SocialNetwork', ('name', 'uid')),
+    ('unique', 'SensoryMemory', ('uid',)),
+    ('unique', 'TextSensor', ('uid',)),
+    ('index', 'Sensor', ('uid', 'name')),
+    ('unique', 'WebAuthnCredential', ('credential_id',)),
+]
+
+# Operators that read every node of a label (or of the graph, or of an index)
+SCANS = {'AllNodesScan', 'NodeByLabelScan', 'NodeIndexScan', 'NodeIndexContainsScan', 'NodeIndexEndsWithScan'}
+
+
+def schema_name(kind, label, properties):
+    return f"{label.lower()}_{'_'.join(properties)}_{kind}"
+
+
+def schema_statement(kind, label, properties):
+    """The idempotent CREATE statement of a SCHEMA entry."""
+    name = schema_name(kind, label, properties)
+    keys = ', '.join(f"n.{prop}" for prop in properties)
+    if kind == 'unique':
+        return f"CREATE CONSTRAINT {name} IF NOT EXISTS FOR (n:{label}) REQUIRE ({keys}) IS UNIQUE"
+    return f"CREATE INDEX {name} IF NOT EXISTS FOR (n:{label}) ON ({keys})"
+
+
+def nodeset_query(nodeset):
+    """The Cypher and parameters neomodel runs for a NodeSet."""
+    builder = QueryBuilder(nodeset).build_ast()
+    return builder.build_query(), builder._query_params
+
+
+def hot_queries():
+    """(name, cypher, params) of every lookup on the chat's request path."""
+    queries = [
+        ('Signups by uid', *nodeset_query(Signups.nodes.filter(uid=''))),
+        ('Signups by email', *nodeset_query(Signups.nodes.filter(email=''))),
+        ('Signups sharing an ip', *nodeset_query(Signups.nodes.filter(ip='').exclude(email=''))),
+        ('History_Chat by uid', *nodeset_query(History_Chat.nodes.filter(uid=''))),
+        ('Session_History by uid, name', *nodeset_query(Session_History.nodes.filter(uid='', name=''))),
+        ('Person by uid, full_name', *nodeset_query(Person.nodes.filter(uid='', full_name=''))),
+        ('Recent Person by full_name', *nodeset_query(Person.nodes.filter(full_name='', created_at__gte=''))),
+        ('TextSensor by uid', *nodeset_query(TextSensor.nodes.filter(uid=''))),
+        ('SensoryMemory by uid, name', *nodeset_query(SensoryMemory.nodes.filter(uid='', name=''))),
+        ('Sensor by uid, name', *nodeset_query(Sensor.nodes.filter(uid='', name=''))),
+    ]
+    # The Cypher of Memory/views.py, Memory/prolog.py and Memory/Social_Network.py,
+    # with a relationship type in place of the interpolated one
+    queries += [
+        ('Relationship network', """
+            MATCH (p:Person {uid: $session, full_name: $name})
+            MATCH (p)<-[r:IS_PARENT_OF]-(other)
+            RETURN p.full_name as person, other.full_name as related_person, type(r) as relationship_type
+            UNION
+            MATCH (p:Person {uid: $session, full_name: $name})
+            MATCH (p)-[r:IS_PARENT_OF]->(other)
+            RETURN p.full_name as person, other.full_name as related_person, type(r) as relationship_type
+         """, {'session': '', 'name': ''}),
+        ('Relation by full_name', """
+            MATCH (p:Person {full_name: $name})
+            MATCH (p)<-[r:IS_PARENT_OF]-(other)
+            RETURN other.full_name
+         """, {'name': ''}),
+        ('Relate two people', """
+            MATCH (n1:Person {uid: $session, full_name: $name1})
+            MATCH (n2:Person {uid: $session, full_name: $name2})
+            CREATE (n1)-[r:IS_PARENT_OF]->(n2)
+            RETURN r
+         """, {'session': '', 'name1': '', 'name2': ''}),
+        ('Attribute of a person', """
+            MATCH (n2:Person {full_name: $y_name})
+            MATCH (z:Attribute {attribute: $z_value})
+            CREATE (n2)-[r:HAS]->(z)
+            RETURN r
+         """, {'y_name': '', 'z_value': ''}),
+        ('Known contact', """
+            MATCH (p:Signups {email:$email})
+            MATCH (s:SocialNetwork {name:$name2,uid:$session})
+            MATCH (p)-[r]-(s)
+            RETURN r
+         """, {'email': '', 'name2': '', 'session': ''}),
+        ('New contact', """
+            MATCH (p:Signups {email:$email1})
+            CREATE (s:SocialNetwork {name:$name,uid:$session})
+            CREATE (p)<-[r:is_friend]-(s)
+            RETURN r
+         """, {'email1': '', 'name': '', 'session': ''}),
+        ('Write chat turns', WRITE_TURNS, {'sessions': [], 'positive': 0.05, 'negative': -0.05}),
+        ('Outdated sessions', OUTDATED_SESSIONS, {'keys': []}),
+        ('Episode turn', EPISODE_TURN, {'uid': '', 'episode': '', 'user': '', 'bot': '', 'user_label': '',
+                                        'bot_label': '', 'user_compound': 0.0, 'bot_compound': 0.0,
+                                        'created_at': ''}),
+    ]
+    return queries
+
+
+def plan_operators(plan):
+    """Operator names of an EXPLAIN plan tree, without the runtime suffix ("NodeIndexSeek@neo4j")."""
+    operators = [plan['operatorType'].split('@')[0].split('(')[0]]
+    for child in plan.get('children', []):
+        operators += plan_operators(child)
+    return operators
@@ -0,0 +1,178 @@
+"""
+Sentiment Service
+=================
+
+One VADER analyzer for the whole process. Building a
+SentimentIntensityAnalyzer reads and parses the lexicon, which took
+longer than scoring a whole chat turn when every call built its own.
+
+The analyzer is loaded once, on first use or by the pre-fork master (see
+Memory/prefork.py), and shared by every thread; polarity_scores() only
+reads it. score_many() scores a list of texts in one pass, scoring each
+distinct text once and only when it is not in the SentimentCache (see
+Memory/sentiment_cache.py). Without the lexicon every text scores
+neutral.
+
+compound_many() is for bulk rescoring: one NumPy lookup of every VADER
+token of a batch against the lexicon finds the texts without a single
+lexicon word, whose compound score is exactly 0, and only the others go
+through VADER.
+"""
+
+import threading
+import time
+import numpy as np
+from django.conf import settings
+from .sentiment_cache import SentimentCache
+
+NEUTRAL_SCORES = {'neg': 0.0, 'neu': 1.0, 'pos': 0.0, 'compound': 0.0}
+
+# Compound scores at or beyond these are labelled positive / negative
+POSITIVE_THRESHOLD = 0.05
+NEGATIVE_THRESHOLD = -0.05
+
+
+def sentiment_label(compound):
+    """Label a compound score the way Episode_Part and Session_History store it."""
+    if compound >= POSITIVE_THRESHOLD:
+        return 'Positive sentiments'
+    if compound <= NEGATIVE_THRESHOLD:
+        return 'Negative sentiments'
+    return 'Neutral sentiments'
+
+
+class SentimentService:
+    """Thread-safe, lazily loaded VADER analyzer with batch scoring."""
+
+    def __init__(self, cache=None):
+        self.cache = cache
+        self._analyzer = None
+        self._loaded = False
+        self._lock = threading.Lock()
+        self.load_seconds = 0.0
+        self.calls = 0
+        self.texts = 0
+        self.scored = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self._lexicon_words = None
+
+    @property
+    def analyzer(self):
+        """The shared SentimentIntensityAnalyzer, or None without the VADER lexicon."""
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    start = time.perf_counter()
+                    self._analyzer = self._load()
+                    self.load_seconds = time.perf_counter() - start
+                    self._loaded = True
+        return self._analyzer
+
+    @staticmethod
+    def _load():
+        import nltk
+        from nltk.sentiment.vader import SentimentIntensityAnalyzer
+        try:
+            return SentimentIntensityAnalyzer()
+        except LookupError:
+            # Download VADER lexicon if not available
+            try:
+                nltk.download('vader_lexicon', quiet=True)
+                return SentimentIntensityAnalyzer()
+            except Exception as e:
+                print(f"VADER lexicon unavailable: {e}")
+                return None
+
+    def score_many(self, texts):
+        """Return VADER scores (neg, neu, pos, compound) for each of texts, in order."""
+        texts = list(texts)
+        analyzer = self.analyzer
+        start = time.perf_counter()
+        scores = {}
+        scored = errors = 0
+        for text in texts:
+            if text in scores:
+                continue
+            if analyzer is None or not text:
+                scores[text] = NEUTRAL_SCORES
+                continue
+            cached = self.cache.lookup(text) if self.cache is not None else None
+            if cached is not None:
+                scores[text] = cached
+                continue
+            try:
+                scores[text] = analyzer.polarity_scores(text)
+                scored += 1
+                if self.cache is not None:
+                    self.cache.store(text, scores[text])
+            except Exception as e:
+                print(f"Sentiment analysis error: {e}")
+                scores[text] = NEUTRAL_SCORES
+                errors += 1
+        seconds = time.perf_counter() - start
+        with self._lock:
+            self.calls += 1
+            self.texts += len(texts)
+            self.scored += scored
+            self.errors += errors
+            self.seconds += seconds
+        return [dict(scores[text]) for text in texts]
+
+    def score(self, text):
+        return self.score_many([text])[0]
+
+    def lexicon_hits(self, texts):
+        """
+        Boolean array: does texts[i] contain a lexicon word? Candidates are
+        VADER's own tokens (SentiText.words_and_emoticons, lowercased as
+        polarity_scores() looks them up), so a False is exact.
+        """
+        analyzer = self.analyzer
+        if analyzer is None:
+            return np.zeros(len(texts), dtype=bool)
+        if self._lexicon_words is None:
+            self._lexicon_words = np.array(sorted(analyzer.lexicon))
+        from nltk.sentiment.vader import SentiText
+        constants = analyzer.constants
+        tokens, owners = [], []
+        for i, text in enumerate(texts):
+            words = SentiText(text or '', constants.PUNC_LIST, constants.REGEX_REMOVE_PUNCTUATION).words_and_emoticons
+            tokens.extend(word.lower() for word in words)
+            owners.extend([i] * len(words))
+        if not tokens:
+            return np.zeros(len(texts), dtype=bool)
+        hits = np.isin(np.array(tokens), self._lexicon_words)
+        return np.bincount(np.array(owners)[hits], minlength=len(texts)) > 0
+
+    def compound_many(self, texts, hits=None):
+        """Compound scores of texts as a float array, running VADER only where a lexicon word occurs."""
+        compounds = np.zeros(len(texts))
+        scored = np.flatnonzero(self.lexicon_hits(texts) if hits is None else hits)
+        if len(scored):
+            scores = self.score_many([texts[i] for i in scored])
+            compounds[scored] = [score['compound'] for score in scores]
+        return compounds
+
+    def label_many(self, texts):
+        return [sentiment_label(scores['compound']) for scores in self.score_many(texts)]
+
+    def label(self, text):
+        return self.label_many([text])[0]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'lexicon': 'unavailable' if self._loaded and self._analyzer is None else
+                           'loaded' if self._loaded else 'not loaded',
+                'load_seconds': round(self.load_seconds, 3),
+                'calls': self.calls,
+                'texts': self.texts,
+                'scored': self.scored,
+                'errors': self.errors,
+                'mean_call_ms': round(1000 * self.seconds / self.calls, 3) if self.calls else 0.0,
+                'cache': self.cache.stats() if self.cache is not None else None,
+            }
+
+
+sentiment_service = SentimentService(SentimentCache(settings.SENTIMENT_CACHE_SIZE))
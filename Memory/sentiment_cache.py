@@ -0,0 +1,78 @@
+"""
+Sentiment Cache
+===============
+
+LRU cache of VADER scores in front of SentimentService.score_many() (see
+Memory/sentiment.py). Bot replies come from a fixed set of AIML templates
+and fallback strings, so the same texts are scored over and over.
+
+Entries are keyed by a 128-bit BLAKE2 digest of the text with its
+whitespace collapsed, so a long message costs 16 bytes of key instead of
+a copy of itself. Case and punctuation are kept: VADER scores "GREAT!!!"
+higher than "great".
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def text_key(text):
+    return hashlib.blake2b(' '.join(text.split()).encode('utf-8'), digest_size=16).digest()
+
+
+class SentimentCache:
+    """Thread-safe LRU of VADER scores keyed by text digest."""
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def lookup(self, text):
+        """Return a copy of the cached scores of text, or None."""
+        if not self.enabled:
+            return None
+        key = text_key(text)
+        with self._lock:
+            scores = self._entries.get(key)
+            if scores is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(scores)
+
+    def store(self, text, scores):
+        if not self.enabled:
+            return
+        key = text_key(text)
+        with self._lock:
+            self._entries[key] = dict(scores)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+            }
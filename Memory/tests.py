@@ -1,3 +1,1004 @@
-from django.test import TestCase
+import contextlib
+import io
+import json
+import os
+import pickle
+import random
+import re
+import tempfile
+import threading
+import time
+from datetime import datetime
+from unittest import mock
+from aiml.PatternMgr import PatternMgr
+from django.core.management import CommandError, call_command
+from django.test import RequestFactory, TestCase, override_settings
+from neomodel import db
+from . import aiml as lou_aiml, brain_reload, history_writer, repository, translation_cache
+from .aiml import corpus_fingerprint, learn_corpus, new_kernel, parse_aiml_file, set_bot_predicates
+from .brain_reload import BrainReloader
+from .corpus_analyzer import CorpusAnalyzer, write_corpus
+from .history_writer import HistoryWriter, turn_record, write_turns
+from .kernel_pool import KernelPool
+from .management.commands import bootstrap_schema, compare_matcher, migrate_transcripts, rescore_episode_parts
+from .management.commands.compare_matcher import compare, pattern_inputs, stock_brain
+from .models import APPEND_MESSAGES, Session_History, Signups
+from .match_profiler import MatchProbe, MatchProfiler
+from .pattern_index import IndexedPatternMgr
+from .predicate_actions import ChatTurn
+from .repository import EPISODE_TURN, create_episode_turn, episode_name
+from .respond_budget import RespondBudget
+from .schema import SCHEMA, hot_queries, plan_operators, schema_statement
+from .response_cache import MAX_VARIANTS_PER_KEY, ResponseCache
+from .sentiment import SentimentService
+from .sentiment_cache import SentimentCache, text_key
+from .translation import PhraseTableBackend, TranslationBackend, TranslationService
+from .translation_cache import TranslationCache
+from .user_cache import UserCache, user_cache
 
-# Create your tests here.
+
+class SentimentPrefilterTests(TestCase):
+    """compound_many() skips VADER only where the score is exactly 0."""
+
+    TEXTS = [
+        "thanks!!", "great!!", "so happy?!?", "wow... great!!!", "I am SO sad...", "(good)", '"nice"',
+        "--bad--", "not bad at all!", "hello", "ok...", ":)", "what is your name?", "!!!", "",
+    ]
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.service = SentimentService()
+
+    def test_compound_many_matches_polarity_scores(self):
+        compounds = self.service.compound_many(self.TEXTS)
+        for text, compound in zip(self.TEXTS, compounds):
+            with self.subTest(text=text):
+                self.assertEqual(compound, self.service.score(text)['compound'])
+
+    def test_repeated_punctuation_is_a_hit(self):
+        if self.service.analyzer is None:
+            self.skipTest("VADER lexicon unavailable")
+        hits = self.service.lexicon_hits(["thanks!!", "so happy?!?", "wow... great!!!", "what is your name?"])
+        self.assertEqual(hits.tolist(), [True, True, True, False])
+
+
+class SentimentCacheTests(TestCase):
+
+    def test_whitespace_is_collapsed_but_case_and_punctuation_kept(self):
+        self.assertEqual(text_key("so  happy\n today "), text_key("so happy today"))
+        self.assertNotEqual(text_key("GREAT!!!"), text_key("great"))
+        self.assertNotEqual(text_key("great!"), text_key("great"))
+
+    def test_hits_return_copies(self):
+        cache = SentimentCache()
+        self.assertIsNone(cache.lookup("great"))
+        cache.store("great", {'compound': 0.6})
+        scores = cache.lookup(" great ")
+        self.assertEqual(scores, {'compound': 0.6})
+        scores['compound'] = 0.0
+        self.assertEqual(cache.lookup("great"), {'compound': 0.6})
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (2, 1))
+
+    def test_least_recently_used_text_is_evicted(self):
+        cache = SentimentCache(max_entries=2)
+        cache.store("a", {'compound': 0.1})
+        cache.store("b", {'compound': 0.2})
+        cache.lookup("a")
+        cache.store("c", {'compound': 0.3})
+        self.assertIsNone(cache.lookup("b"))
+        self.assertEqual(cache.lookup("a"), {'compound': 0.1})
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_zero_size_disables_the_cache(self):
+        cache = SentimentCache(max_entries=0)
+        cache.store("great", {'compound': 0.6})
+        self.assertIsNone(cache.lookup("great"))
+        self.assertEqual(cache.stats()['entries'], 0)
+
+    def test_score_many_only_scores_misses(self):
+        service = SentimentService(SentimentCache())
+        analyzer = mock.Mock()
+        analyzer.polarity_scores.side_effect = lambda text: {'neg': 0.0, 'neu': 0.5, 'pos': 0.5, 'compound': 0.5}
+        service._analyzer, service._loaded = analyzer, True
+        service.score_many(["great", "thanks", "great"])
+        service.score_many(["great  ", "thanks", "nice"])
+        self.assertEqual([c.args[0] for c in analyzer.polarity_scores.call_args_list], ["great", "thanks", "nice"])
+
+
+class RespondBudgetTests(TestCase):
+
+    def test_last_overrun_keeps_no_user_text(self):
+        budget = RespondBudget()
+        budget.record()
+        budget.record('srai_depth', "my password is hunter2")
+        stats = budget.stats()
+        self.assertEqual(stats['responds'], 2)
+        self.assertEqual(stats['exceeded']['srai_depth'], 1)
+        self.assertEqual(stats['last_exceeded']['input_length'], len("my password is hunter2"))
+        self.assertNotIn("hunter2", str(stats))
+
+
+@override_settings(AIML_ADMIN_TOKEN='')
+class KernelPoolStatusTests(TestCase):
+
+    def test_remote_clients_are_refused(self):
+        response = self.client.get('/kernel_pool_status/', REMOTE_ADDR='203.0.113.7')
+        self.assertEqual(response.status_code, 403)
+
+    def test_localhost_gets_the_report(self):
+        response = self.client.get('/kernel_pool_status/', REMOTE_ADDR='127.0.0.1')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('respond_budget', response.json())
+
+
+class UserCacheTests(TestCase):
+
+    def setUp(self):
+        self.loads = []
+        lookup = mock.patch.object(type(Signups.nodes), 'first_or_none', side_effect=self.load)
+        lookup.start()
+        self.addCleanup(lookup.stop)
+        self.factory = RequestFactory()
+
+    def load(self, uid):
+        self.loads.append(uid)
+        return None if uid == 'nobody' else Signups(uid=uid, username='Ann', email=f'{uid}@example.com')
+
+    def test_one_load_per_request_and_ttl(self):
+        cache = UserCache(ttl=0.05)
+        request = self.factory.get('/chat/')
+        user = cache.get(request, 'u1')
+        self.assertIs(cache.get(request, 'u1'), user)
+        self.assertIs(cache.get(self.factory.get('/chat/'), 'u1'), user)
+        self.assertEqual(self.loads, ['u1'])
+        time.sleep(0.06)
+        self.assertIsNot(cache.get(self.factory.get('/chat/'), 'u1'), user)
+        self.assertEqual(self.loads, ['u1', 'u1'])
+
+    def test_missing_users_are_not_cached(self):
+        cache = UserCache()
+        self.assertIsNone(cache.get(self.factory.get('/chat/'), 'nobody'))
+        self.assertIsNone(cache.get(self.factory.get('/chat/'), 'nobody'))
+        self.assertIsNone(cache.get(self.factory.get('/chat/'), None))
+        self.assertEqual(self.loads, ['nobody', 'nobody'])
+
+    def test_least_recently_used_user_is_evicted(self):
+        cache = UserCache(max_entries=2)
+        for uid in ('u1', 'u2', 'u1', 'u3'):
+            cache.get(self.factory.get('/chat/'), uid)
+        self.assertEqual(cache.stats()['evictions'], 1)
+        cache.get(self.factory.get('/chat/'), 'u1')
+        cache.get(self.factory.get('/chat/'), 'u2')
+        self.assertEqual(self.loads, ['u1', 'u2', 'u3', 'u2'])
+
+    def test_saving_a_user_invalidates_it(self):
+        user = user_cache.get(self.factory.get('/chat/'), 'u1')
+        changed = Signups(uid='u1', username='Ann', email='u1@example.com', password='new', gender='female')
+        changed.element_id_property = '4:test:1'
+        with mock.patch.object(Signups, 'cypher'), mock.patch.object(type(db), 'get_id_method', return_value='elementId'):
+            changed.save()
+        self.assertIsNot(user_cache.get(self.factory.get('/chat/'), 'u1'), user)
+        self.assertEqual(self.loads, ['u1', 'u1'])
+        user_cache.clear()
+
+
+class WriteTurnsTests(TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(history_writer, 'db')
+        self.db = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.db.cypher_query.return_value = ([], None)
+
+    def test_one_row_per_session_in_turn_order(self):
+        records = [turn_record('u1', "hello", "Hi there!"), turn_record('u2', "I am sad", "Sorry to hear that."),
+                   turn_record('u1', "great!!", "Glad you like it."), turn_record(None, "anonymous", "ignored")]
+        current = set()
+        write_turns(records, current)
+
+        outdated, write = self.db.cypher_query.call_args_list
+        self.assertEqual(outdated.args[1]['keys'], [{'uid': 'u1', 'name': records[0]['name']},
+                                                    {'uid': 'u2', 'name': records[0]['name']}])
+        rows = write.args[1]['sessions']
+        self.assertEqual([row['uid'] for row in rows], ['u1', 'u2'])
+        self.assertEqual([message['content'] for message in rows[0]['messages']],
+                         ["hello", "Hi there!", "great!!", "Glad you like it."])
+        self.assertEqual([message['name'] for message in rows[0]['messages']], ['User', 'Bot', 'User', 'Bot'])
+        self.assertAlmostEqual(rows[0]['compound'], sum(part['compound'] for part in rows[0]['parts']))
+        self.assertEqual(current, {('u1', records[0]['name']), ('u2', records[0]['name'])})
+
+    def test_known_sessions_are_not_checked_again(self):
+        record = turn_record('u1', "hello", "Hi there!")
+        write_turns([record], {('u1', record['name'])})
+        self.assertEqual(self.db.cypher_query.call_count, 1)
+        self.assertIs(self.db.cypher_query.call_args.args[0], history_writer.WRITE_TURNS)
+
+
+class CreateEpisodeTurnTests(TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(repository, 'db')
+        self.db = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.db.cypher_query.return_value = ([[1]], ['count(s)'])
+        scores = mock.patch.object(repository.sentiment_service, 'score_many',
+                                   return_value=[{'compound': 0.6}, {'compound': -0.4}])
+        self.score_many = scores.start()
+        self.addCleanup(scores.stop)
+
+    def test_one_statement_with_both_parts(self):
+        episode = episode_name(datetime(2024, 5, 1))
+        self.assertTrue(create_episode_turn('u1', episode, "I am sad", "Glad to help!", created_at='2024-05-01 10:00:00'))
+        self.score_many.assert_called_once_with(["Glad to help!", "I am sad"])
+        self.db.cypher_query.assert_called_once()
+        query, params = self.db.cypher_query.call_args.args
+        self.assertIs(query, EPISODE_TURN)
+        self.assertEqual(params, {
+            'uid': 'u1', 'episode': "Episode - 2024-05-01", 'user': "I am sad", 'bot': "Glad to help!",
+            'user_label': 'Negative sentiments', 'bot_label': 'Positive sentiments',
+            'user_compound': -0.4, 'bot_compound': 0.6, 'created_at': '2024-05-01 10:00:00',
+        })
+        self.assertEqual(set(re.findall(r'\$(\w+)', query)), set(params))
+        self.assertEqual(query.count("CREATE (s)-[:HAS_CHAT]->(:Episode_Part"), 2)
+
+    def test_missing_episode_is_reported(self):
+        self.db.cypher_query.return_value = ([[0]], ['count(s)'])
+        self.assertFalse(create_episode_turn('u1', episode_name(), "hi", "hello"))
+        self.assertRegex(self.db.cypher_query.call_args.args[1]['created_at'], r'^\d{4}-\d\d-\d\d \d\d:\d\d:\d\d$')
+
+
+class HistoryWriterTests(TestCase):
+
+    def test_backpressure_keeps_turns_in_order(self):
+        written, overlapping, writing = [], [], threading.Lock()
+
+        def write(batch, current):
+            # a slow database that must never see two writes at once
+            if not writing.acquire(blocking=False):
+                overlapping.append(batch)
+                writing.acquire()
+            time.sleep(0.01)
+            written.extend(record['user'] for record in batch)
+            writing.release()
+
+        writer = HistoryWriter(write=write, max_queue=2, batch_size=2, linger=0, enqueue_timeout=0.001)
+        for i in range(20):
+            writer.submit({'uid': 'u1', 'user': i})
+        self.assertTrue(writer.flush(timeout=5))
+        writer.close()
+        self.assertEqual(written, list(range(20)))
+        self.assertEqual(overlapping, [])
+        self.assertGreater(writer.stats()['backpressure'], 0)
+
+
+class ReadYourWritesTests(TestCase):
+    """A turn queued for the history writer is read back by the next turn."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Memory.views imports its URLconf, which imports Memory.views
+        from . import views
+        cls.views = views
+
+    def setUp(self):
+        self.written = {}
+
+        def write(batch, current):
+            time.sleep(0.05)
+            for record in batch:
+                self.written.setdefault(record['uid'], []).append(record['bot'])
+
+        self.writer = HistoryWriter(write=write, linger=0)
+        self.addCleanup(self.writer.close)
+        self.session = mock.Mock()
+        self.session.last_messages.side_effect = lambda limit, message_type=None: [
+            mock.Mock(content=text) for text in self.written.get('u1', [])[-limit:]]
+        for target, name, value in ((self.views, 'history_writer', self.writer), (self.views, 'db', mock.Mock()),
+                                    (self.views.user_cache, 'get', mock.Mock(return_value=Signups(email='u1@example.com')))):
+            patcher = mock.patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.views.db.cypher_query.return_value = ([], None)
+
+    def social_network_turn(self):
+        turn = ChatTurn(RequestFactory().post('/chat/'), "yes he is my friend", 'u1', None,
+                        {'person_sn': 'he', 'relation_sn': 'friend'}, lambda: "Nice!")
+        return self.views.social_network_action(turn)
+
+    def test_flush_waits_for_the_users_queued_turns(self):
+        self.writer.submit(turn_record('u1', "hi", "Do you know Ali?"))
+        self.assertEqual(self.writer.pending('u1'), 1)
+        self.assertTrue(self.writer.flush('u1', timeout=5))
+        self.assertEqual(self.writer.pending('u1'), 0)
+        self.assertEqual(self.written['u1'], ["Do you know Ali?"])
+
+    def test_social_network_action_reads_the_queued_reply(self):
+        self.writer.submit(turn_record('u1', "hi", "Do you know Ali?"))
+        with mock.patch.object(type(Session_History.nodes), 'first_or_none', return_value=self.session):
+            self.assertIsNone(self.social_network_turn())
+        self.assertEqual(self.views.db.cypher_query.call_args.args[1]['name'], "Ali")
+
+    def test_missing_session_or_history_carries_on(self):
+        with mock.patch.object(type(Session_History.nodes), 'first_or_none', return_value=None):
+            self.assertIsNone(self.social_network_turn())
+        with mock.patch.object(type(Session_History.nodes), 'first_or_none', return_value=self.session):
+            self.assertIsNone(self.social_network_turn())
+        self.views.db.cypher_query.assert_not_called()
+
+
+class AppendMessagesTests(TestCase):
+
+    def test_sends_sentiment_increments_not_totals(self):
+        session = Session_History(uid='u1', name='Episode - 2024-01-01', sentiment_compound=5.0, sentiment_count=10,
+                                  message_count=10)
+        scores = [{'compound': 0.5, 'pos': 0.4, 'neg': 0.0, 'neu': 0.6},
+                  {'compound': -0.2, 'pos': 0.0, 'neg': 0.3, 'neu': 0.7}]
+        row = [12, 5.3, 1.4, 0.3, 9.3, 12, 'Positive sentiments']
+        with mock.patch.object(Session_History, 'cypher', return_value=([row], None)) as cypher, \
+                mock.patch.object(type(db), 'get_id_method', return_value='elementId'):
+            session.append_messages([("User", "great!!"), ("Bot", "not good")], scores=scores)
+
+        query, params = cypher.call_args.args
+        self.assertIn("coalesce(s.sentiment_compound, 0.0) + $sentiment.compound", query)
+        self.assertEqual(params['properties'], {})
+        self.assertAlmostEqual(params['sentiment']['compound'], 0.3)
+        self.assertEqual(params['sentiment']['count'], 2)
+        self.assertEqual([message['content'] for message in params['messages']], ["great!!", "not good"])
+        self.assertEqual((session.message_count, session.sentiment_count, session.overall_sentiments),
+                         (12, 12, 'Positive sentiments'))
+
+    def test_statement_fills_placeholders(self):
+        self.assertIn("elementId(s) = $self", APPEND_MESSAGES.format(id='elementId'))
+
+
+class SchemaTests(TestCase):
+
+    def test_statements(self):
+        self.assertEqual(schema_statement('unique', 'Session_History', ('uid', 'name')),
+                         "CREATE CONSTRAINT session_history_uid_name_unique IF NOT EXISTS "
+                         "FOR (n:Session_History) REQUIRE (n.uid, n.name) IS UNIQUE")
+        self.assertEqual(schema_statement('index', 'Signups', ('ip',)),
+                         "CREATE INDEX signups_ip_index IF NOT EXISTS FOR (n:Signups) ON (n.ip)")
+        statements = [schema_statement(*entry) for entry in SCHEMA]
+        self.assertEqual(len({statement.split()[2] for statement in statements}), len(SCHEMA))
+
+    def test_hot_queries_bind_every_parameter(self):
+        queries = hot_queries()
+        self.assertEqual(len({name for name, _, _ in queries}), len(queries))
+        for name, query, params in queries:
+            with self.subTest(name=name):
+                self.assertTrue(set(re.findall(r'\$(\w+)', query)) <= set(params))
+
+    def test_plan_operators(self):
+        plan = {'operatorType': 'ProduceResults@neo4j', 'children': [
+            {'operatorType': 'Apply@neo4j', 'children': [
+                {'operatorType': 'NodeUniqueIndexSeek(Locking)@neo4j'},
+                {'operatorType': 'NodeByLabelScan', 'children': []},
+            ]},
+        ]}
+        self.assertEqual(plan_operators(plan), ['ProduceResults', 'Apply', 'NodeUniqueIndexSeek', 'NodeByLabelScan'])
+
+
+class BootstrapSchemaCommandTests(TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(bootstrap_schema, 'db')
+        self.db = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.db.cypher_query.side_effect = self.cypher_query
+        self.indexes = []
+        self.constraints = [[[label], list(properties)] for kind, label, properties in SCHEMA if kind == 'unique']
+        self.run = self.db.driver.session.return_value.__enter__.return_value.run
+
+    def cypher_query(self, query, params=None):
+        if query == bootstrap_schema.CURRENT_INDEXES:
+            return self.indexes, ['labelsOrTypes', 'properties', 'state']
+        if query == bootstrap_schema.CURRENT_CONSTRAINTS:
+            return self.constraints, ['labelsOrTypes', 'properties']
+        return [], []
+
+    def explain(self, operator):
+        self.run.return_value.consume.return_value.plan = {
+            'operatorType': 'ProduceResults@neo4j', 'children': [{'operatorType': f'{operator}@neo4j'}]}
+
+    def test_check_only_reports_missing_indexes(self):
+        self.indexes = [[['Signups'], ['ip'], 'POPULATING']]
+        with self.assertRaisesRegex(CommandError, r'missing index on :Signups\(ip\)'):
+            call_command('bootstrap_schema', '--check-only', '--skip-explain', stdout=io.StringIO())
+        self.assertEqual(self.db.cypher_query.call_count, 2)
+
+    def test_creates_missing_indexes_and_checks_the_plans(self):
+        self.explain('NodeIndexSeek')
+        call_command('bootstrap_schema', stdout=io.StringIO())
+        created = [c.args[0] for c in self.db.cypher_query.call_args_list if c.args[0].startswith('CREATE')]
+        self.assertEqual(created, [schema_statement(*entry) for entry in SCHEMA if entry[0] == 'index'])
+        self.assertEqual(self.run.call_count, len(hot_queries()))
+        self.assertTrue(self.run.call_args.args[0].startswith('EXPLAIN '))
+
+    def test_label_scans_fail(self):
+        self.explain('NodeByLabelScan')
+        with self.assertRaisesRegex(CommandError, r'NodeByLabelScan'):
+            call_command('bootstrap_schema', stdout=io.StringIO())
+
+
+class BrainSnapshotTests(TestCase):
+    """The pickled brain is only served for the corpus and format it was built from."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.data = f"{directory.name}/Data"
+        brain = f"{directory.name}/Brain"
+        os.makedirs(self.data)
+        self.write("Hi!")
+        patcher = mock.patch.multiple(lou_aiml, aiml_directory=self.data, brain_directory=brain,
+                                      brain_snapshot=f"{brain}/brain.pkl", brain_manifest=f"{brain}/manifest.json",
+                                      brain_categories=f"{brain}/categories.pkl", LOAD_WORKERS=1)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write(self, answer):
+        with open(f"{self.data}/greetings.aiml", 'w', encoding='utf-8') as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n<aiml version="1.0">'
+                    f'<category><pattern>HELLO</pattern><template>{answer}</template></category></aiml>\n')
+
+    def build(self):
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            kernel, rebuilt = lou_aiml.build_brain()
+            return kernel.respond("hello"), rebuilt
+
+    def test_unchanged_corpus_loads_the_snapshot(self):
+        self.assertEqual(self.build(), ("Hi!", True))
+        self.assertEqual(self.build(), ("Hi!", False))
+
+    def test_edited_file_rebuilds(self):
+        self.build()
+        self.write("Hey!")
+        self.assertEqual(self.build(), ("Hey!", True))
+        self.assertEqual(self.build(), ("Hey!", False))
+
+    def test_format_bump_rebuilds(self):
+        self.build()
+        with mock.patch.object(lou_aiml, 'SNAPSHOT_FORMAT', lou_aiml.SNAPSHOT_FORMAT + 1):
+            self.assertEqual(self.build(), ("Hi!", True))
+
+
+class PatternIndexTests(TestCase):
+    """IndexedPatternMgr on a handful of categories, against aiml's PatternMgr."""
+
+    CATEGORIES = [
+        ('HELLO', '*', '*'), ('_ YOU', '*', '*'), ('WHO ARE YOU', '*', '*'), ('* YOU', '*', '*'),
+        ('MY NAME IS *', '*', '*'), ('BOT_NAME *', '*', '*'), ('YES', 'DO YOU LIKE *', '*'), ('YES', '*', '*'),
+        ('*', '*', '*'), ('TELL ME *', '*', 'SPORTS'), ('TELL ME * ABOUT *', '*', '*'),
+    ]
+
+    INPUTS = [
+        ("hello", "", ""), ("who are you", "", ""), ("do you", "", ""), ("my name is ann smith", "", ""),
+        ("Lou, hi!", "", ""), ("yes", "Do you like cats?", ""), ("yes", "", ""), ("tell me news", "", "sports"),
+        ("tell me the truth about cats", "", ""), ("zzz", "", ""),
+    ]
+
+    def setUp(self):
+        self.stock, self.indexed = PatternMgr(), IndexedPatternMgr()
+        for brain in (self.stock, self.indexed):
+            brain.setBotName('LOU')
+            for i, key in enumerate(self.CATEGORIES):
+                brain.add(key, ['template', {}, ['text', {}, str(i)]])
+
+    def assertMatchesAlike(self, indexed):
+        for input_, that, topic in self.INPUTS:
+            with self.subTest(input=input_, that=that, topic=topic):
+                self.assertEqual(indexed.match(input_, that, topic), self.stock.match(input_, that, topic))
+                for star in ('star', 'thatstar', 'topicstar'):
+                    self.assertEqual(indexed.star(star, input_, that, topic, 1),
+                                     self.stock.star(star, input_, that, topic, 1))
+
+    def test_matches_like_pattern_mgr(self):
+        self.assertMatchesAlike(self.indexed)
+        self.assertEqual(self.indexed.match("Lou, hi!", "", "")[2][2], '5')
+
+    def test_snapshot_and_tree_round_trip(self):
+        index = pickle.loads(pickle.dumps(self.indexed.build_index(), protocol=pickle.HIGHEST_PROTOCOL))
+        self.assertMatchesAlike(IndexedPatternMgr.from_index(index, self.indexed._templateCount, 'LOU'))
+        self.assertEqual(self.indexed.tree(), self.stock._root)
+
+    def test_categories_added_after_indexing(self):
+        self.indexed.build_index()
+        for brain in (self.stock, self.indexed):
+            brain.add(('GOOD BYE', '*', '*'), ['template', {}, ['text', {}, 'new']])
+        self.assertEqual(self.indexed.match("good bye", "", "")[2][2], 'new')
+        self.assertMatchesAlike(self.indexed)
+
+
+class CompareMatcherCommandTests(TestCase):
+
+    def run_command(self, mismatches):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        corpus = f"{directory.name}/corpus.txt"
+        with open(corpus, 'w', encoding='utf-8') as f:
+            f.write("hello\n")
+
+        def compare(stock, indexed, corpus, timings):
+            for samples in timings.values():
+                samples.append(1.0)
+            return mismatches
+
+        with mock.patch.object(compare_matcher, 'init_kernel'), mock.patch.object(compare_matcher, 'stock_brain'), \
+                mock.patch.object(compare_matcher, 'compare', side_effect=compare):
+            call_command('compare_matcher', corpus=corpus, stdout=io.StringIO())
+
+    def test_mismatches_fail_the_command(self):
+        with self.assertRaisesMessage(CommandError, "on 2 queries"):
+            self.run_command([("hello", ""), ("hello", "DO YOU LIKE MOVIES")])
+
+    def test_agreement_passes(self):
+        self.run_command([])
+
+
+class MatchProfilerTests(TestCase):
+
+    def setUp(self):
+        self.brain = IndexedPatternMgr()
+        self.brain.setBotName('LOU')
+        for pattern in ('HELLO', 'MY NAME IS *'):
+            self.brain.add((pattern, '*', '*'), ['template', {}, ['text', {}, pattern]])
+        table = mock.patch('Memory.aiml.load_category_table', return_value=None)
+        table.start()
+        self.addCleanup(table.stop)
+
+    def record(self, profiler, input_, seconds):
+        probe = MatchProbe(self.brain)
+        probe.match(input_, '', '')
+        profiler.record(self.brain, input_, probe, seconds)
+
+    def test_ranks_categories_and_calls_by_time_without_user_text(self):
+        profiler = MatchProfiler(enabled=True)
+        self.record(profiler, "hello", 0.001)
+        self.record(profiler, "my name is Ann Smith", 0.004)
+        self.record(profiler, "my name is Bo", 0.002)
+        report = profiler.report()
+
+        self.assertEqual(report['calls'], 3)
+        self.assertEqual([(c['pattern'], c['calls']) for c in report['top_categories']],
+                         [('MY NAME IS *', 2), ('HELLO', 1)])
+        self.assertEqual([call['total_ms'] for call in report['slowest_calls']], [4.0, 2.0, 1.0])
+        slowest = report['slowest_calls'][0]
+        self.assertEqual(slowest['input_length'], len("my name is Ann Smith"))
+        self.assertEqual(slowest['chain'], [[0, 'MY NAME IS *']])
+        self.assertNotIn("Ann", json.dumps(report))
+
+    def test_a_new_brain_restarts_the_stats(self):
+        profiler = MatchProfiler(enabled=True)
+        self.record(profiler, "hello", 0.001)
+        self.brain = IndexedPatternMgr.from_index(self.brain.build_index(), 2, 'LOU')
+        self.record(profiler, "hello", 0.001)
+        self.assertEqual(profiler.report()['calls'], 1)
+
+
+class IndexedMatcherTests(TestCase):
+    """The indexed brain, through its snapshot form, matches like aiml's PatternMgr."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.stock = stock_brain()
+        kernel = new_kernel()
+        set_bot_predicates(kernel)
+        with contextlib.redirect_stderr(io.StringIO()):
+            learn_corpus(kernel, corpus_fingerprint()[1])
+        brain = kernel._brain
+        index = pickle.loads(pickle.dumps(brain.build_index(), protocol=pickle.HIGHEST_PROTOCOL))
+        cls.indexed = IndexedPatternMgr.from_index(index, brain._templateCount, brain._botName)
+
+    def test_same_categories(self):
+        self.assertEqual(self.indexed.numTemplates(), self.stock.numTemplates())
+
+    def test_learned_patterns_and_random_sentences_match_alike(self):
+        rng = random.Random(7)
+        inputs = pattern_inputs(self.stock._root, self.stock._botName)
+        corpus = rng.sample(inputs, 3000)
+        vocabulary = [word for text in corpus for word in text.split()]
+        corpus += [' '.join(rng.choice(vocabulary) for _ in range(rng.randint(3, 15))) for _ in range(1000)]
+        corpus += ["hello", "who is the father of ali", "what is your name", "", "?!"]
+        self.assertEqual(compare(self.stock, self.indexed, corpus), [])
+
+
+class ChatTurnTests(TestCase):
+    """The pooled kernel is back in the pool whenever the turn does I/O."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Memory.views imports its URLconf, which imports Memory.views
+        from . import views
+        cls.views = views
+
+    def setUp(self):
+        views = self.views
+        self.idle = []
+        self.user = Signups(uid='u1', username='Ann', email='u1@example.com', gender='female')
+        self.request = RequestFactory().post('/chat/')
+        self.request.session = {'user_id': 'u1'}
+        for name in ('record_turn', 'search_ip', 'get_relationship_graph_data'):
+            patcher = mock.patch.object(views, name, side_effect=self.io)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def io(self, *args):
+        views = self.views
+        self.idle.append(views.kernel_pool.stats()['idle_kernels'])
+
+    def turn(self, message):
+        views = self.views
+        with views.kernel_pool.session('u1'):
+            response = views.chat_turn(self.request, message, 'u1', self.user)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_plain_reply(self):
+        self.turn("hello")
+        self.assertEqual(self.idle, [self.views.kernel_pool.size])
+
+    def test_relationship_lookup(self):
+        views = self.views
+        with mock.patch.object(views, 'db') as db_:
+            db_.cypher_query.side_effect = lambda *args: self.io() or ([['sara']], None)
+            response = self.turn("who is the father of ali")
+        self.assertIn("Sara is father of ali", json.loads(response.content)["bot_response"])
+        self.assertEqual(self.idle, [views.kernel_pool.size] * 3)
+        with views.kernel_pool.checkout('u1') as kernel:
+            self.assertEqual((kernel.getPredicate('namex'), kernel.getPredicate('relationx')), ('', ''))
+
+
+class KernelPoolTests(TestCase):
+
+    def test_a_session_waiting_on_io_blocks_no_other_session(self):
+        pool = KernelPool(new_kernel(), size=1)
+        held, release = threading.Event(), threading.Event()
+
+        def slow_turn():
+            with pool.session('u1'):
+                held.set()
+                release.wait(5)
+
+        def other_turn(session, done):
+            with pool.session(session):
+                done.set()
+
+        slow = threading.Thread(target=slow_turn)
+        slow.start()
+        held.wait(5)
+        try:
+            # u163 and u196 hash to the same lock stripe as u1
+            for session in ('u2', 'u163', 'u196'):
+                done = threading.Event()
+                threading.Thread(target=other_turn, args=(session, done)).start()
+                self.assertTrue(done.wait(2), session)
+            same = threading.Event()
+            threading.Thread(target=other_turn, args=('u1', same)).start()
+            self.assertFalse(same.wait(0.1))
+        finally:
+            release.set()
+            slow.join(5)
+        self.assertTrue(same.wait(2))
+
+    def test_turns_of_other_sessions_run_while_one_waits_on_io(self):
+        pool = KernelPool(new_kernel(), size=1)
+
+        def other_turn():
+            with pool.session('u2'), pool.checkout('u2') as kernel:
+                kernel.setPredicate('name', 'Bo')
+
+        with pool.session('u1'):
+            with pool.checkout('u1') as kernel:
+                kernel.setPredicate('name', 'Ann')
+            # the kernel is back in the pool while u1's turn goes on
+            other = threading.Thread(target=other_turn)
+            other.start()
+            other.join(timeout=5)
+            self.assertFalse(other.is_alive())
+            with pool.checkout('u1') as kernel:
+                self.assertEqual(kernel.getPredicate('name'), 'Ann')
+        with pool.checkout('u2') as kernel:
+            self.assertEqual(kernel.getPredicate('name'), 'Bo')
+
+
+class FlakyBackend(TranslationBackend):
+    name = 'flaky'
+
+    def __init__(self):
+        self.calls = 0
+        self.failing = True
+
+    def translate_batch(self, texts, src, dest):
+        self.calls += 1
+        if self.failing:
+            raise ConnectionError("upstream down")
+        return [f"upstream {text}" for text in texts]
+
+
+class TranslationCacheTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = f"{directory.name}/cache.sqlite3"
+
+    def used_at(self, text):
+        cache = TranslationCache(self.path)
+        return cache._connection().execute("SELECT used_at FROM translations WHERE text = ?", (text,)).fetchone()[0]
+
+    def test_hits_do_not_write_until_the_next_insert(self):
+        cache = TranslationCache(self.path)
+        cache.put("salam", 'ur', 'en', "hello", 0.2)
+        inserted = self.used_at("salam")
+        time.sleep(0.01)
+        self.assertEqual(TranslationCache(self.path).get("salam", 'ur', 'en'), "hello")
+        self.assertEqual(cache.get(" salam ", 'ur', 'en'), "hello")
+        self.assertEqual(self.used_at("salam"), inserted)
+        cache.put("shukriya", 'ur', 'en', "thanks", 0.2)
+        self.assertGreater(self.used_at("salam"), inserted)
+        stats = cache.stats()
+        self.assertEqual((stats['memory_hits'], stats['saved_seconds']), (1, 0.2))
+
+    def test_touched_keys_are_written_in_batches(self):
+        cache = TranslationCache(self.path)
+        cache.put("salam", 'ur', 'en', "hello", 0.2)
+        cache.put("shukriya", 'ur', 'en', "thanks", 0.2)
+        inserted = self.used_at("salam")
+        time.sleep(0.01)
+        with mock.patch.object(translation_cache, 'TOUCH_EVERY', 2):
+            cache.get("salam", 'ur', 'en')
+            cache.get("salam", 'ur', 'en')
+            cache.get("missing", 'ur', 'en')
+            self.assertEqual(self.used_at("salam"), inserted)
+            cache.get("shukriya", 'ur', 'en')
+        self.assertGreater(self.used_at("salam"), inserted)
+        self.assertGreater(self.used_at("shukriya"), inserted)
+
+    def test_expired_entries_miss_in_memory_and_in_the_store(self):
+        cache = TranslationCache(self.path, ttl=0.05)
+        cache.put("salam", 'ur', 'en', "hello", 0.2)
+        time.sleep(0.06)
+        self.assertIsNone(cache.get("salam", 'ur', 'en'))
+        self.assertIsNone(TranslationCache(self.path, ttl=0.05).get("salam", 'ur', 'en'))
+        self.assertEqual(cache.stats()['expired'], 2)
+
+    def test_least_recently_used_rows_are_evicted(self):
+        cache = TranslationCache(self.path, max_rows=2)
+        with mock.patch.object(translation_cache, 'EVICT_EVERY', 1):
+            cache.put("a", 'ur', 'en', "A", 0.1)
+            time.sleep(0.01)
+            cache.put("b", 'ur', 'en', "B", 0.1)
+            time.sleep(0.01)
+            cache.get("a", 'ur', 'en')
+            cache.put("c", 'ur', 'en', "C", 0.1)
+        self.assertEqual(cache.stats()['evictions'], 1)
+        store = TranslationCache(self.path)
+        self.assertEqual([store.get(text, 'ur', 'en') for text in "abc"], ["A", None, "C"])
+
+    def test_expired_rows_are_evicted(self):
+        cache = TranslationCache(self.path, ttl=0.05)
+        with mock.patch.object(translation_cache, 'EVICT_EVERY', 2):
+            cache.put("a", 'ur', 'en', "A", 0.1)
+            time.sleep(0.06)
+            cache.put("b", 'ur', 'en', "B", 0.1)
+        self.assertEqual(cache.stats()['store_rows'], 1)
+
+
+class TranslationBreakerTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.backend = FlakyBackend()
+        self.service = TranslationService(self.backend, failure_threshold=2, reset_after=0.05,
+                                          cache=TranslationCache(f"{directory.name}/cache.sqlite3"),
+                                          fallback=PhraseTableBackend())
+
+    def test_failing_upstream_opens_the_breaker_and_falls_back(self):
+        for _ in range(3):
+            self.assertEqual(self.service.translate("ہیلو", dest='en'), "hello")
+        self.assertEqual(self.backend.calls, 2)
+        stats = self.service.stats()
+        self.assertEqual((stats['breaker'], stats['short_circuited'], stats['fallbacks']), ('open', 1, 3))
+
+        # fallback answers are not cached; one probe closes the breaker again
+        self.backend.failing = False
+        time.sleep(0.06)
+        self.assertEqual(self.service.translate("ہیلو", dest='en'), "upstream ہیلو")
+        self.assertEqual(self.service.breaker_state(), 'closed')
+        self.assertEqual(self.service.translate("ہیلو", dest='en'), "upstream ہیلو")
+        self.assertEqual(self.backend.calls, 3)
+
+
+class RescoreEpisodePartsTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.checkpoint = f"{directory.name}/checkpoint.json"
+        patcher = mock.patch.object(rescore_episode_parts, 'db')
+        self.db = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.db.get_id_method.return_value = 'elementId'
+        self.db.cypher_query.return_value = ([], None)
+        self.session = self.db.driver.session.return_value.__enter__.return_value
+        self.session.run.return_value = [['4:x:1', "I love it"], ['4:x:2', "the table"], ['4:x:3', "great!!"]]
+
+    def test_streams_one_query_and_writes_by_element_id(self):
+        call_command('rescore_episode_parts', checkpoint=self.checkpoint, page=2, stdout=io.StringIO())
+        self.assertEqual(self.db.driver.session.call_args.kwargs['fetch_size'], 2)
+        (query, params), = [call.args for call in self.session.run.call_args_list]
+        self.assertIn("elementId(p) > $after", query)
+        self.assertNotIn("LIMIT", query)
+        self.assertIsNone(params['after'])
+        writes = [call.args for call in self.db.cypher_query.call_args_list]
+        self.assertTrue(all("elementId(p) = row.id" in query for query, _ in writes))
+        self.assertEqual([[row['id'] for row in params['rows']] for _, params in writes], [['4:x:1', '4:x:2'], ['4:x:3']])
+        with open(self.checkpoint) as f:
+            checkpoint = json.load(f)
+        self.assertEqual((checkpoint['id'], checkpoint['after'], checkpoint['parts']), ('elementId', '4:x:3', 3))
+
+    def test_refuses_a_checkpoint_of_the_other_id_method(self):
+        with open(self.checkpoint, 'w') as f:
+            json.dump({'after': 41, 'parts': 41, 'missing_only': False}, f)
+        with self.assertRaises(CommandError):
+            call_command('rescore_episode_parts', checkpoint=self.checkpoint, stdout=io.StringIO())
+
+
+class MigrateTranscriptsTests(TestCase):
+
+    def test_pages_and_migrates_by_element_id(self):
+        pages = [[['4:x:1', ["User: hello"]], ['4:x:2', []]], []]
+        with mock.patch.object(migrate_transcripts, 'db') as db_:
+            db_.get_id_method.return_value = 'elementId'
+            db_.cypher_query.side_effect = lambda query, params: (
+                pages.pop(0) if 'LIMIT' in query else [(1, 1)], None)
+            call_command('migrate_transcripts', stdout=io.StringIO())
+        first, migrate, last = db_.cypher_query.call_args_list
+        self.assertIsNone(first.args[1]['after'])
+        self.assertIn("elementId(s) = row.id", migrate.args[0])
+        self.assertIn("(:Chat_Message {uid: s.uid", migrate.args[0])
+        self.assertEqual([row['id'] for row in migrate.args[1]['sessions']], ['4:x:1'])
+        self.assertEqual(last.args[1]['after'], '4:x:2')
+
+
+class CorpusAnalyzerTests(TestCase):
+
+    FILES = {
+        'a.aiml': """
+            <category><pattern>HELLO</pattern><template>Hi there!</template></category>
+            <category><pattern>WHO ARE YOU</pattern><template>I am Lou.</template></category>
+            <category><pattern>GREET *</pattern><template><srai>HELLO</srai></template></category>
+            <category><pattern>ASK *</pattern><template><srai>NOTHING MATCHES <star/></srai></template></category>
+        """,
+        'b.aiml': """
+            <category><pattern>HELLO</pattern><template>Hi there!</template></category>
+            <category><pattern>WHO ARE YOU</pattern><template>I am LouBot.</template></category>
+            <category><pattern>_ YOU</pattern><template>Me?</template></category>
+            <category><pattern>hello again</pattern><template>Again.</template></category>
+        """,
+    }
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        for name, categories in self.FILES.items():
+            with open(f"{self.directory}/{name}", 'w', encoding='utf-8') as f:
+                f.write(f'<?xml version="1.0" encoding="UTF-8"?>\n<aiml version="1.0">{categories}</aiml>\n')
+        self.analyzer = CorpusAnalyzer(self.parse(self.directory), 'Lou')
+
+    def parse(self, directory):
+        return [parse_aiml_file(f"{directory}/{name}")[:2] for name in sorted(self.FILES)
+                if os.path.exists(f"{directory}/{name}")]
+
+    def test_redefinitions(self):
+        duplicates, shadowed = self.analyzer.redefinitions()
+        self.assertEqual(duplicates, [(('HELLO', '*', '*'), ['a.aiml'], 'b.aiml')])
+        self.assertEqual(shadowed, [(('WHO ARE YOU', '*', '*'), ['a.aiml'], 'b.aiml')])
+
+    def test_unreachable_and_dangling_srai(self):
+        unreachable = self.analyzer.unreachable()
+        self.assertEqual(set(unreachable), {('WHO ARE YOU', '*', '*'), ('hello again', '*', '*')})
+        self.assertEqual(unreachable['WHO ARE YOU', '*', '*'], "always matched by '_ YOU'")
+        dangling = self.analyzer.dangling_srai()
+        self.assertEqual([(target, dynamic, keys) for target, dynamic, _, keys in dangling],
+                         [("NOTHING MATCHES QZXFILLER", True, [('ASK *', '*', '*')])])
+
+    def test_pruned_corpus_learns_the_same_categories(self):
+        pruned = f"{self.directory}/pruned"
+        write_corpus(pruned, self.analyzer.pruned(drop_unreachable=True))
+        analyzer = CorpusAnalyzer(self.parse(pruned), 'Lou')
+        self.assertEqual(analyzer.redefinitions(), ([], []))
+        reachable = {key: definitions[-1][1] for key, definitions in self.analyzer.definitions.items()
+                     if key not in self.analyzer.unreachable()}
+        self.assertEqual({key: definitions[-1][1] for key, definitions in analyzer.definitions.items()}, reachable)
+
+
+class ResponseCacheTests(TestCase):
+
+    AIML = """<?xml version="1.0" encoding="UTF-8"?>
+<aiml version="1.0">
+<category><pattern>HELLO</pattern><template>Hi <get name="name"/>!</template></category>
+<category><pattern>PICK ONE</pattern><template><random><li>A</li><li>B</li></random></template></category>
+</aiml>
+"""
+
+    def test_variants_follow_the_predicates_they_read(self):
+        cache = ResponseCache()
+        cache.store('key', {'name': 'Ann'}, "Hi Ann!")
+        cache.store('key', {'name': 'Bo'}, "Hi Bo!")
+        self.assertEqual(cache.lookup(['other', 'key'], {'name': 'Bo'}.get), "Hi Bo!")
+        self.assertIsNone(cache.lookup(['key'], {'name': 'Cy'}.get))
+        for i in range(MAX_VARIANTS_PER_KEY):
+            cache.store('key', {'name': str(i)}, f"Hi {i}!")
+        self.assertIsNone(cache.lookup(['key'], {'name': 'Ann'}.get))
+        self.assertEqual(cache.stats()['evictions'], 2)
+
+    def test_least_recently_used_key_is_evicted(self):
+        cache = ResponseCache(max_entries=2)
+        for key in ('a', 'b'):
+            cache.store(key, {}, key)
+        cache.lookup(['a'], {}.get)
+        cache.store('c', {}, 'c')
+        self.assertEqual([cache.lookup([key], {}.get) for key in 'abc'], ['a', None, 'c'])
+
+    def test_kernel_serves_cached_responses(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = f"{directory.name}/cache.aiml"
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.AIML)
+        kernel = new_kernel()
+        kernel.verbose(False)
+        kernel.learn(path)
+        kernel._response_cache = cache = ResponseCache()
+
+        # fresh sessions share the empty <that> context
+        responses = []
+        for session, name, message in (('s1', 'Ann', "hello"), ('s2', 'Ann', "Hello!"), ('s3', 'Bo', "hello")):
+            kernel.setPredicate('name', name, session)
+            responses.append(kernel.respond(message, session))
+        self.assertEqual(responses, ["Hi Ann!", "Hi Ann!", "Hi Bo!"])
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+        for session in ('s4', 's5'):
+            kernel.respond("pick one", session)
+        self.assertEqual((cache.hits, cache.uncacheable), (1, 2))
+
+
+class BrainReloaderTests(TestCase):
+
+    def setUp(self):
+        self.old, self.new = IndexedPatternMgr(), IndexedPatternMgr()
+        kernel = new_kernel()
+        kernel._brain = self.old
+        self.pool = KernelPool(kernel, size=2)
+        self.cache = ResponseCache()
+        self.cache.store('key', {}, "cached")
+
+    def test_swaps_the_brain_while_turns_in_flight_keep_theirs(self):
+        reloader = BrainReloader(self.pool, self.cache)
+        with mock.patch.object(brain_reload, 'reload_brain', return_value=(self.new, ['x.aiml'])) as reload_brain:
+            with self.pool.checkout('u1') as in_flight:
+                self.assertEqual(reloader.reload()['changed_files'], ['x.aiml'])
+                self.assertIs(in_flight._brain, self.old)
+                with self.pool.checkout('u2') as kernel:
+                    self.assertIs(kernel._brain, self.new)
+            with self.pool.checkout('u1') as kernel:
+                self.assertIs(kernel._brain, self.new)
+        # parsed in this process: no pool forked from a threaded server
+        self.assertEqual(reload_brain.call_args, mock.call(self.old, workers=1))
+        self.assertIsNone(self.cache.lookup(['key'], {}.get))
+
+    def test_unchanged_corpus_keeps_the_brain(self):
+        with mock.patch.object(brain_reload, 'reload_brain', return_value=(None, [])):
+            self.assertFalse(BrainReloader(self.pool, self.cache).reload()['reloaded'])
+        self.assertIs(self.pool.brain, self.old)
+        self.assertEqual(self.cache.lookup(['key'], {}.get), "cached")
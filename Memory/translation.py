@@ -0,0 +1,265 @@
+"""
+Translation Service
+===================
+
+Translation for the Urdu chat round trip behind a small backend
+interface (translate_batch(texts, src, dest) -> [str]):
+
+    - GoogleTranslateBackend: googletrans, one request per batch
+    - PhraseTableBackend: offline Urdu <-> English phrase table
+      (Memory/phrase_table.json) for tests, benchmarks and as the
+      fallback while the upstream is unavailable
+
+TranslationService puts a deadline on every backend call and a circuit
+breaker in front of the backend: after TRANSLATION_BREAKER_FAILURES
+failed or late calls in a row it stops calling it for
+TRANSLATION_BREAKER_RESET seconds and answers from the fallback backend,
+then lets one call through to probe the upstream. Upstream results go
+through the TranslationCache (see Memory/translation_cache.py); fallback
+results are not cached.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+PHRASE_TABLE = os.path.join(os.path.dirname(__file__), 'phrase_table.json')
+
+URDU_CHARACTERS = re.compile(r'[\u0600-\u06FF]')
+
+# Chat messages written in Urdu script only are translated
+URDU_MESSAGE = re.compile(r'^[\u0600-\u06FF\s]+$')
+
+# Joins a batch into one upstream request; translations keep line breaks
+BATCH_SEPARATOR = '\n'
+
+
+class TranslationBackend:
+    """Translates a batch of texts from src ('auto' to detect) to dest."""
+
+    name = 'backend'
+
+    def translate_batch(self, texts, src, dest):
+        raise NotImplementedError
+
+
+class GoogleTranslateBackend(TranslationBackend):
+    name = 'google'
+
+    def __init__(self, timeout=None):
+        import httpx
+        from googletrans import Translator
+        self._translator = Translator(timeout=httpx.Timeout(timeout) if timeout else None)
+
+    def translate_batch(self, texts, src, dest):
+        if len(texts) > 1 and not any(BATCH_SEPARATOR in text for text in texts):
+            joined = self._translator.translate(BATCH_SEPARATOR.join(texts), src=src, dest=dest).text
+            parts = joined.split(BATCH_SEPARATOR)
+            if len(parts) == len(texts):
+                return [part.strip() for part in parts]
+        # googletrans sends one request per text of a list
+        return [result.text for result in self._translator.translate(list(texts), src=src, dest=dest)]
+
+
+class PhraseTableBackend(TranslationBackend):
+    """
+    Offline stand-in: whole phrases first, then (Urdu to English only)
+    the longest known phrase at each position, unknown words kept as they
+    are. Replies it cannot translate whole stay in English.
+    """
+
+    name = 'phrase_table'
+
+    def __init__(self, path=PHRASE_TABLE):
+        with open(path, encoding='utf-8') as f:
+            urdu = json.load(f)['ur']
+        self.tables = {('ur', 'en'): {}, ('en', 'ur'): {}}
+        for phrase, english in urdu.items():
+            self.tables['ur', 'en'][self._normalize(phrase)] = english
+            self.tables['en', 'ur'].setdefault(self._normalize(english), phrase)
+        self.longest = {pair: max((len(phrase.split()) for phrase in table), default=0)
+                        for pair, table in self.tables.items()}
+
+    @staticmethod
+    def _normalize(text):
+        return ' '.join(re.sub(r'[.,!?؟۔،]', ' ', text.lower()).split())
+
+    def _translate(self, text, src, dest):
+        if src == 'auto':
+            src = 'ur' if URDU_CHARACTERS.search(text) else 'en'
+        table = self.tables.get((src, dest))
+        if table is None:
+            return text
+        normalized = self._normalize(text)
+        if normalized in table:
+            return table[normalized]
+        if src != 'ur':
+            return text
+        words, translated, i, known = normalized.split(), [], 0, False
+        while i < len(words):
+            for size in range(min(self.longest[src, dest], len(words) - i), 0, -1):
+                phrase = ' '.join(words[i:i + size])
+                if phrase in table:
+                    translated.append(table[phrase])
+                    known = True
+                    i += size
+                    break
+            else:
+                translated.append(words[i])
+                i += 1
+        return ' '.join(translated) if known else text
+
+    def translate_batch(self, texts, src, dest):
+        return [self._translate(text, src, dest) for text in texts]
+
+
+def create_backend(name, timeout=None):
+    """Backend for the TRANSLATION_BACKEND setting; the phrase table if googletrans is unavailable."""
+    if name == 'google':
+        try:
+            return GoogleTranslateBackend(timeout=timeout)
+        except ImportError as e:
+            print(f"googletrans unavailable, translating from the phrase table: {e}")
+    elif name != 'phrase_table':
+        raise ValueError(f"Unknown translation backend {name!r}")
+    return PhraseTableBackend()
+
+
+class TranslationService:
+    """Deadline, circuit breaker, batching and caching around a TranslationBackend."""
+
+    def __init__(self, backend, deadline=3.0, failure_threshold=3, reset_after=30.0, cache=None, fallback=None):
+        self.backend = backend
+        self.deadline = deadline
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.cache = cache
+        self.fallback = fallback
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='translate')
+        self._lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._probing = False
+        self.calls = 0
+        self.upstream_calls = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.short_circuited = 0
+        self.fallbacks = 0
+        self.breaker_opened = 0
+        self.last_error = None
+
+    def translate(self, text, dest, src='auto'):
+        return self.translate_many([text], dest, src)[0]
+
+    def translate_many(self, texts, dest, src='auto'):
+        """Translate texts in one backend call; cached texts are not sent again."""
+        texts = list(texts)
+        with self._lock:
+            self.calls += 1
+        results = [None] * len(texts)
+        if self.cache is not None:
+            results = [self.cache.get(text, src, dest) for text in texts]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if not missing:
+            return results
+
+        batch = [texts[i] for i in missing]
+        start = time.perf_counter()
+        translated = self._call_backend(batch, src, dest)
+        if translated is None:
+            translated = self._fall_back(batch, src, dest)
+        elif self.cache is not None:
+            seconds = (time.perf_counter() - start) / len(batch)
+            for text, translation in zip(batch, translated):
+                self.cache.put(text, src, dest, translation, seconds)
+        for i, translation in zip(missing, translated):
+            results[i] = translation
+        return results
+
+    def _allow_call(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if not self._probing and time.monotonic() - self._opened_at >= self.reset_after:
+                # half-open: one call probes the backend
+                self._probing = True
+                return True
+            self.short_circuited += 1
+            return False
+
+    def _record(self, error=None, timed_out=False):
+        with self._lock:
+            self._probing = False
+            if error is None:
+                self._consecutive_failures = 0
+                self._opened_at = None
+                return
+            self.failures += 1
+            self.timeouts += timed_out
+            self.last_error = {'error': error, 'at': time.strftime('%Y-%m-%d %H:%M:%S')}
+            self._consecutive_failures += 1
+            if self._opened_at is not None or self._consecutive_failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    self.breaker_opened += 1
+                    print(f"Translation backend {self.backend.name} failing, using the fallback for {self.reset_after}s: {error}")
+                self._opened_at = time.monotonic()
+
+    def _call_backend(self, texts, src, dest):
+        """Return the backend's translations, or None when it failed, ran late or is switched off."""
+        if not self._allow_call():
+            return None
+        with self._lock:
+            self.upstream_calls += 1
+        future = self._executor.submit(self.backend.translate_batch, texts, src, dest)
+        try:
+            translated = future.result(timeout=self.deadline)
+        except FutureTimeout:
+            self._record(f"no answer within {self.deadline}s", timed_out=True)
+            return None
+        except Exception as e:
+            self._record(f"{type(e).__name__}: {e}")
+            return None
+        if len(translated) != len(texts):
+            self._record(f"{len(translated)} translations for {len(texts)} texts")
+            return None
+        self._record()
+        return translated
+
+    def _fall_back(self, texts, src, dest):
+        with self._lock:
+            self.fallbacks += 1
+        if self.fallback is None:
+            return texts
+        try:
+            return self.fallback.translate_batch(texts, src, dest)
+        except Exception as e:
+            print(f"Translation fallback failed: {e}")
+            return texts
+
+    def breaker_state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            return 'half-open' if time.monotonic() - self._opened_at >= self.reset_after else 'open'
+
+    def stats(self):
+        state = self.breaker_state()
+        with self._lock:
+            return {
+                'backend': self.backend.name,
+                'fallback': self.fallback.name if self.fallback is not None else None,
+                'deadline': self.deadline,
+                'breaker': state,
+                'breaker_opened': self.breaker_opened,
+                'calls': self.calls,
+                'upstream_calls': self.upstream_calls,
+                'failures': self.failures,
+                'timeouts': self.timeouts,
+                'short_circuited': self.short_circuited,
+                'fallbacks': self.fallbacks,
+                'last_error': self.last_error,
+            }
@@ -0,0 +1,207 @@
+"""
+Translation Cache
+=================
+
+Two-level cache for the Urdu round trip of the chat view (message to
+English, reply back to Urdu), keyed by text, source and target language:
+
+    - an in-process LRU of recent translations
+    - a local SQLite store shared by the worker processes and kept
+      across restarts, with a TTL and a row limit (least recently used
+      rows are evicted)
+
+Hits do not write to the store: the keys they touch are remembered and
+their used_at is written in one batch with the next insert, or once
+TOUCH_EVERY keys are pending. Expired rows are left for the eviction
+pass, which runs with every EVICT_EVERY-th insert.
+
+Every entry remembers how long the upstream translation took, so hits
+are reported as saved latency. The SQLite connection is opened lazily in
+the process that uses it, never in a pre-fork master.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Inserts between two row-limit checks of the SQLite store
+EVICT_EVERY = 100
+
+# Touched keys held back before their used_at is written without an insert
+TOUCH_EVERY = 100
+
+
+class TranslationCache:
+    """Thread-safe LRU in front of a SQLite translation store."""
+
+    def __init__(self, path, max_entries=1024, max_rows=50000, ttl=30 * 86400):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._db_pid = None
+        self._inserts = 0
+        self._touched = {}
+        self.memory_hits = 0
+        self.store_hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.store_errors = 0
+        self.fetches = 0
+        self.saved_seconds = 0.0
+        self.upstream_seconds = 0.0
+
+    def _connection(self):
+        if self._db is None or self._db_pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute("""CREATE TABLE IF NOT EXISTS translations (
+                src TEXT NOT NULL, dest TEXT NOT NULL, text TEXT NOT NULL,
+                translation TEXT NOT NULL, seconds REAL NOT NULL,
+                created_at REAL NOT NULL, used_at REAL NOT NULL,
+                PRIMARY KEY (src, dest, text)) WITHOUT ROWID""")
+            db.execute("CREATE INDEX IF NOT EXISTS translations_used_at ON translations (used_at)")
+            db.commit()
+            self._db, self._db_pid = db, os.getpid()
+        return self._db
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _lookup_store(self, key, now):
+        src, dest, text = key
+        db = self._connection()
+        row = db.execute("SELECT translation, seconds, created_at FROM translations WHERE src = ? AND dest = ? AND text = ?",
+                         (src, dest, text)).fetchone()
+        if row is None:
+            return None
+        if now - row[2] > self.ttl:
+            self.expired += 1
+            return None
+        return row
+
+    def _touch(self, key, now):
+        self._touched[key] = now
+        if len(self._touched) >= TOUCH_EVERY:
+            try:
+                db = self._connection()
+                self._write_touched(db)
+                db.commit()
+            except sqlite3.Error as e:
+                print(f"Translation cache store unavailable: {e}")
+                self.store_errors += 1
+
+    def _write_touched(self, db):
+        if self._touched:
+            db.executemany("UPDATE translations SET used_at = ? WHERE src = ? AND dest = ? AND text = ?",
+                           [(used_at,) + key for key, used_at in self._touched.items()])
+            self._touched.clear()
+
+    def get(self, text, src, dest):
+        """Return the cached translation of text, or None."""
+        key = (src, dest, text.strip())
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now - entry[2] <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    self.saved_seconds += entry[1]
+                    self._touch(key, now)
+                    return entry[0]
+                del self._entries[key]
+                self.expired += 1
+            try:
+                entry = self._lookup_store(key, now)
+            except sqlite3.Error as e:
+                print(f"Translation cache store unavailable: {e}")
+                self.store_errors += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._remember(key, entry)
+            self.store_hits += 1
+            self.saved_seconds += entry[1]
+            self._touch(key, now)
+            return entry[0]
+
+    def put(self, text, src, dest, translation, seconds):
+        """Store translation, which took seconds to fetch upstream."""
+        key = (src, dest, text.strip())
+        now = time.time()
+        with self._lock:
+            self.fetches += 1
+            self.upstream_seconds += seconds
+            self._remember(key, (translation, seconds, now))
+            self._touched.pop(key, None)
+            try:
+                db = self._connection()
+                self._write_touched(db)
+                db.execute("INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?, ?, ?)",
+                           key + (translation, seconds, now, now))
+                self._inserts += 1
+                if self._inserts % EVICT_EVERY == 0:
+                    self._evict(db, now)
+                db.commit()
+            except sqlite3.Error as e:
+                print(f"Translation cache store unavailable: {e}")
+                self.store_errors += 1
+
+    def _evict(self, db, now):
+        deleted = db.execute("DELETE FROM translations WHERE created_at < ?", (now - self.ttl,)).rowcount
+        rows = db.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+        if rows > self.max_rows:
+            deleted += db.execute("""DELETE FROM translations WHERE (src, dest, text) IN (
+                SELECT src, dest, text FROM translations ORDER BY used_at LIMIT ?)""", (rows - self.max_rows,)).rowcount
+        self.evictions += deleted
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._touched.clear()
+            try:
+                db = self._connection()
+                db.execute("DELETE FROM translations")
+                db.commit()
+            except sqlite3.Error as e:
+                print(f"Translation cache store unavailable: {e}")
+                self.store_errors += 1
+
+    def stats(self):
+        with self._lock:
+            hits = self.memory_hits + self.store_hits
+            lookups = hits + self.misses
+            try:
+                rows = self._connection().execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+            except sqlite3.Error:
+                rows = None
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'store_rows': rows,
+                'max_rows': self.max_rows,
+                'ttl': self.ttl,
+                'memory_hits': self.memory_hits,
+                'store_hits': self.store_hits,
+                'misses': self.misses,
+                'hit_ratio': round(hits / lookups, 4) if lookups else 0.0,
+                'expired': self.expired,
+                'evictions': self.evictions,
+                'store_errors': self.store_errors,
+                'saved_seconds': round(self.saved_seconds, 3),
+                'fetches': self.fetches,
+                'upstream_seconds': round(self.upstream_seconds, 3),
+                'mean_upstream_ms': round(1000 * self.upstream_seconds / self.fetches, 1) if self.fetches else 0.0,
+            }
@@ -17,6 +17,9 @@ urlpatterns = [
     path('upload-profile-pic/', views.upload_profile_pic, name='upload-profile-pic'),
     path('upload-data', views.upload_data, name='upload-data'),
     path('prolog_handling', views.prolog_handling, name='prolog_handling'),
+    path('kernel_pool_status/', views.kernel_pool_status, name='kernel_pool_status'),
+    path('reload_brain/', views.reload_brain, name='reload_brain'),
+    path('aiml_profile/', views.aiml_profile, name='aiml_profile'),
     
     # WebAuthn Face ID/Touch ID routes
     path('webauthn/register/begin', views.webauthn_register_begin, name='webauthn_register_begin'),
@@ -0,0 +1,128 @@
+"""
+User Cache
+==========
+
+The logged-in user's Signups node, loaded once per request instead of by
+every step of it: chat() read it twice, then the chat history and the
+social network actions once more each.
+
+A node loaded for a request is kept on the request, so the rest of the
+request gets the same object. Across requests each process keeps it for
+USER_CACHE_TTL seconds in an LRU of USER_CACHE_SIZE users.
+
+The cached nodes are shared between requests and threads: read them,
+never change them. Code that changes a user loads the node itself with
+Signups.nodes and saves it; Signups.post_save() (see Memory/models.py)
+then invalidates the cached copy, whichever view did the save. The
+invalidation only reaches this process; other workers pick the change
+up when their copy expires.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from .models import Signups
+
+# Attribute of the HttpRequest holding the users loaded for it
+REQUEST_ATTRIBUTE = '_signups_cache'
+
+
+class UserCache:
+    """Thread-safe LRU of Signups nodes by uid with a TTL, in front of a per-request cache."""
+
+    def __init__(self, ttl=30.0, max_entries=1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.request_hits = 0
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.max_entries > 0
+
+    def get(self, request, uid):
+        """The Signups node of uid, or None if there is no such user."""
+        if not uid:
+            return None
+        loaded = getattr(request, REQUEST_ATTRIBUTE, None)
+        if loaded is None:
+            loaded = {}
+            setattr(request, REQUEST_ATTRIBUTE, loaded)
+        if uid in loaded:
+            with self._lock:
+                self.request_hits += 1
+            return loaded[uid]
+        user = self.lookup(uid)
+        if user is None:
+            user = Signups.nodes.first_or_none(uid=uid)
+            if user is not None:
+                self.store(uid, user)
+        loaded[uid] = user
+        return user
+
+    def lookup(self, uid):
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(uid)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires, user = entry
+            if expires <= now:
+                del self._entries[uid]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(uid)
+            self.hits += 1
+            return user
+
+    def store(self, uid, user):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[uid] = (time.monotonic() + self.ttl, user)
+            self._entries.move_to_end(uid)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, uid, request=None):
+        """Drop uid after a change to the user, from this process and from request if given."""
+        if request is not None:
+            getattr(request, REQUEST_ATTRIBUTE, {}).pop(uid, None)
+        with self._lock:
+            self._entries.pop(uid, None)
+            self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'request_hits': self.request_hits,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'expired': self.expired,
+                'invalidations': self.invalidations,
+                'evictions': self.evictions,
+            }
+
+
+user_cache = UserCache(ttl=settings.USER_CACHE_TTL, max_entries=settings.USER_CACHE_SIZE)
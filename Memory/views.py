@@ -1,5 +1,4 @@
 from django.http import HttpResponse ,JsonResponse,HttpResponseBadRequest
-from nltk.sentiment.vader import SentimentIntensityAnalyzer
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from Sensory_Memory.views import get_command
@@ -7,7 +6,7 @@ from django.shortcuts import render,redirect
 from django.contrib.auth import logout
 from datetime import datetime, date
 from django.contrib import messages
-from googletrans import Translator
+from django.conf import settings
 from Sensory_Memory.views import *
 from .Social_Network import *
 from .Update_Store import *
@@ -23,13 +22,48 @@ from .aiml import *
 from .nlp import *
 from .OTP import *
 from .webauthn_utils import WebAuthnUtils
+from .kernel_pool import KernelPool
+from .brain_reload import BrainReloader
+from .match_profiler import MatchProfiler
+from . import prefork
+from .predicate_actions import ChatTurn, predicate_action, triggered_action
+from .response_cache import ResponseCache
+from .respond_budget import RespondBudget, RespondBudgetExceeded
+from .sentiment import sentiment_service
+from .history_writer import HistoryWriter, turn_record
+from .repository import create_episode_turn, episode_name
+from .user_cache import user_cache
+from .translation import URDU_MESSAGE, PhraseTableBackend, TranslationService, create_backend
+from .translation_cache import TranslationCache
 from .gender_names_db import detect_gender_from_name
 from .detection_bridge import get_current_detections as bridge_get_detections
 import re
 
-kernel = init_kernel()
-translator = Translator()
-urdu_pattern = r'^[\u0600-\u06FF\s]+$'
+response_cache = ResponseCache(max_entries=settings.AIML_RESPONSE_CACHE_SIZE)
+match_profiler = MatchProfiler(enabled=settings.AIML_PROFILE)
+respond_budget = RespondBudget(max_srai_depth=settings.AIML_MAX_SRAI_DEPTH,
+                               max_evaluations=settings.AIML_MAX_EVALUATIONS,
+                               timeout=settings.AIML_RESPOND_TIMEOUT)
+kernel_pool = KernelPool(init_kernel(response_cache, match_profiler, respond_budget), size=settings.AIML_KERNEL_POOL_SIZE)
+brain_reloader = BrainReloader(kernel_pool, response_cache)
+if not prefork.in_master():
+    # a pre-fork master starts the watcher in each worker instead
+    brain_reloader.start_watcher(settings.AIML_RELOAD_INTERVAL)
+translation_cache = TranslationCache(settings.TRANSLATION_CACHE_PATH,
+                                     max_entries=settings.TRANSLATION_CACHE_SIZE,
+                                     max_rows=settings.TRANSLATION_CACHE_MAX_ROWS,
+                                     ttl=settings.TRANSLATION_CACHE_TTL)
+translator = TranslationService(create_backend(settings.TRANSLATION_BACKEND, timeout=settings.TRANSLATION_DEADLINE),
+                                deadline=settings.TRANSLATION_DEADLINE,
+                                failure_threshold=settings.TRANSLATION_BREAKER_FAILURES,
+                                reset_after=settings.TRANSLATION_BREAKER_RESET,
+                                cache=translation_cache,
+                                fallback=PhraseTableBackend())
+urdu_pattern = URDU_MESSAGE
+history_writer = HistoryWriter(max_queue=settings.HISTORY_QUEUE_SIZE,
+                               batch_size=settings.HISTORY_BATCH_SIZE,
+                               linger=settings.HISTORY_FLUSH_LINGER,
+                               enqueue_timeout=settings.HISTORY_ENQUEUE_TIMEOUT) if settings.HISTORY_WRITE_BEHIND else None
 
 
 def index(request):
@@ -111,6 +145,7 @@ def contact(request):
     return render(request,'contact-us.html')
 
 def signout(request):
+    kernel_pool.forget_session(request.session.get('user_id'))
     logout(request)
     request.session.flush()
     return redirect('index')
@@ -143,31 +178,11 @@ def contact(request):
 
 # =======================================================================================================
 def sentiment(text):
-    sia = SentimentIntensityAnalyzer()
-    scores = sia.polarity_scores(text)
-    
-    if scores['compound'] >= 0.05:
-        sentiments = 'Positive sentiments'
-    elif scores['compound'] <= -0.05:
-        sentiments = 'Negative sentiments'
-    else:
-        sentiments = 'Neutral sentiments'
-        
-    return sentiments
-
-def process_sentiment(text):
-    chat_data = re.sub(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2} - (User|Bot): ', '', text)
-    return chat_data
-
-def update_sentiment(text):
-    data = process_sentiment(text)
-    update = sentiment(data)
-    return update
-
+    return sentiment_service.label(text)
 
 def maintain_history(request, user, bot):
     user_id = request.session.get('user_id')
-    user_node = Signups.nodes.filter(uid=user_id).first()
+    user_node = user_cache.get(request, user_id)
     
     try:
         history_chat_node = History_Chat.nodes.filter(uid=user_id).first()
@@ -188,28 +203,31 @@ def maintain_history(request, user, bot):
             history_chat_node.history.connect(session_history_node)
 
     if session_history_node:
-        session_history_node.save_message("User", user)
-        session_history_node.save_message("Bot", bot)
-        data = '\n'.join(session_history_node.memory_list)
-        new_sent = update_sentiment(data)
-        print('-=======================================-0-90-8908-97-07-87-87870896-968709',new_sent)
-        session_history_node.overall_sentiments = new_sent
-        session_history_node.save()
+        # Only the new messages are scored; a session from before the running
+        # sums also gets its earlier messages scored, once
+        scored = session_history_node.sentiment_count or 0
+        unscored = session_history_node.messages(offset=scored, limit=None) \
+            if scored < session_history_node.transcript_length() else []
+        texts = [message.content for message in unscored] + [user, bot]
+        # One append of both messages, adding their scores to the sums, instead of rewriting the day's transcript
+        session_history_node.append_messages([("User", user), ("Bot", bot)], scores=sentiment_service.score_many(texts))
+
+
+def record_turn(request, user, bot, session):
+    """Persist a chat turn: queued for the history writer, or written now without one."""
+    if history_writer is not None:
+        history_writer.submit(turn_record(request.session.get('user_id'), user, bot))
+        return
+    maintain_history(request, user, bot)
+    extend_episode(request, user, bot, session)
 
 
 def extend_episode(request,user,bot,session):
-    today = datetime.now().strftime('%Y-%m-%d')
-    check = f"Episode - {today}"
-    obj_ep = Session_History.nodes.get(uid = session,name = check)
     try:
-        s1 = sentiment(bot)
-        s2 = sentiment(user)
-        user_obj = Episode_Part(uid = session,name='Bot',response=bot,sentiments=s1).save()
-        bot_bot = Episode_Part(uid = session,name='User',response=user,sentiments=s2).save()
-        user_obj.relation.connect(obj_ep)
-        bot_bot.relation.connect(obj_ep)
-    except:
-        print('Error')
+        if not create_episode_turn(session, episode_name(), user, bot):
+            print(f"No episode for {session} today, turn not added")
+    except Exception as e:
+        print(f"Episode turn not saved: {e}")
 
 def get_relationship_graph_data(name, relation, session):
     """Get graph data for relationship visualization"""
@@ -274,259 +292,296 @@ def get_relationship_graph_data(name, relation, session):
 
 # ========================================================================================================
 
+def reply(turn, bot_response):
+    """Finish an action turn with bot_response (drone actions skip the chat history)."""
+    bot_response = process_dynamic_response(bot_response, turn.request.session.get('user_id', 'default'))
+    return JsonResponse({'bot_response': bot_response})
+
+
+# clear=True: reset the predicates immediately to prevent persistence
+@predicate_action("namex", "relationx", clear=True)
+def relationship_action(turn):
+    request, message, session = turn.request, turn.message, turn.session
+    name = turn.changed["namex"].lower()
+    relation = turn.changed["relationx"].lower()
+
+    params = {"name": name,"relation": relation}
+    cypher_query = f"""
+        MATCH (p:Person {{full_name: $name}})
+        MATCH (p)<-[r:`{relation}`]-(other)
+        RETURN other.full_name; """
+    results, meta = db.cypher_query(cypher_query, params)
+
+    # Get graph data for visualization only if we have results
+    graph_data = None
+    if results:
+        graph_data = get_relationship_graph_data(name, relation, session)
+
+    if results:
+        formatted_names = []
+        for result in results:
+            other_name = result[0]
+            formatted_names.append(other_name)
+        if len(formatted_names) == 1:
+            name_str = formatted_names[0]
+        elif len(formatted_names) == 2:
+            name_str = f"{formatted_names[0]} and {formatted_names[1]}"
+        else:
+            name_str = ', '.join(formatted_names[:-1]) + f", and {formatted_names[-1]}"
+
+        if name_str != '':
+            # Fill the relationship template from the first match, no second respond()
+            bot_response = turn.finish(namey=name_str.capitalize())
+            
+            # Return response with graph data only if relationships exist
+            bot_response = process_dynamic_response(bot_response, request.session.get('user_id', 'default'))
+            record_turn(request, message, bot_response, session)
+            return JsonResponse({
+                'bot_response': bot_response,
+                'graph_data': graph_data
+            })
+        bot_response = turn.finish()
+    else:
+        turn.finish()  # clear the unbound slot from the <that> history
+        bot_response = 'No knowledge Found in knowledgebase according to your Query.'
+        
+    # Return without graph data when no relationships found
+    bot_response = process_dynamic_response(bot_response, request.session.get('user_id', 'default'))
+    record_turn(request, message, bot_response, session)
+    return JsonResponse({
+        'bot_response': bot_response
+    })
+
+
+@predicate_action("person_sn", "relation_sn")
+def social_network_action(turn):
+    session = turn.session
+    person_sn = turn.changed["person_sn"]
+    relation_sn = turn.changed["relation_sn"]
+    # Detect gender from person name using names database
+    gender = detect_gender_from_name(person_sn)
+
+    # the last reply may still be queued for the history writer: read it back written
+    if history_writer is not None:
+        history_writer.flush(session)
+    session_history_data = Session_History.nodes.first_or_none(name=episode_name(), uid=session)
+    name = get_last_bot_response(session_history_data) if session_history_data is not None else ""
+    if not name:
+        # no "Do you know ...?" reply today to take the name from
+        return None
+    top = user_cache.get(turn.request, session)
+    email1 = top.email
+
+    # Detect gender from name using names database
+    gen = detect_gender_from_name(name)
+
+    params = {"name": name,"relation_sn": relation_sn,"email1":email1,"session":session}
+
+    if params:
+        cypher_query = f"""
+            MATCH (p:Signups {{email:$email1}})
+            CREATE (s:SocialNetwork {{name:$name,uid:$session}})
+            CREATE (p)<-[r:`is_{relation_sn}`]-(s)
+            RETURN r; """ 
+        results, meta = db.cypher_query(cypher_query, params)
+    # carry on with the normal reply
+
+
+# Execute take-off only once and then clear the flag so it
+# won't block MOVE commands that follow.
+@predicate_action("takeoff", clear=True)
+def takeoff_action(turn):
+    get_command(turn.message, turn.session)
+    takeoff_result = Tello_Takeoff()
+    
+    # If takeoff returns a battery warning, use that as the response
+    bot_response = turn.bot_response
+    if takeoff_result and "Battery too low" in takeoff_result:
+        bot_response = takeoff_result
+    return reply(turn, bot_response)
+
+
+@predicate_action("turnon", "sec", match='any', clear=True)
+def warmup_action(turn):
+    get_command(turn.message, turn.session)
+    warmup_result = None
+    if turn.changed.get("sec"):
+        warmup_result = warmup(turn.changed["sec"])
+    else:
+        warmup_result = warmup(None)
+    
+    # If warmup returns a battery warning or other message, use that as the response
+    bot_response = turn.bot_response
+    if warmup_result and ("Battery too low" in warmup_result or "Already airborne" in warmup_result or "completed successfully" in warmup_result):
+        bot_response = warmup_result
+    return reply(turn, bot_response)
+
+
+@predicate_action("land", clear=True)
+def land_action(turn):
+    get_command(turn.message, turn.session)
+    land_result = Tello_Land()
+    
+    # If landing returns a status message, use that as the response
+    return reply(turn, land_result or turn.bot_response)
+
+
+def move_action(predicate, move):
+    """Build the handler for one of the move<direction> predicates."""
+    def action(turn):
+        get_command(turn.message, turn.session)
+        move_result = move(turn.changed[predicate])
+        return reply(turn, move_result or turn.bot_response)
+    action.__name__ = f"{predicate}_action"
+    return predicate_action(predicate, clear=True)(action)
+
+
+for _predicate, _move in (("moveforward", Move_Forward), ("movebackward", Move_Backward),
+                          ("moveleft", Move_Left), ("moveright", Move_Right)):
+    move_action(_predicate, _move)
+
+
+HELP_RESPONSE = "I'm here to help! You can ask me about what I can see, check my sensors, or chat about various topics. Try asking 'what can you see' or 'battery status'."
+
+
+def chat_turn(request, message, session, current_user):
+    """
+    Answer one chat message. A pooled kernel is only checked out to match
+    and bind the response; translation, Cypher and drone calls run with
+    the kernel back in the pool.
+    """
+    is_urdu = re.match(urdu_pattern, message)
+    english = translator.translate(message, dest='en') if is_urdu else message
+    action = None
+    with kernel_pool.checkout(session) as kernel:
+        kernel.setPredicate('name', current_user.username)
+        kernel.setPredicate('gender', current_user.gender)
+        # Process the message once; 'namey' stays unbound until the relationship lookup
+        try:
+            deferred = kernel.respond_deferred(english, slots=('namey',))
+        except RespondBudgetExceeded as e:
+            # A runaway <srai> chain: give up on it rather than hold the worker
+            print(e)
+            deferred = None
+        else:
+            # Only the predicates this response set can trigger an action
+            changed = kernel.changed_predicates()
+            action = triggered_action(changed)
+            if action is None:
+                text = deferred.bind()
+            else:
+                for name in action[1]:
+                    kernel.setPredicate(name, "")
+    if deferred is None:
+        return finish_turn(request, message, HELP_RESPONSE, session)
+
+    def finish_response(**slots):
+        with kernel_pool.checkout(session) as kernel:
+            deferred.kernel = kernel
+            text = deferred.bind(**slots)
+        if is_urdu:
+            text = translator.translate(text, dest='ur')
+        return text
+
+    if action is None:
+        bot_response = translator.translate(text, dest='ur') if is_urdu else text
+    else:
+        turn = ChatTurn(request, message, session, current_user, changed, finish_response)
+        response = action[0](turn)
+        if response is not None:
+            return response
+        bot_response = turn.bot_response
+
+    default_message = "I'm sorry, I didn't understand what you said."
+    if bot_response == default_message or default_message in bot_response or bot_response.endswith("I didn't understand what you said.") or bot_response=='' or bot_response=='I do not understand. What is your occupation?':
+        chk = search_ip(request,current_user.email)
+        if chk:
+            bot_response = chk
+        else:
+            bot_response = HELP_RESPONSE
+    return finish_turn(request, message, bot_response, session)
+
+
+def finish_turn(request, message, bot_response, session):
+    """Fill in dynamic placeholders, record the exchange and send the reply."""
+    bot_response = process_dynamic_response(bot_response, request.session.get('user_id', 'default'))
+    record_turn(request, message, bot_response, session)
+    return JsonResponse({'bot_response': bot_response})
+
+
 def chat(request):    
     session = request.session.get('user_id')
+    if not session:
+        messages.error(request, 'You must log in to access the chat.')
+        return redirect('index')
     try:
-        current_user = Signups.nodes.filter(uid = session).first()
+        # loaded once for the whole turn, see Memory/user_cache.py
+        current_user = user_cache.get(request, session)
     except:
         return redirect('login')
-    Session_History.nodes.filter(uid = session)
-    try:
-        if session:
-            user = Signups.nodes.filter(uid=session).get()
-        else:
-            messages.error(request, 'You must log in to access the chat.')
-            return redirect('index')
-    except:
+    if current_user is None:
         messages.error(request, 'An error occurred. Please try again.')
         return redirect('index')
+    user = current_user
 
     if request.method == 'POST':
         message = request.POST.get('message', '')
-        kernel.setPredicate('name',user.username)
-        kernel.setPredicate('gender',user.gender)
         if message:
-            # Clear any lingering relationship predicates BEFORE processing
-            kernel.setPredicate("namex", "")
-            kernel.setPredicate("relationx", "")
-            kernel.setPredicate("namey", "")
-            
-            # Process the message once
-            if  re.match(urdu_pattern, message):
-                english = translator.translate(message).text
-                bot_response = kernel.respond(english)
-                bot_response = translator.translate(bot_response, dest='ur').text
-            else:
-                bot_response = kernel.respond(message)
-                
-            print("Predicates:",
-                    kernel.getPredicate("moveforward"),
-                    kernel.getPredicate("movebackward"),
-                    kernel.getPredicate("moveleft"),
-                    kernel.getPredicate("moveright"))
-            
-            # Debug: Print all relationship predicates
-            print("Relationship predicates after initial processing:",
-                  "namex:", kernel.getPredicate("namex"),
-                  "relationx:", kernel.getPredicate("relationx"),
-                  "namey:", kernel.getPredicate("namey"))
-
-            if kernel.getPredicate("namex") and kernel.getPredicate("relationx"):
-                print("Processing relationship query:", kernel.getPredicate("namex"), kernel.getPredicate("relationx"))
-                name = kernel.getPredicate("namex").lower()
-                relation = kernel.getPredicate("relationx").lower()
-
-                # Clear the predicates immediately to prevent persistence
-                kernel.setPredicate("namex", "")
-                kernel.setPredicate("relationx", "")
-
-                params = {"name": name,"relation": relation}
-                cypher_query = f"""
-                    MATCH (p:Person {{full_name: $name}})
-                    MATCH (p)<-[r:`{relation}`]-(other)
-                    RETURN other.full_name; """
-                results, meta = db.cypher_query(cypher_query, params)
-
-                # Get graph data for visualization only if we have results
-                graph_data = None
-                if results:
-                    graph_data = get_relationship_graph_data(name, relation, session)
-
-                if results:
-                    formatted_names = []
-                    for result in results:
-                        other_name = result[0]
-                        formatted_names.append(other_name)
-                    if len(formatted_names) == 1:
-                        name_str = formatted_names[0]
-                    elif len(formatted_names) == 2:
-                        name_str = f"{formatted_names[0]} and {formatted_names[1]}"
-                    else:
-                        name_str = ', '.join(formatted_names[:-1]) + f", and {formatted_names[-1]}"
-
-                    if name_str != '':
-                        kernel.setPredicate('namey',name_str.capitalize())
-                        # Generate final response with the relationship data
-                        bot_response = kernel.respond(message)
-                        
-                        # Clear namey predicate after use
-                        kernel.setPredicate('namey', '')
-                        
-                        # Return response with graph data only if relationships exist
-                        bot_response = process_dynamic_response(bot_response, request.session.get('user_id', 'default'))
-                        maintain_history(request, message, bot_response)
-                        extend_episode(request,message,bot_response,session)
-                        return JsonResponse({
-                            'bot_response': bot_response,
-                            'graph_data': graph_data
-                        })
-                else:
-                    bot_response = 'No knowledge Found in knowledgebase according to your Query.'
-                    
-                # Return without graph data when no relationships found
-                bot_response = process_dynamic_response(bot_response, request.session.get('user_id', 'default'))
-                maintain_history(request, message, bot_response)
-                extend_episode(request,message,bot_response,session)
-                return JsonResponse({
-                    'bot_response': bot_response
-                })
-
-            elif kernel.getPredicate("person_sn") and kernel.getPredicate("relation_sn"):
-                person_sn = kernel.getPredicate("person_sn")
-                relation_sn = kernel.getPredicate("relation_sn")
-                # Detect gender from person name using names database
-                gender = detect_gender_from_name(person_sn)
-
-                today_date = datetime.now().strftime('%Y-%m-%d')
-                chk_date = f"Episode - {today_date}"
-                session_history_data = Session_History.nodes.get(name=chk_date,uid=session)
-
-                last_two_bot_responses = get_last_bot_response(session_history_data)
-                name = get_last_bot_response(session_history_data)
-                top = Signups.nodes.get(uid=session)
-                email1 = top.email
-
-                # Detect gender from name using names database
-                gen = detect_gender_from_name(name)
-
-                params = {"name": name,"relation_sn": relation_sn,"email1":email1,"session":session}
-
-                print(params)
-                if params:
-                    print('Access')
-                    cypher_query = f"""
-                        MATCH (p:Signups {{email:$email1}})
-                        CREATE (s:SocialNetwork {{name:$name,uid:$session}})
-                        CREATE (p)<-[r:`is_{relation_sn}`]-(s)
-                        RETURN r; """ 
-                    results, meta = db.cypher_query(cypher_query, params)
-
-                    print(results,meta)
-
-            elif kernel.getPredicate("takeoff"):
-                # Execute take-off only once and then clear the flag so it
-                # won't block MOVE commands that follow.
-                get_command(message, session)
-                takeoff_result = Tello_Takeoff()
-                kernel.setPredicate("takeoff", "")
-                
-                # If takeoff returns a battery warning, use that as the response
-                if takeoff_result and "Battery too low" in takeoff_result:
-                    bot_response = takeoff_result
-                
-                bot_response = process_dynamic_response(bot_response, request.session.get('user_id', 'default'))
-                return JsonResponse({'bot_response': bot_response})
-
-
-            elif kernel.getPredicate("turnon") or kernel.getPredicate("sec"):
-                get_command(message, session)
-                warmup_result = None
-                if kernel.getPredicate("sec"):
-                    val = kernel.getPredicate("sec")
-                    warmup_result = warmup(val)
-                    kernel.setPredicate("sec", "")
-                else:
-                    warmup_result = warmup(None)
-                kernel.setPredicate("turnon", "")
-                
-                # If warmup returns a battery warning or other message, use that as the response
-                if warmup_result and ("Battery too low" in warmup_result or "Already airborne" in warmup_result or "completed successfully" in warmup_result):
-                    bot_response = warmup_result
-                
-                bot_response = process_dynamic_response(bot_response, request.session.get('user_id', 'default'))
-                return JsonResponse({'bot_response': bot_response})
-
-
-
+            # the whole turn is serialized per session, see Memory/kernel_pool.py
+            with kernel_pool.session(session):
+                return chat_turn(request, message, session, current_user)
 
-        
-            elif kernel.getPredicate("land"):
-                get_command(message, session)
-                land_result = Tello_Land()
-                kernel.setPredicate("land", "")
-                
-                # If landing returns a status message, use that as the response
-                if land_result:
-                    bot_response = land_result
-                
-                bot_response = process_dynamic_response(bot_response, request.session.get('user_id', 'default'))
-                return JsonResponse({'bot_response': bot_response})
+    return render(request, 'chat_new.html',{'current_user':current_user})
 
+def kernel_pool_status(request):
+    """Report AIML kernel pool contention, response cache hit ratio, respond budget overruns, translation, sentiment, history writer and user cache health."""
+    if not aiml_admin_allowed(request):
+        return JsonResponse({'status': 'error', 'message': 'Not allowed'}, status=403)
+    return JsonResponse({
+        'status': 'success',
+        'kernel_pool': kernel_pool.stats(),
+        'response_cache': response_cache.stats(),
+        'brain_reload': brain_reloader.stats(),
+        'respond_budget': respond_budget.stats(),
+        'translation_cache': translation_cache.stats(),
+        'translation': translator.stats(),
+        'sentiment': sentiment_service.stats(),
+        'history_writer': history_writer.stats() if history_writer is not None else None,
+        'user_cache': user_cache.stats()
+    })
+
+def aiml_admin_allowed(request):
+    """AIML admin endpoints need AIML_ADMIN_TOKEN in X-Admin-Token, or a localhost client when it is unset."""
+    token = settings.AIML_ADMIN_TOKEN
+    if token:
+        return request.headers.get('X-Admin-Token') == token
+    return request.META.get('REMOTE_ADDR') in ('127.0.0.1', '::1')
 
-            elif kernel.getPredicate("moveforward"):
-                get_command(message, session)
-                value = kernel.getPredicate("moveforward")
-                move_result = Move_Forward(value)
-                kernel.setPredicate("moveforward", "")
-                
-                if move_result:
-                    bot_response = move_result
-                
-                bot_response = process_dynamic_response(bot_response, request.session.get('user_id', 'default'))
-                return JsonResponse({'bot_response': bot_response})
-
-            elif kernel.getPredicate("movebackward"):
-                get_command(message, session)
-                value = kernel.getPredicate("movebackward")
-                move_result = Move_Backward(value)
-                kernel.setPredicate("movebackward", "")
-                
-                if move_result:
-                    bot_response = move_result
-                
-                bot_response = process_dynamic_response(bot_response, request.session.get('user_id', 'default'))
-                return JsonResponse({'bot_response': bot_response})
-
-            elif kernel.getPredicate("moveleft"):
-                get_command(message, session)
-                value = kernel.getPredicate("moveleft")
-                move_result = Move_Left(value)
-                kernel.setPredicate("moveleft", "")
-                
-                if move_result:
-                    bot_response = move_result
-                
-                bot_response = process_dynamic_response(bot_response, request.session.get('user_id', 'default'))
-                return JsonResponse({'bot_response': bot_response})
-
-            elif kernel.getPredicate("moveright"):
-                get_command(message, session)
-                value = kernel.getPredicate("moveright")
-                move_result = Move_Right(value)
-                kernel.setPredicate("moveright", "")
-                
-                if move_result:
-                    bot_response = move_result
-                
-                bot_response = process_dynamic_response(bot_response, request.session.get('user_id', 'default'))
-                return JsonResponse({'bot_response': bot_response})
-
-            default_message = "I'm sorry, I didn't understand what you said."
-            if bot_response == default_message or default_message in bot_response or bot_response.endswith("I didn't understand what you said.") or bot_response=='' or bot_response=='I do not understand. What is your occupation?':
-                chk = search_ip(request,current_user.email)
-                print('shkcgsdg',chk)
-                if chk:
-                    print('hgjkHJ')
-                    bot_response = chk
-                else:
-                    bot_response = "I'm here to help! You can ask me about what I can see, check my sensors, or chat about various topics. Try asking 'what can you see' or 'battery status'."
-            
-            bot_response = process_dynamic_response(bot_response, request.session.get('user_id', 'default'))
-            maintain_history(request, message, bot_response)
-            extend_episode(request,message,bot_response,session)
-            return JsonResponse({'bot_response': bot_response})
+@csrf_exempt
+@require_POST
+def reload_brain(request):
+    """Relearn the edited Data/*.aiml files and swap the new brain in without a restart."""
+    if not aiml_admin_allowed(request):
+        return JsonResponse({'status': 'error', 'message': 'Not allowed'}, status=403)
+    try:
+        result = brain_reloader.reload()
+    except Exception as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
+    return JsonResponse({'status': 'success', **result})
 
-    return render(request, 'chat_new.html',{'current_user':current_user})
+@csrf_exempt
+def aiml_profile(request):
+    """Top AIML categories by respond() time (GET), or reset the profile (POST)."""
+    if not aiml_admin_allowed(request):
+        return JsonResponse({'status': 'error', 'message': 'Not allowed'}, status=403)
+    if request.method == 'POST':
+        match_profiler.reset()
+        return JsonResponse({'status': 'success', 'message': 'Profile reset'})
+    try:
+        top = int(request.GET.get('top', 20))
+    except ValueError:
+        top = 20
+    return JsonResponse({'status': 'success', **match_profiler.report(top)})
 
 @csrf_exempt
 def prolog_handling(request):
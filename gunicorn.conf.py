@@ -0,0 +1,38 @@
+"""
+Gunicorn configuration for serving LouBot with pre-forked workers:
+
+    gunicorn -c gunicorn.conf.py
+
+The master loads the AIML brain, YOLO config and VADER lexicon once and
+the workers share them copy-on-write (see Memory/prefork.py). Check the
+per-worker memory with `python manage.py prefork_memory`.
+"""
+
+import os
+
+wsgi_app = 'LouBot.wsgi:application'
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', 2))
+
+# Threads per worker share the worker's AIML kernel pool (AIML_KERNEL_POOL_SIZE)
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+
+preload_app = True
+pidfile = os.environ.get('GUNICORN_PIDFILE', '/tmp/loubot-gunicorn.pid')
+
+
+def when_ready(server):
+    from Memory import prefork
+    prefork.warm()
+
+
+def pre_fork(server, worker):
+    from Memory import prefork
+    prefork.freeze()
+
+
+def post_fork(server, worker):
+    from Memory import prefork
+    prefork.after_fork()